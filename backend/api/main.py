@@ -1,14 +1,55 @@
 """
 API principal FastAPI
 """
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from api.routes import usuario, producto, investigacion, resultados, llm
+from api.routes import usuario, producto, investigacion, resultados, llm, cluster
+from core.cluster import close_task_queue
+from core.http_pool import close_all_sessions, aclose_all_clients
+from core.llm_logger import stop_llm_logger
+from core.health_monitor import start_health_monitor, stop_health_monitor
+from core.job_scheduler import stop_job_scheduler
+from core.job_store import close_job_store
+from core.llm_client import LLMClient
+from config import JOB_CONFIG, LLAMA_CONFIG
+
+
+def _preload_default_model() -> None:
+    """Carga el modelo de Ollama configurado (en un hilo: no retrasa el arranque de la API)."""
+    result = LLMClient(provider="llama", config={**LLAMA_CONFIG, "provider": "ollama"}).preload_model()
+    if result.get("status") == "error":
+        print(f"[WARN] {result.get('message')}")
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Arranque/apagado de recursos compartidos del proceso."""
+    # Estado de los proveedores LLM sondeado en segundo plano (GET /api/llm/status lo lee de memoria)
+    start_health_monitor()
+    if LLAMA_CONFIG.get("preload_on_startup") and str(LLAMA_CONFIG.get("provider") or "ollama").lower() == "ollama":
+        threading.Thread(target=_preload_default_model, name="ollama-preload", daemon=True).start()
+    yield
+    # Apagado ordenado: no despachar más jobs y esperar (con tope) a los que están en ejecución
+    await asyncio.to_thread(investigacion.drain_jobs, float(JOB_CONFIG.get("drain_timeout_s") or 0))
+    stop_job_scheduler()
+    close_job_store()
+    close_task_queue()
+    await stop_health_monitor()
+    # Cerrar conexiones keep-alive del pool de LLMClient
+    close_all_sessions()
+    await aclose_all_clients()
+    # Escribir los registros pendientes del log de respuestas LLM
+    stop_llm_logger()
+
 
 app = FastAPI(
     title="API de Usuarios Sintéticos",
     description="API para gestionar usuarios sintéticos y ejecutar investigaciones",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS - Permitir requests desde el frontend
@@ -26,6 +67,7 @@ app.include_router(producto.router)
 app.include_router(investigacion.router)
 app.include_router(resultados.router)
 app.include_router(llm.router)
+app.include_router(cluster.router)
 
 
 @app.get("/")
@@ -39,6 +81,6 @@ def read_root():
 
 
 @app.get("/health")
-def health_check():
-    """Endpoint de health check"""
+async def health_check():
+    """Endpoint de health check (en el event loop: no espera a que haya hilos libres)"""
     return {"status": "healthy"}
@@ -0,0 +1,82 @@
+"""
+Endpoints del coordinador para los nodos worker (protocolo de core/cluster.py)
+"""
+import hmac
+from fastapi import APIRouter, Header, HTTPException
+from pydantic import BaseModel
+from typing import Dict, Any, Optional
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from config import CLUSTER_CONFIG
+from core.cluster import get_task_queue
+
+router = APIRouter(prefix="/api/cluster", tags=["cluster"])
+
+
+def _check_token(x_cluster_token: Optional[str]) -> None:
+    token = CLUSTER_CONFIG.get("token") or ""
+    if token and not hmac.compare_digest(token, x_cluster_token or ""):
+        raise HTTPException(status_code=401, detail="X-Cluster-Token no válido")
+
+
+class LeaseRequest(BaseModel):
+    worker_id: str
+
+
+class HeartbeatRequest(BaseModel):
+    worker_id: str
+
+
+class ResultRequest(BaseModel):
+    worker_id: str
+    # {unidad: salida} del respondiente ("perfil" y el id de cada step)
+    units: Optional[Dict[str, Any]] = None
+    # Si la tarea falló en el nodo (unidad sin éxito tras los reintentos)
+    error: Optional[str] = None
+
+
+@router.post("/lease")
+def lease_task(request: LeaseRequest, x_cluster_token: Optional[str] = Header(None)):
+    """
+    Asigna al nodo la siguiente tarea pendiente (o la de un nodo caído).
+    Debe renovar el lease con /heartbeat cada `heartbeat_s` segundos.
+    """
+    _check_token(x_cluster_token)
+    tasks = get_task_queue()
+    task = tasks.lease(request.worker_id.strip()[:128])
+    return {
+        "status": "success",
+        "task": task,
+        "lease_s": tasks.lease_s,
+        # Heartbeats frecuentes: el nodo se entera pronto si el job se cancela
+        "heartbeat_s": max(0.5, min(5.0, tasks.lease_s / 3)),
+    }
+
+
+@router.post("/tasks/{task_id}/heartbeat")
+def heartbeat_task(task_id: str, request: HeartbeatRequest, x_cluster_token: Optional[str] = Header(None)):
+    """Renueva el lease. 409 si el nodo ya no tiene la tarea: debe abandonarla."""
+    _check_token(x_cluster_token)
+    if not get_task_queue().heartbeat(task_id, request.worker_id):
+        raise HTTPException(status_code=409, detail="La tarea ya no está asignada a este nodo (cancelada o reasignada)")
+    return {"status": "success", "task_id": task_id}
+
+
+@router.post("/tasks/{task_id}/result")
+def upload_result(task_id: str, request: ResultRequest, x_cluster_token: Optional[str] = Header(None)):
+    """Resultado de la tarea; el coordinador guarda las unidades en el directorio del run."""
+    _check_token(x_cluster_token)
+    if request.error is None and not request.units:
+        raise HTTPException(status_code=400, detail="Falta `units` o `error`")
+    if not get_task_queue().finish(task_id, request.worker_id, result={"units": request.units} if request.units else None,
+                                   error=request.error):
+        raise HTTPException(status_code=409, detail="La tarea ya no está asignada a este nodo (cancelada o reasignada)")
+    return {"status": "success", "task_id": task_id}
+
+
+@router.get("/status")
+def cluster_status(x_cluster_token: Optional[str] = Header(None)):
+    """Tareas por estado y nodos con tareas asignadas."""
+    _check_token(x_cluster_token)
+    return {"status": "success", "mode": CLUSTER_CONFIG.get("mode"), **get_task_queue().stats()}
@@ -1,24 +1,27 @@
 """
 Endpoints para gestión de investigaciones/entrevistas
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+import asyncio
 import json
 from datetime import datetime
 from pathlib import Path
 import time
 import threading
-import uuid
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent.parent))
-from config import STORAGE_DIR
+from config import JOB_CONFIG, STORAGE_DIR
+from core.job_scheduler import QueueFullError, get_job_scheduler
+from core.job_store import ACTIVE_STATUSES, RESUMABLE_STATUSES, CancelFlag, get_job_store, queue_position_event
 from core.multi_research_engine import MultiResearchEngine
 from core.llm_client import LLMClient
 from core.models import UsuarioConfigV2
 from core.planner import build_plan
+from core.run_manifest import RunManifest, list_incomplete_runs, load_run_inputs, new_run_id
 from pydantic import ValidationError
 
 router = APIRouter(prefix="/api/investigacion", tags=["investigacion"])
@@ -27,40 +30,25 @@ router = APIRouter(prefix="/api/investigacion", tags=["investigacion"])
 # Job runner (cancelable)
 # -------------------------
 
-_JOBS_LOCK = threading.Lock()
-_JOBS: Dict[str, Dict[str, Any]] = {}
+# Registro de jobs (SQLite por defecto, compartido entre workers; ver core/job_store.py).
+# Cada proceso guarda además el CancelFlag de los jobs que ejecuta él.
+_CANCEL_FLAGS_LOCK = threading.Lock()
+_CANCEL_FLAGS: Dict[str, CancelFlag] = {}
 
+# JOB_EXECUTION_MODE=worker: la API sólo encola en el registro y los jobs los ejecuta
+# `python worker.py` (ver backend/worker.py). Requiere el registro SQLite compartido.
+WORKER_MODE = JOB_CONFIG.get("execution") == "worker"
+if WORKER_MODE and JOB_CONFIG.get("store") == "memory":
+    print("[WARN] JOB_EXECUTION_MODE=worker requiere JOB_STORE=sqlite: los jobs se ejecutan en la API")
+    WORKER_MODE = False
 
-def _job_get(run_id: str) -> Optional[Dict[str, Any]]:
-    with _JOBS_LOCK:
-        return _JOBS.get(run_id)
 
+def _job_append_event(run_id: str, ev: Dict[str, Any]) -> None:
+    get_job_store().append_event(run_id, ev)
 
-def _job_put(run_id: str, job: Dict[str, Any]) -> None:
-    with _JOBS_LOCK:
-        _JOBS[run_id] = job
-        # Best-effort cleanup: keep last 20 jobs
-        if len(_JOBS) > 20:
-            # remove oldest by created_at
-            items = sorted(_JOBS.items(), key=lambda kv: kv[1].get("created_at") or "")
-            for rid, _ in items[:-20]:
-                _JOBS.pop(rid, None)
 
-
-def _job_append_event(job: Dict[str, Any], ev: Dict[str, Any]) -> None:
-    if not isinstance(job, dict):
-        return
-    lock = job.get("lock")
-    if lock is None:
-        # create if missing
-        lock = threading.Lock()
-        job["lock"] = lock
-    with lock:
-        events = job.get("events")
-        if not isinstance(events, list):
-            events = []
-            job["events"] = events
-        events.append(ev)
+def _job_set_status(run_id: str, status: str) -> None:
+    get_job_store().update(run_id, status=status)
 
 
 def _load_latest_configs() -> tuple[UsuarioConfigV2, Dict[str, Any], Dict[str, Any], str, str, str, str]:
@@ -152,6 +140,9 @@ def _build_llm_client(system_config_dict: Dict[str, Any]) -> LLMClient:
         "provider": normalized_provider,
         "temperature": system_config_dict.get("temperatura", 0.7),
         "max_tokens": system_config_dict.get("max_tokens", 8000),
+        # Reproducibilidad / caché de respuestas (ver core/llm_cache.py)
+        "seed": system_config_dict.get("llm_seed"),
+        "cache_bypass": bool(system_config_dict.get("llm_cache_bypass")),
     }
     if normalized_provider == "anythingllm":
         workspace_slug = system_config_dict.get("anythingllm_workspace_slug")
@@ -176,81 +167,127 @@ def _build_llm_client(system_config_dict: Dict[str, Any]) -> LLMClient:
     return LLMClient(provider="llama", config=llm_config)
 
 
-def _run_job(run_id: str, system_config_dict: Dict[str, Any]) -> None:
-    job = _job_get(run_id)
-    if not job:
-        return
-    cancel_event: threading.Event = job["cancel_event"]
+def _public_system_config(system_config_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """System config sin secretos, para guardarlo en el manifiesto del run."""
+    return {k: v for k, v in system_config_dict.items() if not k.endswith("api_key")}
 
-    def cancelled() -> bool:
-        return bool(cancel_event.is_set())
 
+def run_job(run_id: str, system_config_dict: Dict[str, Any], resume: bool = False) -> None:
+    """Ejecuta un job ya registrado (en un hilo del planificador o de un proceso worker)."""
+    store = get_job_store()
+    if store.get(run_id) is None:
+        return
+    cancelled = CancelFlag(store, run_id)
+    # Un worker ya lo reclamó como "running"; inline sigue "queued" hasta aquí
+    if cancelled() or not store.set_status_if(run_id, "running", {"queued", "running"}, queue_position=None):
+        # Cancelado mientras esperaba en cola
+        store.set_status_if(run_id, "cancelled", {"cancelling"})
+        return
+    with _CANCEL_FLAGS_LOCK:
+        _CANCEL_FLAGS[run_id] = cancelled
+    stream = None
     try:
-        _job_append_event(job, {"event": "start", "message": "Iniciando investigación..."})
-        usuario_cfg_v2, producto_config, _inv_cfg, investigacion_descripcion, estilo_investigacion, investigacion_objetivo, investigacion_preguntas = _load_latest_configs()
+        _job_append_event(run_id, {"event": "start", "message": "Reanudando investigación..." if resume else "Iniciando investigación..."})
 
         # Verificar que los prompts necesarios estén configurados
         required_prompts = ["prompt_perfil", "prompt_sintesis"]
         missing_prompts = [p for p in required_prompts if not system_config_dict.get(p)]
         if missing_prompts:
             _job_append_event(
-                job,
+                run_id,
                 {
                     "event": "error",
                     "message": f"Faltan prompts en la configuración: {', '.join(missing_prompts)}. Ve a ⚙️ Configuración.",
                 },
             )
-            job["status"] = "error"
+            _job_set_status(run_id, "error")
             return
 
         llm_client = _build_llm_client(system_config_dict)
-        _job_append_event(job, {"event": "planning", "message": "Preparando plan..."})
-        plan = build_plan(investigacion_descripcion, estilo_investigacion, investigacion_preguntas)
-        respondents = [r.model_dump() for r in usuario_cfg_v2.to_effective_respondents()]
-        _job_append_event(job, {"event": "planning_done", "message": f"Plan listo. Respondientes: {len(respondents)}."})
+        if resume:
+            # Mismas entradas que el run original (guardadas en su directorio)
+            inputs = load_run_inputs(run_id)
+            if inputs is None:
+                raise HTTPException(status_code=400, detail="El run no tiene las configuraciones necesarias para reanudarse")
+        else:
+            usuario_cfg_v2, producto_config, _inv_cfg, investigacion_descripcion, estilo_investigacion, investigacion_objetivo, investigacion_preguntas = _load_latest_configs()
+            _job_append_event(run_id, {"event": "planning", "message": "Preparando plan..."})
+            inputs = {
+                "producto": producto_config,
+                "investigacion_descripcion": investigacion_descripcion,
+                "investigacion_objetivo": investigacion_objetivo,
+                "investigacion_preguntas": investigacion_preguntas,
+                "estilo_investigacion": estilo_investigacion,
+                "plan": build_plan(investigacion_descripcion, estilo_investigacion, investigacion_preguntas),
+                "respondents": [r.model_dump() for r in usuario_cfg_v2.to_effective_respondents()],
+            }
+        respondents = inputs["respondents"]
+        _job_append_event(run_id, {"event": "planning_done", "message": f"Plan listo. Respondientes: {len(respondents)}."})
 
         engine = MultiResearchEngine(
             respondents=respondents,
-            producto=producto_config,
-            investigacion_descripcion=investigacion_descripcion,
-            investigacion_objetivo=investigacion_objetivo,
-            investigacion_preguntas=investigacion_preguntas,
-            estilo_investigacion=estilo_investigacion,
+            producto=inputs["producto"],
+            investigacion_descripcion=inputs["investigacion_descripcion"],
+            investigacion_objetivo=inputs["investigacion_objetivo"],
+            investigacion_preguntas=inputs["investigacion_preguntas"],
+            estilo_investigacion=inputs["estilo_investigacion"],
             llm_client=llm_client,
-            plan=plan,
+            plan=inputs["plan"],
             prompt_perfil=system_config_dict.get("prompt_perfil"),
             prompt_cuestionario=system_config_dict.get("prompt_cuestionario"),
             prompt_entrevista=system_config_dict.get("prompt_entrevista"),
             prompt_sintesis=system_config_dict.get("prompt_sintesis"),
+            concurrency=system_config_dict.get("concurrencia"),
+            incremental_synthesis=system_config_dict.get("sintesis_incremental"),
+            run_id=run_id,
+            resume=resume,
         )
+        engine.manifest.update(system_config=_public_system_config(system_config_dict))
 
-        for ev in engine.execute_stream(cancel_check=cancelled):
+        stream = engine.execute_stream(cancel_check=cancelled)
+        for ev in stream:
             if cancelled():
-                _job_append_event(job, {"event": "cancelled", "message": "Investigación cancelada por el usuario."})
-                job["status"] = "cancelled"
+                _job_append_event(run_id, {"event": "cancelled", "message": "Investigación cancelada por el usuario."})
                 return
-            _job_append_event(job, ev if isinstance(ev, dict) else {"event": "progress", "message": str(ev)})
             if isinstance(ev, dict) and ev.get("event") == "done":
-                job["status"] = "done"
-                job["result"] = ev.get("result")
+                # El resultado se guarda una sola vez; el evento sólo lo referencia
+                store.set_result(run_id, ev.get("result"))
+                done = {k: v for k, v in ev.items() if k != "result"}
+                _job_append_event(run_id, {**done, "result_url": f"{router.prefix}/job/{run_id}/result"})
+                _job_set_status(run_id, "done")
                 return
+            _job_append_event(run_id, ev if isinstance(ev, dict) else {"event": "progress", "message": str(ev)})
             if isinstance(ev, dict) and ev.get("event") == "cancelled":
-                job["status"] = "cancelled"
                 return
 
         # If finished without done
-        if job.get("status") not in {"done", "cancelled", "error"}:
-            job["status"] = "done"
+        if not cancelled() and (store.get(run_id) or {}).get("status") not in {"done", "cancelled", "error"}:
+            _job_set_status(run_id, "done")
     except HTTPException as e:
-        _job_append_event(job, {"event": "error", "message": str(e.detail)})
-        job["status"] = "error"
+        _job_append_event(run_id, {"event": "error", "message": str(e.detail)})
+        _job_set_status(run_id, "error")
     except Exception as e:
         import traceback
         error_msg = f"Error al ejecutar investigación: {str(e)}"
         print(f"[ERROR] {error_msg}")
         print(f"[TRACEBACK] {traceback.format_exc()}")
-        _job_append_event(job, {"event": "error", "message": error_msg})
-        job["status"] = "error"
+        _job_append_event(run_id, {"event": "error", "message": error_msg})
+        _job_set_status(run_id, "error")
+        # Las unidades ya completadas quedan en el manifiesto: el run se puede reanudar
+        manifest = RunManifest.load(run_id)
+        if manifest is not None:
+            manifest.set_status("error", error_msg)
+    finally:
+        if stream is not None:
+            # Cierra el motor y espera a sus unidades en curso antes de dar el job por terminado
+            stream.close()
+        if cancelled():
+            # Sólo ahora es "cancelled": a partir de aquí se puede reanudar sin solaparse
+            store.set_status_if(run_id, "cancelled", ACTIVE_STATUSES)
+        with _CANCEL_FLAGS_LOCK:
+            # Una reanudación ya pudo registrar su propia marca
+            if _CANCEL_FLAGS.get(run_id) is cancelled:
+                del _CANCEL_FLAGS[run_id]
 
 
 class InvestigacionConfig(BaseModel):
@@ -279,6 +316,13 @@ class SystemConfig(BaseModel):
     # Hugging Face
     huggingface_api_key: Optional[str] = None
     huggingface_model: Optional[str] = None
+    # Seed fija para generación reproducible y bypass de la caché de respuestas LLM
+    llm_seed: Optional[int] = None
+    llm_cache_bypass: Optional[bool] = None
+    # Respondientes ejecutados en paralelo (por defecto RESEARCH_CONCURRENCY)
+    concurrencia: Optional[int] = None
+    # Síntesis incremental con eventos "partial_synthesis" (por defecto SYNTHESIS_INCREMENTAL)
+    sintesis_incremental: Optional[bool] = None
 
 
 class JobStartRequest(BaseModel):
@@ -290,57 +334,338 @@ class IniciarInvestigacionRequest(BaseModel):
     system_config: Optional[SystemConfig] = None
 
 
+def _client_id(http_request: Request, x_client_id: Optional[str]) -> str:
+    """Usuario a efectos de cola justa: cabecera X-Client-Id (sesión del frontend) o IP."""
+    if x_client_id and x_client_id.strip():
+        return x_client_id.strip()[:64]
+    return http_request.client.host if http_request.client else "anon"
+
+
+def _queue_position_event(run_id: str, position: int) -> None:
+    get_job_store().update(run_id, queue_position=position)
+    _job_append_event(run_id, queue_position_event(position))
+
+
+def _queue_full(message: str, retry_after_s: int) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=f"{message} Reintenta en {retry_after_s} s.",
+        headers={"Retry-After": str(retry_after_s)},
+    )
+
+
+def _enqueue_for_workers(run_id: str, system_config_dict: Dict[str, Any], user: str, resume: bool) -> int:
+    """
+    Modo worker: admisión con los contadores del registro (compartidos por todas las
+    réplicas de la API) y alta del job con su payload en la cola duradera.
+    """
+    store = get_job_store()
+    queued = store.queued_jobs()
+    max_queued = int(JOB_CONFIG.get("max_queued") or 0)
+    max_per_user = int(JOB_CONFIG.get("max_per_user") or 0)
+    retry_after_s = max(1, int(JOB_CONFIG.get("retry_after_s") or 30))
+    if max_queued and len(queued) >= max_queued:
+        raise _queue_full(f"La cola de investigaciones está llena ({max_queued} en espera).", retry_after_s)
+    if max_per_user:
+        mine = sum(1 for ref in queued if ref.user == user) + store.running_by_user().get(user, 0)
+        if mine >= max_per_user:
+            raise _queue_full(f"Ya tienes {max_per_user} investigaciones en cola o en ejecución.", retry_after_s)
+    _register_job(run_id, user, resume, payload={"system_config": system_config_dict, "resume": resume})
+    return store.refresh_queue_positions().get(run_id, 0)
+
+
+def _register_job(run_id: str, user: str, resume: bool, payload: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Da de alta el job en cola. Al reanudar lo reclama de forma atómica (sólo desde error o
+    cancelado): de dos reanudaciones simultáneas una recibe 409. Conserva sus eventos.
+    """
+    store = get_job_store()
+    if not resume:
+        store.create(run_id, user, status="queued", payload=payload)
+    elif not store.requeue(run_id, user, RESUMABLE_STATUSES, payload=payload):
+        raise HTTPException(status_code=409, detail="El run no se puede reanudar: sigue en cola, en ejecución o cancelándose, o ya terminó")
+    store.prune(max(1, int(JOB_CONFIG.get("history") or 50)))
+
+
+def _start_job(run_id: str, system_config_dict: Dict[str, Any], user: str, resume: bool = False) -> int:
+    """
+    Encola el job en el planificador (o, en modo worker, en la cola duradera).
+    Devuelve la posición en cola (0 = empieza ya). Si la cola no lo admite responde
+    429 con Retry-After.
+    """
+    if WORKER_MODE:
+        return _enqueue_for_workers(run_id, system_config_dict, user, resume)
+    store = get_job_store()
+    previous = store.get(run_id)
+    _register_job(run_id, user, resume)
+    try:
+        position = get_job_scheduler().submit(
+            run_id,
+            user,
+            lambda: run_job(run_id, system_config_dict, resume),
+            on_position=lambda pos: _queue_position_event(run_id, pos),
+        )
+    except QueueFullError as e:
+        if previous is None:
+            store.delete(run_id)
+        else:
+            # Sus eventos siguen ahí: sólo vuelve al estado anterior
+            store.set_status_if(run_id, previous["status"], {"queued"})
+        raise _queue_full(str(e), e.retry_after_s)
+    return position
+
+
 @router.post("/job/start")
-def job_start(request: JobStartRequest):
+def job_start(request: JobStartRequest, http_request: Request, x_client_id: Optional[str] = Header(None)):
     system_config_dict = request.system_config.dict() if request.system_config else {}
-    run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:10]}"
-    job = {
+    run_id = new_run_id()
+    position = _start_job(run_id, system_config_dict, _client_id(http_request, x_client_id))
+    return {"status": "success", "run_id": run_id, "queue_position": position}
+
+
+@router.get("/job/queue")
+def job_queue():
+    """Estado del planificador: workers, jobs en ejecución y en cola por usuario."""
+    if not WORKER_MODE:
+        return {"status": "success", "execution": "inline", "scheduler": get_job_scheduler().stats()}
+    store = get_job_store()
+    queued_by_user: Dict[str, int] = {}
+    for ref in store.queued_jobs():
+        queued_by_user[ref.user] = queued_by_user.get(ref.user, 0) + 1
+    running_by_user = store.running_by_user()
+    return {
+        "status": "success",
+        "execution": "worker",
+        "scheduler": {
+            "running": sum(running_by_user.values()),
+            "running_by_user": running_by_user,
+            "queued": sum(queued_by_user.values()),
+            "queued_by_user": queued_by_user,
+            "max_queued": int(JOB_CONFIG.get("max_queued") or 0),
+            "max_per_user": int(JOB_CONFIG.get("max_per_user") or 0),
+        },
+    }
+
+
+@router.get("/job/incomplete")
+def job_incomplete():
+    """Runs con manifiesto que no llegaron a terminar (candidatos a reanudar)."""
+    return {"status": "success", "runs": list_incomplete_runs()}
+
+
+@router.post("/job/{run_id}/resume")
+def job_resume(
+    run_id: str,
+    http_request: Request,
+    request: Optional[JobStartRequest] = None,
+    x_client_id: Optional[str] = Header(None),
+):
+    """
+    Reanuda un run interrumpido (error, cancelación o reinicio del backend):
+    reutiliza perfiles y steps ya persistidos y sólo ejecuta lo que falta.
+    Si no se envía system_config se usa el guardado en el manifiesto (sin API keys).
+    """
+    manifest = RunManifest.load(run_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="run_id sin manifiesto (no se puede reanudar)")
+    if manifest.status == "done":
+        raise HTTPException(status_code=409, detail="El run ya terminó; su resultado se conserva")
+    if request is not None and request.system_config is not None:
+        system_config_dict = request.system_config.dict()
+    else:
+        system_config_dict = dict(manifest.data.get("system_config") or {})
+    position = _start_job(run_id, system_config_dict, _client_id(http_request, x_client_id), resume=True)
+    return {
+        "status": "success",
         "run_id": run_id,
-        "created_at": datetime.now().isoformat(),
-        "status": "running",
-        "events": [],
-        "result": None,
-        "cancel_event": threading.Event(),
-        "lock": threading.Lock(),
+        "completed_units": manifest.completed_units(),
+        "queue_position": position,
     }
-    _job_put(run_id, job)
-    t = threading.Thread(target=_run_job, args=(run_id, system_config_dict), daemon=True)
-    job["thread"] = t
-    t.start()
-    return {"status": "success", "run_id": run_id}
 
 
 @router.get("/job/{run_id}/events")
-def job_events(run_id: str, cursor: int = 0):
-    job = _job_get(run_id)
+async def job_events(run_id: str, cursor: int = 0, wait: float = 0):
+    """
+    Eventos posteriores a `cursor`. Con `wait` (long-poll, hasta JOB_MAX_WAIT_S) la
+    respuesta espera a que haya eventos nuevos o termine el job.
+    """
+    store = get_job_store()
+    job = await asyncio.to_thread(store.get, run_id)
     if not job:
         raise HTTPException(status_code=404, detail="run_id no encontrado")
-    lock = job.get("lock")
-    if lock is None:
-        lock = threading.Lock()
-        job["lock"] = lock
-    with lock:
-        events = job.get("events") if isinstance(job.get("events"), list) else []
-        c = max(0, int(cursor or 0))
-        out = events[c:]
-        new_cursor = len(events)
-        return {"status": "success", "run_id": run_id, "job_status": job.get("status"), "cursor": new_cursor, "events": out}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(max(0.0, wait), float(JOB_CONFIG.get("max_wait_s") or 30))
+    while True:
+        remaining = deadline - loop.time() if job.get("status") in ACTIVE_STATUSES else 0
+        events, new_cursor = await store.await_events(run_id, cursor, max(0.0, remaining))
+        if events or remaining <= 0:
+            break
+        # Aviso sin eventos: cambió el estado del job
+        job = await asyncio.to_thread(store.get, run_id) or job
+    return {
+        "status": "success",
+        "run_id": run_id,
+        "job_status": job.get("status"),
+        "queue_position": job.get("queue_position") if job.get("status") == "queued" else None,
+        "cursor": new_cursor,
+        "events": events,
+    }
+
+
+@router.get("/job/{run_id}/result")
+def job_result(run_id: str):
+    """Resultado de un job terminado (el evento "done" sólo lo referencia con `result_url`)."""
+    store = get_job_store()
+    job = store.get(run_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="run_id no encontrado")
+    if job.get("status") != "done":
+        raise HTTPException(status_code=409, detail=f"El job no ha terminado (estado: {job.get('status')})")
+    result = store.result(run_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="El job no tiene resultado")
+    return {"status": "success", "run_id": run_id, "result": result}
+
+
+@router.get("/job/{run_id}")
+def job_status(run_id: str):
+    """Estado del job y lo que ocupa en el registro (eventos conservados y resultado)."""
+    store = get_job_store()
+    job = store.get(run_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="run_id no encontrado")
+    return {
+        "status": "success",
+        "run_id": run_id,
+        "job_status": job.get("status"),
+        "queue_position": job.get("queue_position") if job.get("status") == "queued" else None,
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+        "memory": store.usage(run_id),
+    }
+
+
+def _sse_event(data: Dict[str, Any]) -> str:
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"id: {data['seq']}\ndata: {payload}\n\n"
+
+
+@router.get("/job/{run_id}/stream")
+async def job_stream(
+    run_id: str,
+    request: Request,
+    cursor: int = 0,
+    heartbeat: float = 15.0,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Eventos del job por Server-Sent Events, en cuanto se producen. Cada mensaje lleva
+    `id:` = número de evento (`seq`); al reconectar se sigue desde la cabecera Last-Event-ID
+    (la manda el EventSource del navegador) o desde `cursor`. Sin eventos, cada
+    `heartbeat` s llega un comentario keepalive. Al terminar el job se envía
+    `event: end` con su estado ({"job_status": ...}) y se cierra.
+    """
+    store = get_job_store()
+    job = await asyncio.to_thread(store.get, run_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="run_id no encontrado")
+    if last_event_id and last_event_id.strip().isdigit():
+        cursor = int(last_event_id.strip())
+    heartbeat_s = min(max(0.5, heartbeat), 60.0)
+
+    async def gen():
+        c, current = max(0, int(cursor or 0)), job
+        while True:
+            active = current is not None and current.get("status") in ACTIVE_STATUSES
+            # Con el job ya terminado sólo quedan por mandar sus últimos eventos
+            events, new_cursor = await store.await_events(run_id, c, heartbeat_s if active else 0)
+            for ev in events:
+                yield _sse_event(ev)
+            c = new_cursor
+            if not active:
+                end = {"job_status": (current or {}).get("status") or "deleted", "cursor": c}
+                yield f"event: end\ndata: {json.dumps(end)}\n\n"
+                return
+            current = await asyncio.to_thread(store.get, run_id)
+            if not events:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        gen(),
+        media_type="text/event-stream",
+        # Sin buffering en proxies (nginx): cada evento sale al momento
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/job/{run_id}/cancel")
 def job_cancel(run_id: str):
-    job = _job_get(run_id)
+    store = get_job_store()
+    job = store.get(run_id)
     if not job:
         raise HTTPException(status_code=404, detail="run_id no encontrado")
-    cancel_event: threading.Event = job["cancel_event"]
-    cancel_event.set()
-    job["status"] = "cancelled"
-    _job_append_event(job, {"event": "cancel_requested", "message": "Cancelación solicitada."})
-    return {"status": "success", "run_id": run_id, "job_status": job.get("status")}
+    # No había empezado: sale de la cola sin llegar a ejecutarse
+    if store.set_status_if(run_id, "cancelled", {"queued"}):
+        # La marca del registro frena a quien ya lo hubiera sacado de la cola
+        store.request_cancel(run_id)
+        get_job_scheduler().cancel(run_id)
+        _job_append_event(run_id, {"event": "cancelled", "message": "Investigación cancelada antes de empezar."})
+        if WORKER_MODE:
+            store.refresh_queue_positions()
+        return {"status": "success", "run_id": run_id, "job_status": "cancelled"}
+    # En ejecución: queda "cancelling" hasta que `run_job` sale y lo marca "cancelled".
+    # Un job ya terminado no se toca: su resultado (sólo accesible con status "done") se conserva
+    if not store.set_status_if(run_id, "cancelling", {"running"}):
+        current = store.get(run_id) or job
+        return {"status": "success", "run_id": run_id, "job_status": current.get("status")}
+    # La marca del registro llega al proceso que ejecuta el job (aunque sea otro worker)
+    store.request_cancel(run_id)
+    with _CANCEL_FLAGS_LOCK:
+        flag = _CANCEL_FLAGS.get(run_id)
+    if flag is not None:
+        flag.set()
+    _job_append_event(run_id, {"event": "cancel_requested", "message": "Cancelación solicitada."})
+    return {"status": "success", "run_id": run_id, "job_status": "cancelling"}
+
+
+def drain_jobs(timeout_s: float) -> None:
+    """
+    Apagado ordenado del proceso: deja de despachar la cola, espera hasta `timeout_s`
+    a los jobs en ejecución y cancela los que sigan (sus unidades ya generadas quedan
+    en el manifiesto y se pueden reanudar). Los jobs que no llegaron a empezar se
+    marcan como error para que el cliente no espere indefinidamente.
+    """
+    scheduler = get_job_scheduler()
+    for run_id in scheduler.shutdown():
+        _job_append_event(run_id, {"event": "error", "message": "El backend se detuvo antes de empezar la investigación. Vuelve a lanzarla."})
+        _job_set_status(run_id, "error")
+    if scheduler.wait_idle(timeout_s):
+        return
+    cancel_running_jobs("El backend se está apagando: la investigación se detiene y se podrá reanudar.")
+    scheduler.wait_idle(5.0)
+
+
+def running_job_ids() -> List[str]:
+    """Jobs que ejecuta este proceso."""
+    with _CANCEL_FLAGS_LOCK:
+        return list(_CANCEL_FLAGS)
+
+
+def cancel_running_jobs(message: str) -> List[str]:
+    """Cancela los jobs que ejecuta este proceso (quedan reanudables). Devuelve sus run_id."""
+    with _CANCEL_FLAGS_LOCK:
+        flags = dict(_CANCEL_FLAGS)
+    for run_id, flag in flags.items():
+        print(f"[WARN] Job {run_id} sigue en ejecución al apagar: se cancela (se podrá reanudar).")
+        _job_append_event(run_id, {"event": "interrupted", "message": message})
+        flag.set()
+    return list(flags)
 
 
 @router.post("")
-async def guardar_investigacion(config: InvestigacionConfig):
+def guardar_investigacion(config: InvestigacionConfig):
     """
     Guarda la configuración de la investigación en un archivo
     """
@@ -397,6 +722,8 @@ def iniciar_investigacion(request: IniciarInvestigacionRequest):
             prompt_cuestionario=system_config_dict.get("prompt_cuestionario"),
             prompt_entrevista=system_config_dict.get("prompt_entrevista"),
             prompt_sintesis=system_config_dict.get("prompt_sintesis"),
+            concurrency=system_config_dict.get("concurrencia"),
+            incremental_synthesis=system_config_dict.get("sintesis_incremental"),
         )
         resultados = engine.execute()
         return {"status": "success", "message": "Investigación completada", "resultados": resultados}
@@ -445,6 +772,9 @@ def iniciar_investigacion_stream(request: IniciarInvestigacionRequest):
                 prompt_cuestionario=system_config_dict.get("prompt_cuestionario"),
                 prompt_entrevista=system_config_dict.get("prompt_entrevista"),
                 prompt_sintesis=system_config_dict.get("prompt_sintesis"),
+                concurrency=system_config_dict.get("concurrencia"),
+                incremental_synthesis=system_config_dict.get("sintesis_incremental"),
+                stream_tokens=True,
             )
 
             for ev in engine.execute_stream():
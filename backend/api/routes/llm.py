@@ -1,30 +1,41 @@
 """
 Endpoints para verificación de LLM/Ollama
 """
+import asyncio
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Dict, Any, Optional
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent.parent))
+from core.llm_cache import get_llm_cache
 from core.llm_client import LLMClient
 from config import LLAMA_CONFIG
+from core import health_monitor
 
 router = APIRouter(prefix="/api/llm", tags=["llm"])
 
 
 @router.get("/status")
-async def verificar_ollama() -> Dict[str, Any]:
+async def verificar_ollama(provider: Optional[str] = None) -> Dict[str, Any]:
     """
-    Verifica el estado de la conexión con Ollama
+    Estado de la conexión con el proveedor (por defecto Ollama).
+
+    Se sirve desde la caché del sondeo en segundo plano (core/health_monitor.py);
+    sólo si todavía no hay dato se consulta al proveedor en el momento.
+    `provider=all` devuelve el estado de todos los proveedores configurados.
     """
+    key = (provider or "ollama").strip().lower()
+    if key == "all":
+        return health_monitor.get_all_statuses()
+    cached = health_monitor.get_status(key)
+    if cached is not None:
+        return cached
+    llm_config = health_monitor.default_config(key)
+    if llm_config is None:
+        raise HTTPException(status_code=404, detail=f"Proveedor no configurado en el backend: {key}")
     try:
-        # Forzar el provider a ollama para esta verificación específica
-        ollama_config = dict(LLAMA_CONFIG)
-        ollama_config["provider"] = "ollama"
-        llm_client = LLMClient(provider="llama", config=ollama_config)
-        status = llm_client.check_connection()
-        return status
+        return await health_monitor.probe(key, llm_config)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al verificar Ollama: {str(e)}")
 
@@ -49,6 +60,8 @@ async def verificar_llm(request: LLMStatusRequest) -> Dict[str, Any]:
 
     - Para Ollama: usa la config del backend (env/`backend/config.py`)
     - Para AnythingLLM: usa parámetros enviados en el body
+
+    Como GET, responde desde la caché del sondeo en segundo plano.
     """
     try:
         provider = (request.llm_provider or "ollama").strip().lower()
@@ -73,10 +86,81 @@ async def verificar_llm(request: LLMStatusRequest) -> Dict[str, Any]:
             if request.huggingface_api_key:
                 llm_config["api_key"] = request.huggingface_api_key
         else:
-            llm_config = dict(LLAMA_CONFIG)
-            llm_config["provider"] = "ollama"
+            # Ollama usa la config del backend: es la misma que sondea el monitor
+            cached = health_monitor.get_status("ollama")
+            if cached is not None:
+                return cached
+            return await health_monitor.probe("ollama", health_monitor.default_config("ollama"))
 
-        llm_client = LLMClient(provider="llama", config=llm_config)
-        return llm_client.check_connection()
+        # La config enviada por la UI pasa a sondearse en segundo plano; mientras
+        # no haya dato se comprueba en el momento.
+        key = health_monitor.watch(llm_config)
+        cached = health_monitor.get_status(key)
+        if cached is not None:
+            return cached
+        return await health_monitor.probe(key, llm_config)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al verificar LLM: {str(e)}")
+
+
+class OllamaModelRequest(BaseModel):
+    """Modelo de Ollama a cargar/descargar (por defecto, el de la config del backend)."""
+    model: Optional[str] = None
+    # Duración ("30m", "1h") o segundos (-1 = indefinido). Por defecto OLLAMA_KEEP_ALIVE.
+    keep_alive: Optional[str] = None
+
+
+def _ollama_client(model: Optional[str]) -> LLMClient:
+    config = {**LLAMA_CONFIG, "provider": "ollama"}
+    if model:
+        config["model"] = model
+    return LLMClient(provider="llama", config=config)
+
+
+@router.post("/preload")
+async def precargar_modelo(request: Optional[OllamaModelRequest] = None) -> Dict[str, Any]:
+    """
+    Carga un modelo en Ollama y lo mantiene en memoria durante `keep_alive`.
+    """
+    request = request or OllamaModelRequest()
+    client = _ollama_client(request.model)
+    result = await asyncio.to_thread(client.preload_model, request.keep_alive)
+    if result.get("status") == "error":
+        raise HTTPException(status_code=502, detail=result.get("message"))
+    return result
+
+
+@router.post("/unload")
+async def descargar_modelo(request: Optional[OllamaModelRequest] = None) -> Dict[str, Any]:
+    """
+    Libera un modelo de la memoria de Ollama.
+    """
+    request = request or OllamaModelRequest()
+    result = await asyncio.to_thread(_ollama_client(request.model).unload_model)
+    if result.get("status") == "error":
+        raise HTTPException(status_code=502, detail=result.get("message"))
+    return result
+
+
+@router.get("/cache")
+async def estado_cache() -> Dict[str, Any]:
+    """
+    Estadísticas de la caché de respuestas LLM (aciertos, fallos, tamaño).
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return {"enabled": False}
+    stats = await asyncio.to_thread(cache.stats)
+    return {"enabled": True, **stats}
+
+
+@router.delete("/cache")
+async def vaciar_cache() -> Dict[str, Any]:
+    """
+    Vacía la caché de respuestas LLM (memoria y disco).
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return {"enabled": False, "cleared": False}
+    await asyncio.to_thread(cache.clear)
+    return {"enabled": True, "cleared": True}
@@ -150,7 +150,7 @@ REQUISITOS DE SALIDA
 
 
 @router.post("")
-async def guardar_producto(config: ProductoConfig):
+def guardar_producto(config: ProductoConfig):
     """
     Guarda la configuración del producto en un archivo
     """
@@ -218,14 +218,15 @@ async def generar_ficha_producto(request: GenerarFichaProductoRequest):
             )
 
         llm_client = LLMClient(provider="llama", config=llm_config)
-        ficha = llm_client.generate(prompt)
+        # Llamada asíncrona: una generación larga no bloquea el resto de peticiones
+        ficha = await llm_client.agenerate(prompt)
         return {"status": "success", "ficha_producto": ficha}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar ficha de producto: {str(e)}")
 
 
 @router.get("/latest")
-async def obtener_producto_latest():
+def obtener_producto_latest():
     """
     Obtiene la configuración más reciente del producto
     """
@@ -58,7 +58,8 @@ async def refinar_texto(request: RefineRequest):
         # Usar el prompt de refinado
         prompt = DEFAULT_PROMPTS.get("refinado", "{texto}").format(texto=request.text)
         
-        refined = client.generate(prompt)
+        # Llamada asíncrona: una generación lenta no bloquea el resto de peticiones
+        refined = await client.agenerate(prompt)
         
         return {
             "status": "success",
@@ -99,7 +100,7 @@ def _extract_summary(data: Dict[str, Any], filepath: Path) -> Dict[str, Any]:
 
 
 @router.get("")
-async def listar_resultados():
+def listar_resultados():
     """
     Lista todas las investigaciones ejecutadas
     """
@@ -141,7 +142,7 @@ async def listar_resultados():
 
 
 @router.get("/latest")
-async def obtener_resultado_latest():
+def obtener_resultado_latest():
     """
     Obtiene el resultado más reciente
     """
@@ -175,7 +176,7 @@ async def obtener_resultado_latest():
 
 
 @router.get("/{resultado_id}")
-async def obtener_resultado(resultado_id: str):
+def obtener_resultado(resultado_id: str):
     """
     Obtiene los resultados de una investigación específica
     """
@@ -209,7 +210,7 @@ async def obtener_resultado(resultado_id: str):
 
 
 @router.get("/{resultado_id}/respondent/{respondent_id}")
-async def obtener_respondiente(resultado_id: str, respondent_id: str):
+def obtener_respondiente(resultado_id: str, respondent_id: str):
     """
     Obtiene los detalles de un respondiente específico de una investigación
     """
@@ -17,7 +17,7 @@ router = APIRouter(prefix="/api/usuario", tags=["usuario"])
 
 
 @router.post("")
-async def guardar_usuario(config: Dict[str, Any]):
+def guardar_usuario(config: Dict[str, Any]):
     """
     Guarda la configuración del usuario sintético en un archivo
     """
@@ -56,7 +56,7 @@ async def guardar_usuario(config: Dict[str, Any]):
 
 
 @router.get("/latest")
-async def obtener_usuario_latest():
+def obtener_usuario_latest():
     """
     Obtiene la configuración más reciente del usuario
     """
@@ -29,6 +29,10 @@ LLAMA_CONFIG = {
     "base_url": os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434"),
     "temperature": float(os.getenv("LLAMA_TEMPERATURE", "0.7")),
     "max_tokens": int(os.getenv("LLAMA_MAX_TOKENS", "8000")),
+    # Tiempo que Ollama mantiene el modelo cargado tras cada petición ("30m", "1h", "-1" = siempre)
+    "keep_alive": os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+    # Cargar el modelo al arrancar la API para que el primer respondiente no pague el arranque en frío
+    "preload_on_startup": os.getenv("OLLAMA_PRELOAD_ON_STARTUP", "true").strip().lower() in {"1", "true", "yes"},
 }
 
 # Configuración AnythingLLM (para usar OpenAI vía AnythingLLM)
@@ -45,6 +49,8 @@ ANYTHINGLLM_CONFIG = {
     "min_delay_ms": int(os.getenv("ANYTHINGLLM_MIN_DELAY_MS", "500")),
     # Reintentos en 429 (Too Many Requests)
     "max_retries": int(os.getenv("ANYTHINGLLM_MAX_RETRIES", "3")),
+    # Segundos que se recuerda el slug resuelto y la URL de chat que respondió (0 = no recordar)
+    "route_cache_ttl_s": int(os.getenv("ANYTHINGLLM_ROUTE_CACHE_TTL_S", "600")),
 }
 
 # Configuración Hugging Face
@@ -55,6 +61,158 @@ HUGGINGFACE_CONFIG = {
     "base_url": os.getenv("HUGGINGFACE_BASE_URL", "https://router.huggingface.co/models/"),
     "temperature": float(os.getenv("HUGGINGFACE_TEMPERATURE", "0.7")),
     "max_tokens": int(os.getenv("HUGGINGFACE_MAX_TOKENS", "8000")),
+    # Segundos que se recuerda el endpoint del router que funcionó para cada modelo (0 = no recordar)
+    "endpoint_cache_ttl_s": int(os.getenv("HUGGINGFACE_ENDPOINT_CACHE_TTL_S", "3600")),
+    # Hub de modelos: el chequeo de estado consulta ahí los metadatos del modelo (no genera)
+    "hub_url": os.getenv("HUGGINGFACE_HUB_URL", "https://huggingface.co"),
+}
+
+# Pool de conexiones HTTP compartido por todos los LLMClient (ver core/http_pool.py)
+HTTP_POOL_CONFIG = {
+    # Nº de hosts distintos cacheados por sesión y conexiones máximas por host.
+    "pool_connections": int(os.getenv("LLM_HTTP_POOL_CONNECTIONS", "4")),
+    "pool_maxsize": int(os.getenv("LLM_HTTP_POOL_MAXSIZE", "16")),
+    # Si está activo, las llamadas esperan a que haya una conexión libre en vez de abrir otra.
+    "pool_block": os.getenv("LLM_HTTP_POOL_BLOCK", "false").strip().lower() in {"1", "true", "yes"},
+    # Reintentos en errores de conexión (nunca se reenvía un POST ya recibido).
+    "max_retries": int(os.getenv("LLM_HTTP_MAX_RETRIES", "2")),
+    "backoff_factor": float(os.getenv("LLM_HTTP_BACKOFF_FACTOR", "0.3")),
+    # Segundos de inactividad antes de enviar sondas TCP keep-alive (0 = valor del SO).
+    "keepalive_idle_s": int(os.getenv("LLM_HTTP_KEEPALIVE_IDLE_S", "60")),
+}
+
+# Límites de peticiones por endpoint de proveedor, compartidos por todo el proceso
+# (ver core/rate_limiter.py). 0 = sin límite. Si rps es 0 se respeta `min_delay_ms`
+# del proveedor como 1 petición cada min_delay_ms.
+RATE_LIMIT_CONFIG = {
+    "burst": int(os.getenv("LLM_RATE_LIMIT_BURST", "1")),
+    # Espera compartida tras un 429 si el proveedor no indica Retry-After
+    "backoff_429_s": float(os.getenv("LLM_RATE_LIMIT_BACKOFF_429_S", "2.0")),
+    "ollama": {
+        "rps": float(os.getenv("OLLAMA_RATE_LIMIT_RPS", "0")),
+        "tokens_per_min": int(os.getenv("OLLAMA_RATE_LIMIT_TPM", "0")),
+    },
+    "anythingllm": {
+        "rps": float(os.getenv("ANYTHINGLLM_RATE_LIMIT_RPS", "0")),
+        "tokens_per_min": int(os.getenv("ANYTHINGLLM_RATE_LIMIT_TPM", "0")),
+    },
+    "huggingface": {
+        "rps": float(os.getenv("HUGGINGFACE_RATE_LIMIT_RPS", "0")),
+        "tokens_per_min": int(os.getenv("HUGGINGFACE_RATE_LIMIT_TPM", "0")),
+    },
+}
+
+# Sondeo en segundo plano del estado de los proveedores LLM (ver core/health_monitor.py)
+HEALTH_CONFIG = {
+    "enabled": os.getenv("LLM_HEALTH_ENABLED", "true").strip().lower() in {"1", "true", "yes"},
+    "interval_s": float(os.getenv("LLM_HEALTH_INTERVAL_S", "30")),
+    # Configuraciones adicionales (enviadas por la UI) que se sondean a la vez
+    "max_watched": int(os.getenv("LLM_HEALTH_MAX_WATCHED", "8")),
+}
+
+# Caché de respuestas LLM (ver core/llm_cache.py). Desactivada por defecto:
+# con temperatura > 0 y sin seed, una respuesta cacheada elimina la variabilidad entre ejecuciones.
+LLM_CACHE_CONFIG = {
+    "enabled": os.getenv("LLM_CACHE_ENABLED", "false").strip().lower() in {"1", "true", "yes"},
+    "memory_max_entries": int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256")),
+    "disk_max_mb": int(os.getenv("LLM_CACHE_DISK_MAX_MB", "256")),
+    # Segundos de vida de una entrada (0 = sin caducidad)
+    "ttl_s": int(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600))),
+}
+
+# Log JSONL de respuestas crudas del LLM (ver core/llm_logger.py)
+LLM_LOG_CONFIG = {
+    "enabled": os.getenv("LLM_LOG_ENABLED", "true").strip().lower() in {"1", "true", "yes"},
+    # Rotación: tamaño máximo por fichero y nº de ficheros antiguos conservados
+    "max_bytes": int(os.getenv("LLM_LOG_MAX_BYTES", str(20 * 1024 * 1024))),
+    "backup_count": int(os.getenv("LLM_LOG_BACKUP_COUNT", "5")),
+    # Comprimir con gzip los ficheros rotados
+    "compress": os.getenv("LLM_LOG_COMPRESS", "true").strip().lower() in {"1", "true", "yes"},
+    # Fracción de llamadas registradas (1.0 = todas)
+    "sample_rate": float(os.getenv("LLM_LOG_SAMPLE_RATE", "1.0")),
+    # Recorte de prompt/respuesta en cada registro (0 = sin recorte)
+    "max_payload_chars": int(os.getenv("LLM_LOG_MAX_PAYLOAD_CHARS", "4000")),
+    # Registros pendientes de escribir; si se llena, se descartan
+    "queue_size": int(os.getenv("LLM_LOG_QUEUE_SIZE", "10000")),
+}
+
+# Ejecución de investigaciones (ver core/multi_research_engine.py)
+RESEARCH_CONFIG = {
+    # Respondientes procesados a la vez (1 = secuencial). Con Ollama conviene no superar OLLAMA_NUM_PARALLEL.
+    "concurrency": int(os.getenv("RESEARCH_CONCURRENCY", "1")),
+    "max_concurrency": int(os.getenv("RESEARCH_MAX_CONCURRENCY", "16")),
+    # Reintentos de cada unidad (perfil / step) antes de dar el respondiente por fallido,
+    # con espera exponencial: retry_backoff_s, 2x, 4x...
+    "unit_retries": int(os.getenv("RESEARCH_UNIT_RETRIES", "2")),
+    "retry_backoff_s": float(os.getenv("RESEARCH_RETRY_BACKOFF_S", "2.0")),
+}
+
+# Planificador de jobs de investigación (ver core/job_scheduler.py)
+JOB_CONFIG = {
+    # Investigaciones ejecutadas a la vez; el resto espera en cola (cada una usa además RESEARCH_CONCURRENCY)
+    "workers": int(os.getenv("JOB_WORKERS", "2")),
+    # Control de admisión: máximo de jobs en espera y de jobs (en cola o en ejecución) por usuario (0 = sin límite)
+    "max_queued": int(os.getenv("JOB_MAX_QUEUED", "20")),
+    "max_per_user": int(os.getenv("JOB_MAX_PER_USER", "3")),
+    # Retry-After de los 429 mientras no hay duraciones de jobs para estimarlo
+    "retry_after_s": int(os.getenv("JOB_RETRY_AFTER_S", "30")),
+    # Jobs terminados que se conservan en el registro (eventos y resultado)
+    "history": int(os.getenv("JOB_HISTORY", "50")),
+    # Registro de jobs (ver core/job_store.py): "sqlite" (compartido entre workers) o "memory"
+    "store": os.getenv("JOB_STORE", "sqlite").strip().lower(),
+    "db_path": os.getenv("JOB_STORE_PATH", "").strip() or None,
+    # Al apagar: segundos de espera a los jobs en ejecución antes de cancelarlos (quedan reanudables)
+    "drain_timeout_s": float(os.getenv("JOB_DRAIN_TIMEOUT_S", "30")),
+    # "inline": los jobs se ejecutan en el proceso de la API. "worker": la API sólo los encola en
+    # el registro (sqlite) y los ejecuta un proceso aparte: `python -m backend.worker`
+    "execution": os.getenv("JOB_EXECUTION_MODE", "inline").strip().lower(),
+    # Cada cuántos segundos busca trabajo un worker sin jobs
+    "worker_poll_s": float(os.getenv("JOB_WORKER_POLL_S", "1.0")),
+    # Un worker renueva sus jobs cada lease/3; si pasa `lease_s` sin hacerlo se da por muerto
+    # y sus jobs quedan en "error" (reanudables)
+    "lease_s": float(os.getenv("JOB_LEASE_S", "60")),
+    # Long-poll / SSE de eventos: cada cuántos segundos se relee el registro por si otro proceso
+    # (un worker, otra réplica) escribió eventos; los del propio proceso llegan al instante
+    "event_poll_s": float(os.getenv("JOB_EVENT_POLL_S", "0.5")),
+    # Tope del parámetro `wait` de /job/{run_id}/events
+    "max_wait_s": float(os.getenv("JOB_MAX_WAIT_S", "30")),
+    # Eventos que se conservan por job (los más recientes; el progreso además se compacta). 0 = todos
+    "max_events": int(os.getenv("JOB_MAX_EVENTS", "200")),
+}
+
+# Ejecución distribuida de respondientes (ver core/cluster.py). Con CLUSTER_MODE=coordinator cada
+# respondiente es una tarea que ejecuta un nodo remoto (`python worker_node.py --coordinator URL`)
+CLUSTER_CONFIG = {
+    "mode": os.getenv("CLUSTER_MODE", "off").strip().lower(),
+    # Token compartido coordinador/nodos (cabecera X-Cluster-Token); vacío = sin autenticación
+    "token": os.getenv("CLUSTER_TOKEN", "").strip(),
+    # Un nodo que no renueva su lease en `lease_s` se da por muerto y la tarea se reasigna
+    "lease_s": float(os.getenv("CLUSTER_LEASE_S", "60")),
+    # Asignaciones de una tarea (reasignaciones incluidas) antes de dar el respondiente por fallido
+    "max_attempts": int(os.getenv("CLUSTER_MAX_ATTEMPTS", "3")),
+    # Respondientes de un run repartidos a la vez entre los nodos
+    "max_inflight": int(os.getenv("CLUSTER_MAX_INFLIGHT", "64")),
+    # Cada cuánto consulta el coordinador el estado de sus tareas
+    "poll_s": float(os.getenv("CLUSTER_POLL_S", "0.5")),
+    # Nodo worker: coordinador al que pide tareas y respondientes que ejecuta a la vez
+    "coordinator_url": os.getenv("CLUSTER_COORDINATOR_URL", "http://127.0.0.1:8000").strip(),
+    "node_slots": int(os.getenv("CLUSTER_NODE_SLOTS", "1")),
+}
+
+# Síntesis final (ver core/synthesis.py). Con muchos respondientes los datos no caben en un
+# único prompt: se resume cada respondiente (map) y se fusionan los resúmenes por lotes (reduce).
+SYNTHESIS_CONFIG = {
+    # "auto" (map-reduce sólo si los datos no caben), "single" (siempre un prompt) o "map_reduce"
+    "mode": os.getenv("SYNTHESIS_MODE", "auto").strip().lower(),
+    # Ventana de contexto del modelo (tokens) y parte reservada para la respuesta
+    "context_tokens": int(os.getenv("SYNTHESIS_CONTEXT_TOKENS", "8192")),
+    "reserve_output_tokens": int(os.getenv("SYNTHESIS_RESERVE_OUTPUT_TOKENS", "2048")),
+    # Longitud máxima de cada resumen por respondiente / nota de lote
+    "digest_max_tokens": int(os.getenv("SYNTHESIS_DIGEST_MAX_TOKENS", "400")),
+    "merge_max_tokens": int(os.getenv("SYNTHESIS_MERGE_MAX_TOKENS", "900")),
+    # Síntesis incremental: notas actualizadas cada `incremental_batch` respondientes terminados
+    "incremental": os.getenv("SYNTHESIS_INCREMENTAL", "false").strip().lower() in {"1", "true", "yes"},
+    "incremental_batch": int(os.getenv("SYNTHESIS_INCREMENTAL_BATCH", "5")),
 }
 
 # Opciones para usuarios sintéticos
@@ -103,10 +261,10 @@ REGLAS CRÍTICAS DE FORMATO:
 
 Sé específico y realista. No inventes datos que contradigan las dimensiones proporcionadas; si falta información, completa con supuestos razonables y explícitales brevemente.""",
 
-    "cuestionario": """Eres {nombre_usuario}, con el siguiente perfil:
-{perfil_usuario}
-
-CONTEXTO DEL PRODUCTO:
+    # Cuestionario/entrevista: primero el contexto común a todos los respondientes
+    # (producto, investigación, preguntas, reglas) y al final la parte de cada uno
+    # (perfil, seed). Así el servidor puede reutilizar la caché del prefijo común.
+    "cuestionario": """CONTEXTO DEL PRODUCTO:
 {descripcion_producto}
 
 SITUACIÓN DE LA INVESTIGACIÓN:
@@ -134,12 +292,13 @@ A2: [tu respuesta directa y específica]
 A3: [tu respuesta directa y específica]
 ...
 
-Recuerda: estás ESCRIBIENDO respuestas, no hablando. Sé preciso y directo.""",
+Recuerda: estás ESCRIBIENDO respuestas, no hablando. Sé preciso y directo.
 
-    "entrevista": """Eres {nombre_usuario}, con el siguiente perfil:
-{perfil_usuario}
+TU PERFIL:
+Eres {nombre_usuario}, con el siguiente perfil:
+{perfil_usuario}""",
 
-CONTEXTO DEL PRODUCTO:
+    "entrevista": """CONTEXTO DEL PRODUCTO:
 {descripcion_producto}
 
 SITUACIÓN DE LA INVESTIGACIÓN:
@@ -170,9 +329,13 @@ R2: [tu respuesta conversacional como este usuario]
 
 ...
 
-Seed para variabilidad: {seed}
+Recuerda: estás HABLANDO en una entrevista, no escribiendo. Sé natural y conversacional.
+
+TU PERFIL:
+Eres {nombre_usuario}, con el siguiente perfil:
+{perfil_usuario}
 
-Recuerda: estás HABLANDO en una entrevista, no escribiendo. Sé natural y conversacional.""",
+Seed para variabilidad: {seed}""",
 
     "sintesis": """Eres un investigador UX experto. Tu tarea es analizar las respuestas de los usuarios y generar un informe de síntesis profesional.
 
@@ -204,6 +367,56 @@ Analiza estos datos y genera un informe de investigación profesional que incluy
 
 Cita evidencias específicas de las respuestas cuando sea útil. Mantén un tono profesional y objetivo.""",
 
+    # Map-reduce de la síntesis (core/synthesis.py): resumen por respondiente y fusión por lotes
+    "sintesis_resumen": """Eres un investigador UX. Resume las aportaciones de UN respondiente de una investigación para un análisis posterior.
+
+REGLAS:
+1. Responde EXCLUSIVAMENTE en español, en viñetas breves.
+2. Conserva opiniones, fricciones, necesidades, expectativas y citas textuales cortas relevantes.
+3. No inventes información ni añadas recomendaciones.
+4. No uses etiquetas <think> ni preámbulos.
+
+PRODUCTO: {nombre_producto}
+OBJETIVO DE LA INVESTIGACIÓN: {investigacion_objetivo}
+PREGUNTAS CLAVE: {investigacion_preguntas}
+
+APORTACIONES DEL RESPONDIENTE:
+{datos}""",
+
+    "sintesis_fusion": """Eres un investigador UX. Fusiona los siguientes resúmenes de respondientes en unas notas consolidadas para un informe posterior.
+
+REGLAS:
+1. Responde EXCLUSIVAMENTE en español, en viñetas breves agrupadas por tema.
+2. Indica cuántos respondientes (y de qué arquetipos) comparten cada patrón, fricción o necesidad.
+3. Conserva las discrepancias y las citas textuales más representativas.
+4. No inventes información ni añadas recomendaciones.
+5. No uses etiquetas <think> ni preámbulos.
+
+PRODUCTO: {nombre_producto}
+OBJETIVO DE LA INVESTIGACIÓN: {investigacion_objetivo}
+
+RESÚMENES ({n_items}):
+{datos}""",
+
+    "sintesis_incremental": """Eres un investigador UX. Estás sintetizando una investigación en curso: actualiza las notas de síntesis con las aportaciones de nuevos respondientes.
+
+REGLAS:
+1. Responde EXCLUSIVAMENTE en español, en viñetas breves agrupadas por tema.
+2. Devuelve las notas COMPLETAS actualizadas (no sólo los cambios).
+3. Indica cuántos respondientes (y de qué arquetipos) comparten cada patrón, fricción o necesidad.
+4. Conserva las discrepancias y las citas textuales más representativas.
+5. No inventes información. No uses etiquetas <think> ni preámbulos.
+
+PRODUCTO: {nombre_producto}
+OBJETIVO DE LA INVESTIGACIÓN: {investigacion_objetivo}
+PREGUNTAS CLAVE: {investigacion_preguntas}
+
+NOTAS ACTUALES ({n_previos} respondientes):
+{resumen_actual}
+
+NUEVAS APORTACIONES ({n_items} respondientes):
+{datos}""",
+
     "refinado": """Tu tarea es LIMPIAR y EXTRAER el contenido útil de una respuesta de IA, eliminando borradores, pensamientos internos y preámbulos innecesarios.
 
 REGLAS ABSOLUTAS:
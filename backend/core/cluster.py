@@ -0,0 +1,231 @@
+"""
+Cola de tareas del modo coordinador (CLUSTER_MODE=coordinator).
+
+El motor del coordinador convierte cada respondiente de un run en una tarea
+(perfil + steps) que ejecuta un nodo remoto. Los nodos (`python worker_node.py`)
+hablan con el coordinador por HTTP (ver api/routes/cluster.py):
+
+- lease: el nodo pide una tarea y la recibe con un lease de `lease_s` segundos
+- heartbeat: renueva el lease mientras ejecuta (y se entera de si se canceló)
+- result: sube las unidades generadas; el coordinador las guarda en el directorio del run
+
+Si un nodo muere su lease caduca y la tarea vuelve a repartirse, como mucho
+`max_attempts` veces. Las tareas viven en SQLite (el mismo fichero que el registro
+de jobs), así que cualquier proceso de la API puede atender a los nodos.
+Entre runs simultáneos se reparte por turnos: primero el respondiente 1 de cada
+run, luego el 2...
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import CLUSTER_CONFIG, JOB_CONFIG, STORAGE_DIR
+
+
+def task_id_for(run_id: str, respondent: int) -> str:
+    return f"{run_id}:{respondent}"
+
+
+class TaskQueue:
+    """Tareas remotas en SQLite (thread-safe; `:memory:` para un único proceso)."""
+
+    _COLUMNS = ("task_id", "run_id", "respondent", "status", "worker", "lease_expires", "attempts", "error", "created_at")
+
+    def __init__(self, db_path: str, lease_s: float = 60.0, max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease_s = max(1.0, float(lease_s))
+        self.max_attempts = max(1, int(max_attempts))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.db_path != ":memory:":
+                Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cluster_tasks ("
+                " task_id TEXT PRIMARY KEY, run_id TEXT NOT NULL, respondent INTEGER NOT NULL,"
+                " status TEXT NOT NULL, worker TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0,"
+                " payload TEXT, result TEXT, error TEXT, created_at TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cluster_tasks_status ON cluster_tasks(status, respondent)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def submit(self, run_id: str, respondent: int, payload: Dict[str, Any]) -> str:
+        """Publica (o vuelve a publicar, p.ej. en un reintento) la tarea de un respondiente."""
+        task_id = task_id_for(run_id, respondent)
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO cluster_tasks (task_id, run_id, respondent, status, attempts, payload, created_at)"
+                    " VALUES (?, ?, ?, 'pending', 0, ?, ?)",
+                    (task_id, run_id, int(respondent), json.dumps(payload, ensure_ascii=False, default=str),
+                     datetime.now().isoformat()),
+                )
+        return task_id
+
+    def reap(self) -> int:
+        """Da por fallidas las tareas cuyo lease caducó y ya agotaron sus asignaciones."""
+        with self._lock:
+            db = self._db()
+            with db:
+                cur = db.execute(
+                    "UPDATE cluster_tasks SET status = 'failed', error = ?"
+                    " WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (f"El nodo dejó de responder ({self.max_attempts} asignaciones sin resultado)",
+                     time.time(), self.max_attempts),
+                )
+        return cur.rowcount
+
+    def lease(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        Asigna a `worker` la siguiente tarea pendiente o con el lease caducado (nodo
+        muerto). Devuelve {"task_id", "run_id", "respondent", "attempt", "payload"} o None.
+        """
+        self.reap()
+        for _ in range(5):
+            now = time.time()
+            with self._lock:
+                db = self._db()
+                row = db.execute(
+                    "SELECT task_id FROM cluster_tasks"
+                    " WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)"
+                    " ORDER BY respondent, rowid LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+                with db:
+                    cur = db.execute(
+                        "UPDATE cluster_tasks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1"
+                        " WHERE task_id = ? AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))",
+                        (worker, now + self.lease_s, row[0], now),
+                    )
+                    if cur.rowcount != 1:
+                        # Otro proceso se la llevó entre la consulta y la asignación
+                        continue
+                    task = db.execute(
+                        "SELECT task_id, run_id, respondent, attempts, payload FROM cluster_tasks WHERE task_id = ?",
+                        (row[0],),
+                    ).fetchone()
+            return {
+                "task_id": task[0],
+                "run_id": task[1],
+                "respondent": task[2],
+                "attempt": task[3],
+                "payload": json.loads(task[4] or "{}"),
+            }
+        return None
+
+    def heartbeat(self, task_id: str, worker: str) -> bool:
+        """Renueva el lease. False si `worker` ya no tiene la tarea (reasignada, cancelada o terminada)."""
+        with self._lock:
+            db = self._db()
+            with db:
+                cur = db.execute(
+                    "UPDATE cluster_tasks SET lease_expires = ?"
+                    " WHERE task_id = ? AND worker = ? AND status = 'leased'",
+                    (time.time() + self.lease_s, task_id, worker),
+                )
+        return cur.rowcount == 1
+
+    def finish(self, task_id: str, worker: str, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None) -> bool:
+        """Registra el resultado (o el error) que sube `worker`. False si ya no tenía la tarea."""
+        status = "failed" if error else "done"
+        with self._lock:
+            db = self._db()
+            with db:
+                cur = db.execute(
+                    "UPDATE cluster_tasks SET status = ?, result = ?, error = ?, payload = NULL"
+                    " WHERE task_id = ? AND worker = ? AND status = 'leased'",
+                    (status, json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                     error, task_id, worker),
+                )
+        return cur.rowcount == 1
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Estado de una tarea (con `result` si terminó), o None."""
+        with self._lock:
+            row = self._db().execute(
+                f"SELECT {', '.join(self._COLUMNS)}, result FROM cluster_tasks WHERE task_id = ?",
+                (task_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        task = dict(zip(self._COLUMNS, row[:-1]))
+        task["result"] = json.loads(row[-1]) if row[-1] else None
+        return task
+
+    def delete(self, task_id: str) -> None:
+        """Retira una tarea (consumida o cancelada): el nodo que la tenga pierde el lease."""
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM cluster_tasks WHERE task_id = ?", (task_id,))
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            by_status = dict(db.execute("SELECT status, COUNT(*) FROM cluster_tasks GROUP BY status").fetchall())
+            workers = dict(db.execute(
+                "SELECT worker, COUNT(*) FROM cluster_tasks WHERE status = 'leased' AND lease_expires >= ? GROUP BY worker",
+                (now,),
+            ).fetchall())
+        return {
+            "tasks": by_status,
+            "leased_by_worker": workers,
+            "lease_s": self.lease_s,
+            "max_attempts": self.max_attempts,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_QUEUE_LOCK = threading.Lock()
+_QUEUE: Optional[TaskQueue] = None
+
+
+def get_task_queue() -> TaskQueue:
+    """Cola de tareas del proceso (en el fichero del registro de jobs; en memoria con JOB_STORE=memory)."""
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            if JOB_CONFIG.get("store") == "memory":
+                db_path = ":memory:"
+            else:
+                db_path = str(JOB_CONFIG.get("db_path") or STORAGE_DIR / "jobs" / "jobs.sqlite3")
+            _QUEUE = TaskQueue(
+                db_path,
+                lease_s=float(CLUSTER_CONFIG.get("lease_s") or 60),
+                max_attempts=int(CLUSTER_CONFIG.get("max_attempts") or 3),
+            )
+        return _QUEUE
+
+
+def close_task_queue() -> None:
+    global _QUEUE
+    with _QUEUE_LOCK:
+        queue, _QUEUE = _QUEUE, None
+    if queue is not None:
+        queue.close()
@@ -0,0 +1,172 @@
+"""
+Sondeo periódico del estado de los proveedores LLM.
+
+Una tarea asyncio (arrancada en el lifespan de la API) llama a
+`LLMClient.acheck_connection` para cada proveedor configurado cada
+`interval_s` segundos y guarda el resultado con su timestamp. Así
+`/api/llm/status` responde leyendo memoria en vez de consultar al proveedor,
+y `_get_available_model` reutiliza la lista de modelos de Ollama ya obtenida.
+
+Además de los proveedores del entorno (LLAMA_CONFIG, ANYTHINGLLM_CONFIG,
+HUGGINGFACE_CONFIG), se sondean las configuraciones que la UI ha consultado
+vía POST /api/llm/status (hasta `max_watched`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import ANYTHINGLLM_CONFIG, HEALTH_CONFIG, HUGGINGFACE_CONFIG, LLAMA_CONFIG
+from core.llm_client import LLMClient
+
+
+_LOCK = threading.Lock()
+# clave -> config del LLMClient a sondear
+_WATCHED: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# clave -> último estado (incluye checked_at / latency_ms)
+_STATUS: Dict[str, Dict[str, Any]] = {}
+_TASK: Optional[asyncio.Task] = None
+
+
+def config_key(llm_config: Dict[str, Any]) -> str:
+    """Clave estable de una configuración de proveedor (hash: no expone la API key)."""
+    payload = json.dumps(llm_config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _default_configs() -> Dict[str, Dict[str, Any]]:
+    """Proveedores configurados en el entorno del backend."""
+    configs: Dict[str, Dict[str, Any]] = {"ollama": {**LLAMA_CONFIG, "provider": "ollama"}}
+    if ANYTHINGLLM_CONFIG.get("api_key") or ANYTHINGLLM_CONFIG.get("workspace_slug"):
+        configs["anythingllm"] = {
+            "provider": "anythingllm",
+            "base_url": ANYTHINGLLM_CONFIG.get("base_url"),
+            "api_key": ANYTHINGLLM_CONFIG.get("api_key"),
+            "workspace_slug": ANYTHINGLLM_CONFIG.get("workspace_slug"),
+            "mode": "chat",
+        }
+    if HUGGINGFACE_CONFIG.get("api_key"):
+        configs["huggingface"] = {"provider": "huggingface", "model": HUGGINGFACE_CONFIG.get("model")}
+    return configs
+
+
+def watch(llm_config: Dict[str, Any]) -> str:
+    """Añade una configuración al sondeo periódico y devuelve su clave."""
+    key = config_key(llm_config)
+    max_watched = int(HEALTH_CONFIG.get("max_watched") or 0)
+    with _LOCK:
+        _WATCHED[key] = dict(llm_config)
+        _WATCHED.move_to_end(key)
+        while max_watched and len(_WATCHED) > max_watched:
+            old, _ = _WATCHED.popitem(last=False)
+            _STATUS.pop(old, None)
+    return key
+
+
+def _store(key: str, status: Dict[str, Any], latency_s: float) -> Dict[str, Any]:
+    entry = dict(status)
+    entry["checked_at"] = datetime.now().isoformat()
+    entry["latency_ms"] = round(latency_s * 1000, 1)
+    entry["_ts"] = time.monotonic()
+    with _LOCK:
+        _STATUS[key] = entry
+    return entry
+
+
+def _public(entry: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: v for k, v in entry.items() if k != "_ts"}
+    stale_after = float(HEALTH_CONFIG.get("interval_s") or 0) * 3
+    out["stale"] = bool(stale_after) and (time.monotonic() - entry["_ts"]) > stale_after
+    return out
+
+
+def get_status(key: str) -> Optional[Dict[str, Any]]:
+    """Último estado conocido de `key` (nombre de proveedor o clave de `watch`), o None."""
+    with _LOCK:
+        entry = _STATUS.get(key)
+    return _public(entry) if entry else None
+
+
+def get_all_statuses() -> Dict[str, Dict[str, Any]]:
+    """Estados de los proveedores del entorno (no incluye los añadidos desde la UI)."""
+    with _LOCK:
+        items = [(k, v) for k, v in _STATUS.items() if k in ("ollama", "anythingllm", "huggingface")]
+    return {k: _public(v) for k, v in items}
+
+
+def get_cached_models(base_url: str) -> Optional[List[str]]:
+    """Modelos de Ollama vistos en el último sondeo para `base_url`, o None si no hay dato."""
+    target = (base_url or "").rstrip("/")
+    with _LOCK:
+        entries = list(_STATUS.values())
+    for entry in entries:
+        if entry.get("status") == "connected" and (entry.get("base_url") or "").rstrip("/") == target \
+                and isinstance(entry.get("available_models"), list):
+            return list(entry["available_models"])
+    return None
+
+
+def default_config(provider: str) -> Optional[Dict[str, Any]]:
+    """Config del entorno para `provider` ("ollama", "anythingllm", "huggingface"), si está configurado."""
+    return _default_configs().get(provider)
+
+
+async def probe(key: str, llm_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Comprueba una configuración ahora mismo, guarda el resultado y lo devuelve."""
+    started = time.monotonic()
+    try:
+        status = await LLMClient(provider="llama", config=dict(llm_config)).acheck_connection()
+    except Exception as e:
+        status = {"status": "error", "message": f"Error al verificar LLM: {e}"}
+    return _public(_store(key, status, time.monotonic() - started))
+
+
+async def _probe_all() -> None:
+    targets = dict(_default_configs())
+    with _LOCK:
+        targets.update(_WATCHED)
+    await asyncio.gather(*(probe(k, cfg) for k, cfg in targets.items()))
+
+
+async def _run(interval_s: float) -> None:
+    while True:
+        try:
+            await _probe_all()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[WARN] Sondeo de estado LLM falló: {e}")
+        await asyncio.sleep(interval_s)
+
+
+def start_health_monitor() -> None:
+    """Arranca el sondeo en el event loop actual (idempotente)."""
+    global _TASK
+    if not HEALTH_CONFIG.get("enabled"):
+        return
+    if _TASK is not None and not _TASK.done():
+        return
+    _TASK = asyncio.get_running_loop().create_task(_run(float(HEALTH_CONFIG.get("interval_s") or 30)))
+
+
+async def stop_health_monitor() -> None:
+    global _TASK
+    task, _TASK = _TASK, None
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
@@ -0,0 +1,259 @@
+"""
+Pool de sesiones HTTP compartido por todos los LLMClient del proceso.
+
+Cada proveedor/base_url tiene una única `requests.Session` con:
+- Pool de conexiones keep-alive (evita un handshake TCP/TLS por llamada)
+- Reintentos automáticos sólo en errores de conexión (el POST no se reenvía
+  si el servidor ya lo recibió, para no duplicar generaciones)
+- TCP keep-alive a nivel de socket para conexiones largas (respuestas de minutos)
+
+Para la ruta asíncrona (`LLMClient.agenerate`) se mantiene un `httpx.AsyncClient`
+por (event loop, proveedor, base_url) con los mismos límites de pool.
+
+Las conexiones de las sesiones se registran en el `CancelScope` activo del hilo:
+`CancelScope.cancel()` (desde cualquier hilo) corta en seco la petición en curso,
+también mientras se espera la respuesta.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+try:
+    import httpx  # type: ignore
+except Exception:
+    # httpx sólo es necesario para la ruta asíncrona (agenerate/acheck_connection)
+    httpx = None
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import HTTP_POOL_CONFIG
+
+
+_SESSIONS_LOCK = threading.Lock()
+_SESSIONS: Dict[Tuple[str, str], requests.Session] = {}
+
+_ASYNC_CLIENTS_LOCK = threading.Lock()
+_ASYNC_CLIENTS: Dict[Tuple[int, str, str], Any] = {}
+
+
+def _keepalive_socket_options() -> list:
+    opts = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    idle = int(HTTP_POOL_CONFIG.get("keepalive_idle_s") or 0)
+    if idle > 0:
+        # No todas las plataformas exponen estas constantes (p.ej. macOS/Windows).
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            opts.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle))
+        if hasattr(socket, "TCP_KEEPINTVL"):
+            opts.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, idle // 3)))
+    return opts
+
+
+_ACTIVE_SCOPE = threading.local()
+
+
+class CancelScope:
+    """
+    Sockets que usa una llamada cancelable. `cancel()` los cierra a nivel TCP: la
+    lectura bloqueada en el hilo de la llamada termina al momento con un error de
+    conexión y el servidor ve la desconexión (Ollama deja de generar).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._socks: set = set()
+        self.cancelled = False
+
+    @contextmanager
+    def active(self) -> Iterator["CancelScope"]:
+        """Registra en este scope las conexiones que use el hilo actual dentro del bloque."""
+        previous = getattr(_ACTIVE_SCOPE, "scope", None)
+        _ACTIVE_SCOPE.scope = self
+        try:
+            yield self
+        finally:
+            _ACTIVE_SCOPE.scope = previous
+
+    def add(self, sock: Any) -> None:
+        with self._lock:
+            if not self.cancelled:
+                self._socks.add(sock)
+                return
+        _shutdown(sock)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            socks, self._socks = list(self._socks), set()
+        for sock in socks:
+            _shutdown(sock)
+
+
+def _shutdown(sock: Any) -> None:
+    try:
+        # Sobre el socket base (también en TLS): despierta al hilo bloqueado en recv()
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)
+    except (OSError, TypeError):
+        pass
+
+
+def _register_active(sock: Optional[Any]) -> None:
+    scope = getattr(_ACTIVE_SCOPE, "scope", None)
+    if scope is not None and sock is not None:
+        scope.add(sock)
+
+
+class _ScopedConnectionMixin:
+    """Conexión que se anota en el `CancelScope` activo al abrirse y en cada petición."""
+
+    def connect(self):
+        super().connect()
+        _register_active(self.sock)
+
+    def getresponse(self, *args, **kwargs):
+        # Conexión reutilizada del pool: `connect()` no se vuelve a llamar
+        _register_active(self.sock)
+        return super().getresponse(*args, **kwargs)
+
+
+class _ScopedHTTPConnection(_ScopedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _ScopedHTTPSConnection(_ScopedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _ScopedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _ScopedHTTPConnection
+
+
+class _ScopedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _ScopedHTTPSConnection
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter que activa TCP keep-alive en los sockets del pool (cancelables con `CancelScope`)."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = list(HTTPConnection.default_socket_options) + _keepalive_socket_options()
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _ScopedHTTPConnectionPool,
+            "https": _ScopedHTTPSConnectionPool,
+        }
+
+
+def _pool_key(provider: str, base_url: str) -> Tuple[str, str]:
+    """
+    Normaliza la clave del pool a (proveedor, scheme://host:puerto).
+    El path no importa: todas las rutas del mismo host comparten conexiones.
+    """
+    parts = urlsplit((base_url or "").strip())
+    origin = f"{parts.scheme}://{parts.netloc}" if parts.scheme and parts.netloc else (base_url or "").strip().rstrip("/")
+    return (str(provider or "").strip().lower(), origin.lower())
+
+
+def _build_session() -> requests.Session:
+    retries = Retry(
+        total=int(HTTP_POOL_CONFIG.get("max_retries") or 0),
+        connect=int(HTTP_POOL_CONFIG.get("max_retries") or 0),
+        # Nunca reintentar lecturas: la generación ya pudo haberse procesado.
+        read=0,
+        # Reintentos por status sólo en métodos idempotentes (GET/HEAD…), no en POST.
+        status=int(HTTP_POOL_CONFIG.get("max_retries") or 0),
+        status_forcelist=(502, 503, 504),
+        backoff_factor=float(HTTP_POOL_CONFIG.get("backoff_factor") or 0.0),
+        raise_on_status=False,
+    )
+    adapter = _KeepAliveAdapter(
+        pool_connections=int(HTTP_POOL_CONFIG.get("pool_connections") or 1),
+        pool_maxsize=int(HTTP_POOL_CONFIG.get("pool_maxsize") or 10),
+        max_retries=retries,
+        pool_block=bool(HTTP_POOL_CONFIG.get("pool_block")),
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+def get_session(provider: str, base_url: str) -> requests.Session:
+    """
+    Devuelve la sesión compartida para (provider, base_url), creándola si no existe.
+    """
+    key = _pool_key(provider, base_url)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = _build_session()
+            _SESSIONS[key] = session
+        return session
+
+
+def close_all_sessions() -> None:
+    """Cierra todas las sesiones del pool (p.ej. al apagar la API)."""
+    with _SESSIONS_LOCK:
+        sessions = list(_SESSIONS.values())
+        _SESSIONS.clear()
+    for s in sessions:
+        try:
+            s.close()
+        except Exception:
+            pass
+
+
+def get_async_client(provider: str, base_url: str) -> "httpx.AsyncClient":
+    """
+    Devuelve el `httpx.AsyncClient` compartido para (event loop actual, provider, base_url).
+
+    Los clientes httpx quedan ligados al loop en el que se crean, por eso el loop
+    forma parte de la clave.
+    """
+    if httpx is None:
+        raise RuntimeError("La ruta asíncrona del LLMClient requiere el paquete 'httpx' (pip install httpx)")
+    loop = asyncio.get_running_loop()
+    key = (id(loop),) + _pool_key(provider, base_url)
+    with _ASYNC_CLIENTS_LOCK:
+        client = _ASYNC_CLIENTS.get(key)
+        if client is None or client.is_closed:
+            limits = httpx.Limits(
+                max_connections=int(HTTP_POOL_CONFIG.get("pool_maxsize") or 10),
+                max_keepalive_connections=int(HTTP_POOL_CONFIG.get("pool_maxsize") or 10),
+            )
+            # `retries` en el transporte sólo reintenta errores de conexión (igual que en la ruta sync).
+            transport = httpx.AsyncHTTPTransport(
+                retries=int(HTTP_POOL_CONFIG.get("max_retries") or 0),
+                limits=limits,
+                socket_options=_keepalive_socket_options(),
+            )
+            client = httpx.AsyncClient(transport=transport, limits=limits, headers={"Connection": "keep-alive"})
+            _ASYNC_CLIENTS[key] = client
+        return client
+
+
+async def aclose_all_clients() -> None:
+    """Cierra los clientes asíncronos creados en el loop actual."""
+    loop_id = id(asyncio.get_running_loop())
+    with _ASYNC_CLIENTS_LOCK:
+        keys = [k for k in _ASYNC_CLIENTS if k[0] == loop_id]
+        clients = [_ASYNC_CLIENTS.pop(k) for k in keys]
+    for c in clients:
+        try:
+            await c.aclose()
+        except Exception:
+            pass
@@ -0,0 +1,310 @@
+"""
+Planificador de jobs de investigación.
+
+Un pool fijo de `workers` hilos ejecuta los jobs; el resto espera en cola. La
+cola es por usuario (cliente): entre los jobs pendientes se despacha primero el
+de mayor prioridad y, a igual prioridad, el del usuario con menos jobs en
+ejecución y que lleva más tiempo sin ser atendido (round-robin). Así varios
+usuarios pulsando "Iniciar investigación" a la vez comparten el modelo por
+turnos en lugar de lanzar N ejecuciones simultáneas que compiten por Ollama.
+
+Control de admisión: si la cola está llena (`max_queued`) o el usuario ya tiene
+`max_per_user` jobs pendientes o en ejecución, `submit` lanza QueueFullError con
+una estimación de cuándo reintentar (duración media de los jobs recientes).
+"""
+
+from __future__ import annotations
+
+import itertools
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import JOB_CONFIG
+
+
+class QueueFullError(Exception):
+    """La cola de jobs no admite más trabajos ahora; reintentar tras `retry_after_s`."""
+
+    def __init__(self, message: str, retry_after_s: int):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+def fair_order(jobs: List[Any], running: Dict[str, int], last_served: Optional[Dict[str, int]] = None) -> List[Any]:
+    """
+    Orden de despacho de `jobs` (objetos con .user, .priority y .seq): primero la
+    mayor prioridad y, a igual prioridad, el usuario con menos jobs en ejecución y
+    que lleva más tiempo sin ser atendido; dentro de cada usuario, FIFO.
+    `running` y `last_served` (usuario -> turno) no se modifican.
+    """
+    queues: Dict[str, List[Any]] = {}
+    for job in sorted(jobs, key=lambda j: (-j.priority, j.seq)):
+        queues.setdefault(job.user, []).append(job)
+    running = dict(running)
+    last_served = dict(last_served or {})
+    order: List[Any] = []
+    tick = max(last_served.values(), default=0)
+    while queues:
+        user = min(
+            queues,
+            key=lambda u: (-queues[u][0].priority, running.get(u, 0), last_served.get(u, -1), queues[u][0].seq),
+        )
+        order.append(queues[user].pop(0))
+        if not queues[user]:
+            del queues[user]
+        running[user] = running.get(user, 0) + 1
+        tick += 1
+        last_served[user] = tick
+    return order
+
+
+class _QueuedJob:
+    def __init__(self, job_id: str, user: str, fn: Callable[[], Any], priority: int, seq: int,
+                 on_position: Optional[Callable[[int], None]]):
+        self.job_id = job_id
+        self.user = user
+        self.fn = fn
+        self.priority = priority
+        self.seq = seq
+        self.on_position = on_position
+
+
+class JobScheduler:
+    """Pool fijo de workers con cola justa por usuario (ver docstring del módulo)."""
+
+    def __init__(
+        self,
+        workers: int = 1,
+        max_queued: int = 0,
+        max_per_user: int = 0,
+    ):
+        self.workers = max(1, int(workers or 1))
+        self.max_queued = max(0, int(max_queued or 0))
+        self.max_per_user = max(0, int(max_per_user or 0))
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[_QueuedJob]] = {}
+        self._running: Dict[str, str] = {}  # job_id -> usuario
+        self._last_served: Dict[str, int] = {}  # usuario -> turno del último despacho
+        self._positions: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._tick = itertools.count(1)
+        self._avg_duration_s: Optional[float] = None
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+    # -------------------------
+    # Cola
+    # -------------------------
+
+    def _running_by_user(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for user in self._running.values():
+            counts[user] = counts.get(user, 0) + 1
+        return counts
+
+    def _dispatch_order(self) -> List[_QueuedJob]:
+        """Jobs pendientes en el orden en que se despacharían (sin modificar la cola)."""
+        pending = [job for q in self._queues.values() for job in q]
+        return fair_order(pending, self._running_by_user(), self._last_served)
+
+    def _changed_positions(self) -> List[tuple]:
+        """(job, posición 1-based) de los jobs pendientes cuya posición cambió desde el último aviso."""
+        order = self._dispatch_order()
+        changed = [(job, pos) for pos, job in enumerate(order, start=1) if self._positions.get(job.job_id) != pos]
+        self._positions = {job.job_id: pos for pos, job in enumerate(order, start=1)}
+        return changed
+
+    @staticmethod
+    def _notify(changed: List[tuple]) -> None:
+        """Avisa (fuera del lock) a cada job de su nueva posición en cola."""
+        for job, pos in changed:
+            if job.on_position is None:
+                continue
+            try:
+                job.on_position(pos)
+            except Exception as e:
+                print(f"[WARN] Aviso de posición en cola falló ({job.job_id}): {e}")
+
+    def _queued_count(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def retry_after_s(self) -> int:
+        """Segundos estimados hasta que se libere un hueco (duración media x turnos de espera)."""
+        with self._cond:
+            avg = self._avg_duration_s
+            waiting = self._queued_count()
+        if avg is None:
+            return max(1, int(JOB_CONFIG.get("retry_after_s") or 30))
+        return max(1, min(3600, math.ceil(avg * (waiting // self.workers + 1))))
+
+    def submit(self, job_id: str, user: str, fn: Callable[[], Any], priority: int = 0,
+               on_position: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Encola `fn` (se ejecuta en un worker del pool). Devuelve la posición en cola
+        (0 si hay un worker libre y empieza ya). Lanza QueueFullError si no se admite.
+        `on_position(pos)` se llama cada vez que cambia la posición del job mientras espera.
+        """
+        user = str(user or "anon")
+        with self._cond:
+            if self.max_queued and self._queued_count() >= self.max_queued:
+                full = f"La cola de investigaciones está llena ({self.max_queued} en espera)."
+            elif self.max_per_user and (
+                len(self._queues.get(user) or ()) + self._running_by_user().get(user, 0) >= self.max_per_user
+            ):
+                full = f"Ya tienes {self.max_per_user} investigaciones en cola o en ejecución."
+            else:
+                full = None
+            if full is None:
+                job = _QueuedJob(job_id, user, fn, int(priority or 0), next(self._seq), on_position)
+                self._queues.setdefault(user, deque()).append(job)
+                # Reordenar la cola del usuario por prioridad (estable: FIFO a igual prioridad)
+                self._queues[user] = deque(sorted(self._queues[user], key=lambda j: (-j.priority, j.seq)))
+                self._ensure_workers()
+                changed = self._changed_positions()
+                idle = len(self._running) < self.workers
+                position = 0 if idle else self._positions.get(job_id, 0)
+                self._cond.notify()
+        if full is not None:
+            raise QueueFullError(full, self.retry_after_s())
+        # Si un worker está libre el job sale de la cola enseguida: no avisar de su posición
+        self._notify([(j, pos) for j, pos in changed if not (idle and j is job)])
+        return position
+
+    def cancel(self, job_id: str) -> bool:
+        """Quita de la cola un job que aún no ha empezado. True si estaba en cola."""
+        with self._cond:
+            removed = False
+            for user, q in list(self._queues.items()):
+                for job in list(q):
+                    if job.job_id == job_id:
+                        q.remove(job)
+                        removed = True
+                if not q:
+                    del self._queues[user]
+            changed = self._changed_positions() if removed else []
+        self._notify(changed)
+        return removed
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Posición en cola (1-based) de un job pendiente, o None si no está en cola."""
+        with self._cond:
+            return self._positions.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "running": len(self._running),
+                "queued": self._queued_count(),
+                "queued_by_user": {u: len(q) for u, q in self._queues.items() if q},
+                "max_queued": self.max_queued,
+                "max_per_user": self.max_per_user,
+                "avg_job_duration_s": round(self._avg_duration_s, 1) if self._avg_duration_s is not None else None,
+            }
+
+    # -------------------------
+    # Workers
+    # -------------------------
+
+    def _ensure_workers(self) -> None:
+        # Los workers se crean al primer submit (con el lock tomado)
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._worker, name=f"job-worker-{len(self._threads) + 1}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _next_job(self) -> Optional[_QueuedJob]:
+        with self._cond:
+            while not self._stopping and not self._queued_count():
+                self._cond.wait()
+            if self._stopping:
+                return None
+            job = self._dispatch_order()[0]
+            self._queues[job.user].popleft()
+            if not self._queues[job.user]:
+                del self._queues[job.user]
+            self._running[job.job_id] = job.user
+            self._last_served[job.user] = next(self._tick)
+            changed = self._changed_positions()
+        self._notify(changed)
+        return job
+
+    def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            started = time.monotonic()
+            try:
+                job.fn()
+            except Exception as e:
+                print(f"[WARN] Job {job.job_id} terminó con una excepción no controlada: {e}")
+            finally:
+                elapsed = time.monotonic() - started
+                with self._cond:
+                    self._running.pop(job.job_id, None)
+                    self._cond.notify_all()
+                    prev = self._avg_duration_s
+                    self._avg_duration_s = elapsed if prev is None else 0.7 * prev + 0.3 * elapsed
+                    changed = self._changed_positions()
+                self._notify(changed)
+
+    def running_ids(self) -> List[str]:
+        with self._cond:
+            return list(self._running)
+
+    def wait_idle(self, timeout_s: float) -> bool:
+        """Espera a que no quede ningún job en ejecución. False si vence `timeout_s`."""
+        deadline = time.monotonic() + max(0.0, timeout_s)
+        with self._cond:
+            while self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self) -> List[str]:
+        """
+        Deja de despachar jobs (los que están en ejecución siguen hasta terminar).
+        Vacía la cola y devuelve los ids de los jobs que no llegaron a empezar.
+        """
+        with self._cond:
+            self._stopping = True
+            dropped = [job.job_id for job in self._dispatch_order()]
+            self._queues.clear()
+            self._positions = {}
+            self._cond.notify_all()
+        return dropped
+
+
+_SCHEDULER_LOCK = threading.Lock()
+_SCHEDULER: Optional[JobScheduler] = None
+
+
+def get_job_scheduler() -> JobScheduler:
+    """Planificador compartido del proceso (configurado con JOB_CONFIG)."""
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = JobScheduler(
+                workers=int(JOB_CONFIG.get("workers") or 1),
+                max_queued=int(JOB_CONFIG.get("max_queued") or 0),
+                max_per_user=int(JOB_CONFIG.get("max_per_user") or 0),
+            )
+        return _SCHEDULER
+
+
+def stop_job_scheduler() -> None:
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        scheduler, _SCHEDULER = _SCHEDULER, None
+    if scheduler is not None:
+        scheduler.shutdown()
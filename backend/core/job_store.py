@@ -0,0 +1,898 @@
+"""
+Registro de jobs de investigación: metadatos, eventos (append-only) y resultado.
+
+Dos implementaciones con la misma interfaz:
+- SQLiteJobStore (por defecto): fichero compartido bajo STORAGE_DIR/jobs, en modo
+  WAL. Varios procesos (`uvicorn --workers N` o réplicas detrás de un balanceador
+  sobre el mismo disco) ven los mismos jobs: el que atiende `/events` o `/cancel`
+  no tiene por qué ser el que ejecuta el job. Sobrevive a reinicios del backend.
+- MemoryJobStore: diccionario en memoria del proceso (un único worker, pruebas).
+
+Los eventos de cada job se numeran 1, 2, 3...; el cursor que devuelve `events`
+es el número del último evento leído (0 = desde el principio). Cada job guarda
+sólo sus últimos JOB_MAX_EVENTS eventos y el progreso se compacta: un evento nuevo
+sustituye al anterior con la misma `coalesce_key` (ver abajo), así que la
+numeración puede tener huecos (cada evento devuelto lleva su `seq`). El resultado
+se guarda aparte (`set_result`), no en los eventos.
+La cancelación también pasa por el registro (`request_cancel` /
+`cancel_requested`), así llega al proceso que ejecuta el job.
+`await_events` es la variante asíncrona que espera eventos nuevos (long-poll de
+`/events` y SSE de `/stream`) sin sondear a intervalos fijos desde el cliente.
+
+Con JOB_EXECUTION_MODE=worker el registro es además la cola duradera: la API
+crea el job con su `payload` (system_config y si es una reanudación) y un proceso
+`python -m backend.worker` lo reclama con `claim` (atómico entre procesos),
+en el orden justo por usuario de `fair_order`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import JOB_CONFIG, STORAGE_DIR
+from core.job_scheduler import fair_order
+
+
+# "cancelling": se pidió la cancelación pero el job aún no terminó de salir; `run_job`
+# lo pasa a "cancelled" cuando de verdad ha terminado
+RUNNING_STATUSES = {"running", "cancelling"}
+ACTIVE_STATUSES = {"queued"} | RUNNING_STATUSES
+# Estados desde los que un run se puede reanudar ("done" conserva su resultado)
+RESUMABLE_STATUSES = {"error", "cancelled"}
+
+# Cada cuántos segundos vuelve a leer el registro quien espera eventos escritos por otro proceso
+EVENT_POLL_S = max(0.05, float(JOB_CONFIG.get("event_poll_s") or 0.5))
+
+# Proceso que ejecuta cada job (informativo: ayuda a depurar despliegues con varios workers)
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class QueuedRef:
+    """Job pendiente de la cola duradera (lo que necesita `fair_order`)."""
+
+    priority = 0
+
+    def __init__(self, run_id: str, user: str, seq: int, queue_position: Optional[int]):
+        self.run_id = run_id
+        self.user = user
+        self.seq = seq
+        self.queue_position = queue_position
+
+
+def queue_position_event(position: int) -> Dict[str, Any]:
+    return {"event": "queued", "position": position, "message": f"En cola: posición {position}."}
+
+
+# Progreso de un respondiente: sólo importa el último estado de cada uno
+_RESPONDENT_PROGRESS = {
+    "respondent_start", "profile_start", "profile_done", "step_start", "step_done",
+    "unit_retry", "remote_task", "respondent_done", "respondent_failed",
+}
+
+
+def coalesce_key(event: Dict[str, Any]) -> Optional[str]:
+    """
+    Clave de compactación del registro: un evento nuevo sustituye al anterior con la
+    misma clave (progreso de cada respondiente, posición en cola, síntesis parcial y
+    fase de síntesis). None = el evento se conserva siempre.
+    """
+    name = event.get("event")
+    if name in _RESPONDENT_PROGRESS and event.get("i") is not None:
+        return f"respondent:{event['i']}"
+    if name in ("queued", "partial_synthesis"):
+        return name
+    if name in ("synthesis_start", "synthesis_done"):
+        return "synthesis"
+    return None
+
+
+class _Listener:
+    def __init__(self, notifier: "EventNotifier", run_id: str):
+        self.notifier = notifier
+        self.run_id = run_id
+        self.loop = asyncio.get_running_loop()
+        self.changed = asyncio.Event()
+
+    def __enter__(self) -> "_Listener":
+        self.notifier._add(self)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.notifier._remove(self)
+
+    async def wait(self, timeout_s: float) -> bool:
+        """True si hubo aviso antes de `timeout_s`."""
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout_s)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class EventNotifier:
+    """
+    Avisa a las corrutinas que esperan un job (`await_events`) cuando este proceso
+    escribe un evento o cambia su estado. Se llama desde cualquier hilo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners: Dict[str, List[_Listener]] = {}
+
+    def listen(self, run_id: str) -> _Listener:
+        return _Listener(self, run_id)
+
+    def _add(self, listener: _Listener) -> None:
+        with self._lock:
+            self._listeners.setdefault(listener.run_id, []).append(listener)
+
+    def _remove(self, listener: _Listener) -> None:
+        with self._lock:
+            listeners = self._listeners.get(listener.run_id) or []
+            if listener in listeners:
+                listeners.remove(listener)
+            if not listeners:
+                self._listeners.pop(listener.run_id, None)
+
+    def notify(self, run_id: str) -> None:
+        with self._lock:
+            listeners = list(self._listeners.get(run_id) or ())
+        for listener in listeners:
+            try:
+                listener.loop.call_soon_threadsafe(listener.changed.set)
+            except RuntimeError:
+                # Bucle ya cerrado (apagado): nadie espera
+                pass
+
+
+class JobStore:
+    """Interfaz del registro de jobs."""
+
+    def __init__(self, max_events: int = 0):
+        # Eventos que se conservan por job (0 = todos)
+        self.max_events = max(0, int(max_events or 0))
+        self._notifier = EventNotifier()
+
+    def create(self, run_id: str, user: str, status: str = "queued",
+               payload: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Registra un job nuevo (si `run_id` ya existía, p.ej. al reanudar, empieza de cero).
+        Con `payload` el job entra en la cola duradera para los procesos worker.
+        """
+        raise NotImplementedError
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Metadatos del job (sin eventos ni resultado), o None."""
+        raise NotImplementedError
+
+    def update(self, run_id: str, **fields: Any) -> None:
+        """Actualiza campos del job: status, queue_position, owner."""
+        raise NotImplementedError
+
+    def set_status_if(self, run_id: str, status: str, allowed: set, **fields: Any) -> bool:
+        """
+        Cambia el estado (y `fields`) sólo si el actual está en `allowed`, de forma atómica.
+        False si el job no existe o ya estaba en otro estado (p.ej. terminó entre medias).
+        """
+        raise NotImplementedError
+
+    def requeue(self, run_id: str, user: str, allowed: set,
+                payload: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Vuelve a poner en cola un job para reanudarlo, de forma atómica: sólo si su estado
+        está en `allowed` (o si no hay registro, que se crea). Conserva sus eventos (los
+        nuevos siguen la numeración) y reinicia marca de cancelación y resultado; entra al
+        final de la cola. False si otro lo reanudó antes o el estado no lo permite.
+        """
+        raise NotImplementedError
+
+    def delete(self, run_id: str) -> None:
+        raise NotImplementedError
+
+    def append_event(self, run_id: str, event: Dict[str, Any]) -> int:
+        """
+        Añade un evento al final (compactando el anterior con su misma `coalesce_key`
+        y descartando los que pasan de `max_events`). Devuelve su número (1-based).
+        """
+        raise NotImplementedError
+
+    def events(self, run_id: str, cursor: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Eventos conservados posteriores a `cursor` (cada uno con su `seq`) y el cursor nuevo."""
+        raise NotImplementedError
+
+    def usage(self, run_id: str) -> Dict[str, Any]:
+        """Lo que ocupa el job en el registro: eventos conservados/emitidos y bytes de eventos y resultado."""
+        raise NotImplementedError
+
+    async def await_events(self, run_id: str, cursor: int = 0,
+                           timeout_s: float = 0.0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Como `events`, pero si no hay nada nuevo espera hasta `timeout_s`. Vuelve en
+        cuanto este proceso escribe un evento o cambia el estado del job (entonces la
+        lista puede venir vacía); lo que escriben otros procesos se ve al releer el
+        registro cada EVENT_POLL_S.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max(0.0, float(timeout_s or 0))
+        while True:
+            # Se escucha antes de leer: un evento escrito entre medias no se pierde
+            with self._notifier.listen(run_id) as listener:
+                events, new_cursor = await asyncio.to_thread(self.events, run_id, cursor)
+                remaining = deadline - loop.time()
+                if events or remaining <= 0:
+                    return events, new_cursor
+                if await listener.wait(min(remaining, EVENT_POLL_S)):
+                    return await asyncio.to_thread(self.events, run_id, cursor)
+
+    def set_result(self, run_id: str, result: Any) -> None:
+        raise NotImplementedError
+
+    def result(self, run_id: str) -> Any:
+        raise NotImplementedError
+
+    def request_cancel(self, run_id: str) -> None:
+        """Marca el job para cancelar (lo ve el proceso que lo ejecuta; si estaba en la cola duradera, sale de ella)."""
+        raise NotImplementedError
+
+    def cancel_requested(self, run_id: str) -> bool:
+        raise NotImplementedError
+
+    def prune(self, keep: int) -> int:
+        """Borra los jobs terminados más antiguos, conservando `keep`. Devuelve cuántos borró."""
+        raise NotImplementedError
+
+    def queued_jobs(self) -> List[QueuedRef]:
+        """Jobs de la cola duradera que esperan un worker (orden de llegada)."""
+        raise NotImplementedError
+
+    def running_by_user(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def last_claims(self) -> Dict[str, str]:
+        """Usuario -> instante (ISO) en que un worker reclamó su último job."""
+        raise NotImplementedError
+
+    def last_served(self) -> Dict[str, int]:
+        """Turno del último job reclamado de cada usuario (1 = el más antiguo), para `fair_order`."""
+        ordered = sorted(self.last_claims().items(), key=lambda item: item[1])
+        return {user: turn for turn, (user, _) in enumerate(ordered, start=1)}
+
+    def claim(self, run_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        """
+        Reclama un job de la cola duradera: pasa a "running" a nombre de `owner` y
+        devuelve su payload (que se borra del registro), o None si otro worker se adelantó
+        o ya no está en cola (p.ej. cancelado).
+        """
+        raise NotImplementedError
+
+    def reap_stale(self, max_age_s: float) -> List[str]:
+        """
+        Marca como "error" los jobs reclamados por un worker que lleva más de `max_age_s`
+        sin renovarlos (el proceso murió). Devuelve sus run_id; quedan reanudables.
+        """
+        raise NotImplementedError
+
+    def claim_next(self, owner: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Reclama el siguiente job en orden justo por usuario. (run_id, payload) o None."""
+        for ref in fair_order(self.queued_jobs(), self.running_by_user(), self.last_served()):
+            payload = self.claim(ref.run_id, owner)
+            if payload is not None:
+                return ref.run_id, payload
+        return None
+
+    def refresh_queue_positions(self) -> Dict[str, int]:
+        """
+        Recalcula la posición de los jobs de la cola duradera y emite un evento
+        "queued" a los que cambiaron. Devuelve run_id -> posición.
+        """
+        order = fair_order(self.queued_jobs(), self.running_by_user(), self.last_served())
+        positions: Dict[str, int] = {}
+        for pos, ref in enumerate(order, start=1):
+            positions[ref.run_id] = pos
+            if ref.queue_position != pos:
+                self.update(ref.run_id, queue_position=pos)
+                self.append_event(ref.run_id, queue_position_event(pos))
+        return positions
+
+    def close(self) -> None:
+        pass
+
+
+class _EventLog:
+    """Eventos de un job en memoria: ring buffer por número de evento, con compactación."""
+
+    def __init__(self):
+        self.last_seq = 0
+        self.nbytes = 0
+        # seq -> (evento, bytes en JSON); dict en orden de inserción = orden de seq
+        self.items: Dict[int, Tuple[Dict[str, Any], int]] = {}
+        self.keys: Dict[str, int] = {}
+
+    def _drop(self, seq: int) -> None:
+        event, size = self.items.pop(seq)
+        self.nbytes -= size
+        key = coalesce_key(event)
+        if key is not None and self.keys.get(key) == seq:
+            del self.keys[key]
+
+    def append(self, event: Dict[str, Any], max_events: int) -> int:
+        self.last_seq += 1
+        key = coalesce_key(event)
+        if key is not None and key in self.keys:
+            self._drop(self.keys[key])
+        size = len(_dumps(event))
+        self.items[self.last_seq] = (event, size)
+        self.nbytes += size
+        if key is not None:
+            self.keys[key] = self.last_seq
+        while max_events and self.items:
+            oldest = next(iter(self.items))
+            if oldest > self.last_seq - max_events:
+                break
+            self._drop(oldest)
+        return self.last_seq
+
+    def since(self, cursor: int) -> List[Dict[str, Any]]:
+        return [dict(event, seq=seq) for seq, (event, _) in self.items.items() if seq > cursor]
+
+
+class MemoryJobStore(JobStore):
+    """Registro en memoria del proceso (no se comparte entre workers)."""
+
+    def __init__(self, max_events: int = 0):
+        super().__init__(max_events)
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._events: Dict[str, _EventLog] = {}
+        self._results: Dict[str, Any] = {}
+        self._payloads: Dict[str, Dict[str, Any]] = {}
+        self._claims: Dict[str, str] = {}
+        self._seq = 0
+
+    def create(self, run_id: str, user: str, status: str = "queued",
+               payload: Optional[Dict[str, Any]] = None) -> None:
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._seq += 1
+            self._payloads.pop(run_id, None)
+            if payload is not None:
+                self._payloads[run_id] = payload
+            self._jobs[run_id] = {
+                "run_id": run_id,
+                "user": user,
+                "status": status,
+                "created_at": now,
+                "updated_at": now,
+                "queue_position": None,
+                "cancel_requested": False,
+                "owner": OWNER,
+                "seq": self._seq,
+            }
+            self._events[run_id] = _EventLog()
+            self._results.pop(run_id, None)
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(run_id)
+            return dict(job) if job else None
+
+    def update(self, run_id: str, **fields: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(run_id)
+            if job is not None:
+                job.update(fields)
+                job["updated_at"] = datetime.now().isoformat()
+        if "status" in fields:
+            self._notifier.notify(run_id)
+
+    def set_status_if(self, run_id: str, status: str, allowed: set, **fields: Any) -> bool:
+        with self._lock:
+            job = self._jobs.get(run_id)
+            if job is None or job["status"] not in allowed:
+                return False
+            job.update(fields, status=status, updated_at=datetime.now().isoformat())
+        self._notifier.notify(run_id)
+        return True
+
+    def requeue(self, run_id: str, user: str, allowed: set,
+                payload: Optional[Dict[str, Any]] = None) -> bool:
+        now = datetime.now().isoformat()
+        with self._lock:
+            job = self._jobs.get(run_id)
+            if job is not None and job["status"] not in allowed:
+                return False
+            self._seq += 1
+            self._payloads.pop(run_id, None)
+            if payload is not None:
+                self._payloads[run_id] = payload
+            self._jobs[run_id] = {
+                "run_id": run_id,
+                "user": user,
+                "status": "queued",
+                "created_at": job["created_at"] if job else now,
+                "updated_at": now,
+                "queue_position": None,
+                "cancel_requested": False,
+                "owner": OWNER,
+                "seq": self._seq,
+            }
+            self._events.setdefault(run_id, _EventLog())
+            self._results.pop(run_id, None)
+        self._notifier.notify(run_id)
+        return True
+
+    def delete(self, run_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(run_id, None)
+            self._events.pop(run_id, None)
+            self._results.pop(run_id, None)
+            self._payloads.pop(run_id, None)
+
+    def append_event(self, run_id: str, event: Dict[str, Any]) -> int:
+        with self._lock:
+            log = self._events.get(run_id)
+            if log is None:
+                return 0
+            seq = log.append(event, self.max_events)
+        self._notifier.notify(run_id)
+        return seq
+
+    def events(self, run_id: str, cursor: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        c = max(0, int(cursor or 0))
+        with self._lock:
+            log = self._events.get(run_id)
+            if log is None:
+                return [], c
+            return log.since(c), log.last_seq
+
+    def usage(self, run_id: str) -> Dict[str, Any]:
+        with self._lock:
+            log = self._events.get(run_id) or _EventLog()
+            result = self._results.get(run_id)
+            return {
+                "events_retained": len(log.items),
+                "events_total": log.last_seq,
+                "events_bytes": log.nbytes,
+                "result_bytes": len(_dumps(result)) if result is not None else 0,
+                "max_events": self.max_events,
+            }
+
+    def set_result(self, run_id: str, result: Any) -> None:
+        with self._lock:
+            self._results[run_id] = result
+
+    def result(self, run_id: str) -> Any:
+        with self._lock:
+            return self._results.get(run_id)
+
+    def request_cancel(self, run_id: str) -> None:
+        with self._lock:
+            self._payloads.pop(run_id, None)
+        self.update(run_id, cancel_requested=True)
+
+    def cancel_requested(self, run_id: str) -> bool:
+        with self._lock:
+            return bool((self._jobs.get(run_id) or {}).get("cancel_requested"))
+
+    def prune(self, keep: int) -> int:
+        with self._lock:
+            finished = [j for j in self._jobs.values() if j.get("status") not in ACTIVE_STATUSES]
+            finished.sort(key=lambda j: j.get("created_at") or "")
+            drop = finished[: max(0, len(finished) - keep)]
+            for job in drop:
+                self._jobs.pop(job["run_id"], None)
+                self._events.pop(job["run_id"], None)
+                self._results.pop(job["run_id"], None)
+            return len(drop)
+
+    def queued_jobs(self) -> List[QueuedRef]:
+        with self._lock:
+            jobs = [j for rid, j in self._jobs.items() if j["status"] == "queued" and rid in self._payloads]
+            jobs.sort(key=lambda j: j["seq"])
+            return [QueuedRef(j["run_id"], j["user"], j["seq"], j["queue_position"]) for j in jobs]
+
+    def running_by_user(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for job in self._jobs.values():
+                if job["status"] in RUNNING_STATUSES:
+                    counts[job["user"]] = counts.get(job["user"], 0) + 1
+        return counts
+
+    def claim(self, run_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(run_id)
+            if job is None or job["status"] != "queued" or run_id not in self._payloads:
+                return None
+            now = datetime.now().isoformat()
+            job.update(status="running", owner=owner, queue_position=None, updated_at=now, claimed=True)
+            self._claims[job["user"]] = now
+            return self._payloads.pop(run_id)
+
+    def last_claims(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._claims)
+
+    def reap_stale(self, max_age_s: float) -> List[str]:
+        limit = (datetime.now() - timedelta(seconds=max_age_s)).isoformat()
+        with self._lock:
+            stale = [
+                j for j in self._jobs.values()
+                if j["status"] in RUNNING_STATUSES and j.get("claimed") and (j.get("updated_at") or "") < limit
+            ]
+            for job in stale:
+                job.update(status="error", updated_at=datetime.now().isoformat())
+            return [j["run_id"] for j in stale]
+
+
+class SQLiteJobStore(JobStore):
+    """Registro en SQLite compartido entre procesos (thread-safe)."""
+
+    _FIELDS = ("status", "queue_position", "owner")
+
+    def __init__(self, db_path: Path, max_events: int = 0):
+        super().__init__(max_events)
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10)
+            # WAL: lectores concurrentes mientras otro proceso escribe eventos
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " run_id TEXT PRIMARY KEY, user TEXT, status TEXT NOT NULL,"
+                " created_at TEXT NOT NULL, updated_at TEXT NOT NULL,"
+                " queue_position INTEGER, cancel_requested INTEGER NOT NULL DEFAULT 0,"
+                " owner TEXT, result TEXT, payload TEXT, claimed_at TEXT, last_seq INTEGER)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                " run_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, ckey TEXT,"
+                " PRIMARY KEY (run_id, seq))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+            # Registros creados antes de la cola duradera y de la compactación de eventos
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("payload", "TEXT"), ("claimed_at", "TEXT"), ("last_seq", "INTEGER")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            if "ckey" not in {row[1] for row in conn.execute("PRAGMA table_info(job_events)")}:
+                conn.execute("ALTER TABLE job_events ADD COLUMN ckey TEXT")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def create(self, run_id: str, user: str, status: str = "queued",
+               payload: Optional[Dict[str, Any]] = None) -> None:
+        now = datetime.now().isoformat()
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM job_events WHERE run_id = ?", (run_id,))
+                db.execute(
+                    "INSERT OR REPLACE INTO jobs (run_id, user, status, created_at, updated_at, owner, payload)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, user, status, now, now, OWNER, _dumps(payload) if payload is not None else None),
+                )
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT run_id, user, status, created_at, updated_at, queue_position, cancel_requested, owner"
+                " FROM jobs WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("run_id", "user", "status", "created_at", "updated_at", "queue_position", "cancel_requested", "owner")
+        job = dict(zip(keys, row))
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def update(self, run_id: str, **fields: Any) -> None:
+        fields = {k: v for k, v in fields.items() if k in self._FIELDS}
+        if not fields:
+            return
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    f"UPDATE jobs SET {assignments}, updated_at = ? WHERE run_id = ?",
+                    (*fields.values(), datetime.now().isoformat(), run_id),
+                )
+        if "status" in fields:
+            self._notifier.notify(run_id)
+
+    def set_status_if(self, run_id: str, status: str, allowed: set, **fields: Any) -> bool:
+        fields = {k: v for k, v in fields.items() if k in self._FIELDS and k != "status"}
+        assignments = "".join(f", {k} = ?" for k in fields)
+        placeholders = ", ".join("?" for _ in allowed)
+        with self._lock:
+            db = self._db()
+            with db:
+                cur = db.execute(
+                    f"UPDATE jobs SET status = ?{assignments}, updated_at = ?"
+                    f" WHERE run_id = ? AND status IN ({placeholders})",
+                    (status, *fields.values(), datetime.now().isoformat(), run_id, *allowed),
+                )
+        if cur.rowcount != 1:
+            return False
+        self._notifier.notify(run_id)
+        return True
+
+    def requeue(self, run_id: str, user: str, allowed: set,
+                payload: Optional[Dict[str, Any]] = None) -> bool:
+        now = datetime.now().isoformat()
+        placeholders = ", ".join("?" for _ in allowed)
+        data = _dumps(payload) if payload is not None else None
+        with self._lock:
+            db = self._db()
+            with db:
+                # Una sola sentencia (atómica también entre procesos); REPLACE da un rowid
+                # nuevo, así el job entra al final de la cola duradera
+                cur = db.execute(
+                    "INSERT OR REPLACE INTO jobs (run_id, user, status, created_at, updated_at, owner, payload, last_seq)"
+                    " SELECT run_id, ?, 'queued', created_at, ?, ?, ?, last_seq FROM jobs"
+                    f" WHERE run_id = ? AND status IN ({placeholders})",
+                    (user, now, OWNER, data, run_id, *allowed),
+                )
+                if cur.rowcount != 1:
+                    # Sin registro (p.ej. ya purgado del historial): se crea; si existe, no se toca
+                    cur = db.execute(
+                        "INSERT OR IGNORE INTO jobs (run_id, user, status, created_at, updated_at, owner, payload)"
+                        " VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                        (run_id, user, now, now, OWNER, data),
+                    )
+        if cur.rowcount != 1:
+            return False
+        self._notifier.notify(run_id)
+        return True
+
+    def delete(self, run_id: str) -> None:
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM job_events WHERE run_id = ?", (run_id,))
+                db.execute("DELETE FROM jobs WHERE run_id = ?", (run_id,))
+
+    def append_event(self, run_id: str, event: Dict[str, Any]) -> int:
+        key = coalesce_key(event)
+        with self._lock:
+            db = self._db()
+            with db:
+                # Numeración atómica aunque otro proceso escriba a la vez: el contador del job
+                # se incrementa en la misma transacción (los borrados no reutilizan números)
+                cur = db.execute(
+                    "UPDATE jobs SET last_seq = COALESCE(last_seq,"
+                    " (SELECT COALESCE(MAX(seq), 0) FROM job_events WHERE run_id = ?)) + 1"
+                    " WHERE run_id = ?",
+                    (run_id, run_id),
+                )
+                if cur.rowcount != 1:
+                    return 0
+                seq = int(db.execute("SELECT last_seq FROM jobs WHERE run_id = ?", (run_id,)).fetchone()[0])
+                if key is not None:
+                    db.execute("DELETE FROM job_events WHERE run_id = ? AND ckey = ?", (run_id, key))
+                db.execute(
+                    "INSERT INTO job_events (run_id, seq, event, ckey) VALUES (?, ?, ?, ?)",
+                    (run_id, seq, _dumps(event), key),
+                )
+                if self.max_events:
+                    db.execute("DELETE FROM job_events WHERE run_id = ? AND seq <= ?", (run_id, seq - self.max_events))
+        self._notifier.notify(run_id)
+        return seq
+
+    def events(self, run_id: str, cursor: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        c = max(0, int(cursor or 0))
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT seq, event FROM job_events WHERE run_id = ? AND seq > ? ORDER BY seq",
+                (run_id, c),
+            ).fetchall()
+        if not rows:
+            return [], c
+        return [dict(json.loads(ev), seq=seq) for seq, ev in rows], int(rows[-1][0])
+
+    def usage(self, run_id: str) -> Dict[str, Any]:
+        with self._lock:
+            db = self._db()
+            retained, nbytes = db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(event)), 0) FROM job_events WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+            row = db.execute("SELECT last_seq, LENGTH(result) FROM jobs WHERE run_id = ?", (run_id,)).fetchone()
+        last_seq, result_bytes = row if row else (0, 0)
+        return {
+            "events_retained": int(retained),
+            "events_total": int(last_seq or retained),
+            "events_bytes": int(nbytes),
+            "result_bytes": int(result_bytes or 0),
+            "max_events": self.max_events,
+        }
+
+    def set_result(self, run_id: str, result: Any) -> None:
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("UPDATE jobs SET result = ? WHERE run_id = ?", (_dumps(result), run_id))
+
+    def result(self, run_id: str) -> Any:
+        with self._lock:
+            row = self._db().execute("SELECT result FROM jobs WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def request_cancel(self, run_id: str) -> None:
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    # Sin payload ningún worker puede reclamarlo ya
+                    "UPDATE jobs SET cancel_requested = 1, payload = NULL, updated_at = ? WHERE run_id = ?",
+                    (datetime.now().isoformat(), run_id),
+                )
+
+    def cancel_requested(self, run_id: str) -> bool:
+        with self._lock:
+            row = self._db().execute("SELECT cancel_requested FROM jobs WHERE run_id = ?", (run_id,)).fetchone()
+        return bool(row and row[0])
+
+    def prune(self, keep: int) -> int:
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        with self._lock:
+            db = self._db()
+            with db:
+                rows = db.execute(
+                    f"SELECT run_id FROM jobs WHERE status NOT IN ({placeholders})"
+                    " ORDER BY created_at DESC LIMIT -1 OFFSET ?",
+                    (*ACTIVE_STATUSES, max(0, int(keep))),
+                ).fetchall()
+                for (run_id,) in rows:
+                    db.execute("DELETE FROM job_events WHERE run_id = ?", (run_id,))
+                    db.execute("DELETE FROM jobs WHERE run_id = ?", (run_id,))
+        return len(rows)
+
+    def queued_jobs(self) -> List[QueuedRef]:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT run_id, user, rowid, queue_position FROM jobs"
+                " WHERE status = 'queued' AND payload IS NOT NULL ORDER BY rowid"
+            ).fetchall()
+        return [QueuedRef(run_id, user or "anon", seq, pos) for run_id, user, seq, pos in rows]
+
+    def running_by_user(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT user, COUNT(*) FROM jobs WHERE status IN ('running', 'cancelling') GROUP BY user"
+            ).fetchall()
+        return {user or "anon": int(n) for user, n in rows}
+
+    def reap_stale(self, max_age_s: float) -> List[str]:
+        limit = (datetime.now() - timedelta(seconds=max_age_s)).isoformat()
+        with self._lock:
+            db = self._db()
+            with db:
+                # Sólo jobs de la cola duradera (los inline no renuevan `updated_at`)
+                rows = db.execute(
+                    "SELECT run_id FROM jobs WHERE status IN ('running', 'cancelling')"
+                    " AND claimed_at IS NOT NULL AND updated_at < ?",
+                    (limit,),
+                ).fetchall()
+                for (run_id,) in rows:
+                    db.execute(
+                        "UPDATE jobs SET status = 'error', updated_at = ?"
+                        " WHERE run_id = ? AND status IN ('running', 'cancelling')",
+                        (datetime.now().isoformat(), run_id),
+                    )
+        return [run_id for (run_id,) in rows]
+
+    def last_claims(self) -> Dict[str, str]:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT user, MAX(claimed_at) FROM jobs WHERE claimed_at IS NOT NULL GROUP BY user"
+            ).fetchall()
+        return {user or "anon": claimed_at for user, claimed_at in rows}
+
+    def claim(self, run_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            db = self._db()
+            with db:
+                now = datetime.now().isoformat()
+                cur = db.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, queue_position = NULL, updated_at = ?, claimed_at = ?"
+                    " WHERE run_id = ? AND status = 'queued' AND payload IS NOT NULL",
+                    (owner, now, now, run_id),
+                )
+                if cur.rowcount != 1:
+                    return None
+                # Misma transacción: ningún otro proceso puede reclamarlo entre medias.
+                # El payload (incluye API keys) no se conserva una vez reclamado.
+                row = db.execute("SELECT payload FROM jobs WHERE run_id = ?", (run_id,)).fetchone()
+                db.execute("UPDATE jobs SET payload = NULL WHERE run_id = ?", (run_id,))
+        return json.loads(row[0]) if row and row[0] else {}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CancelFlag:
+    """
+    `cancel_check` de un job en ejecución: un Event local (cancelación inmediata en
+    este proceso) más la marca del registro, consultada como mucho cada `poll_s`
+    para que las comprobaciones frecuentes del motor no saturen la base de datos.
+    """
+
+    def __init__(self, store: JobStore, run_id: str, poll_s: float = 0.5):
+        self.store = store
+        self.run_id = run_id
+        self.poll_s = poll_s
+        self.event = threading.Event()
+        self._next_poll = 0.0
+
+    def set(self) -> None:
+        self.event.set()
+
+    def __call__(self) -> bool:
+        if self.event.is_set():
+            return True
+        now = time.monotonic()
+        if now >= self._next_poll:
+            self._next_poll = now + self.poll_s
+            try:
+                if self.store.cancel_requested(self.run_id):
+                    self.event.set()
+            except sqlite3.Error as e:
+                print(f"[WARN] No se pudo consultar la cancelación del job {self.run_id}: {e}")
+        return self.event.is_set()
+
+
+_STORE_LOCK = threading.Lock()
+_STORE: Optional[JobStore] = None
+
+
+def get_job_store() -> JobStore:
+    """Registro de jobs del proceso según JOB_CONFIG["store"] ("sqlite" o "memory")."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            kind = str(JOB_CONFIG.get("store") or "sqlite").strip().lower()
+            max_events = int(JOB_CONFIG.get("max_events") or 0)
+            if kind == "memory":
+                _STORE = MemoryJobStore(max_events)
+            else:
+                if kind != "sqlite":
+                    print(f"[WARN] JOB_STORE desconocido '{kind}': se usa sqlite")
+                db_path = JOB_CONFIG.get("db_path") or STORAGE_DIR / "jobs" / "jobs.sqlite3"
+                _STORE = SQLiteJobStore(Path(db_path), max_events)
+        return _STORE
+
+
+def close_job_store() -> None:
+    global _STORE
+    with _STORE_LOCK:
+        store, _STORE = _STORE, None
+    if store is not None:
+        store.close()
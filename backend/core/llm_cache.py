@@ -0,0 +1,202 @@
+"""
+Caché de respuestas LLM direccionada por contenido.
+
+Dos niveles:
+- Memoria: LRU (OrderedDict) con nº máximo de entradas
+- Disco: SQLite bajo STORAGE_DIR/cache, con límite de tamaño total y TTL
+
+La clave es un hash SHA-256 de (proveedor, modelo, prompt, temperatura,
+max_tokens, seed), así que dos llamadas idénticas comparten respuesta aunque
+vengan de ejecuciones distintas.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import LLM_CACHE_CONFIG, STORAGE_DIR
+
+
+class LLMResponseCache:
+    """Caché LRU en memoria + SQLite en disco (thread-safe)."""
+
+    def __init__(
+        self,
+        db_path: Path,
+        memory_max_entries: int = 256,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+        ttl_s: int = 0,
+    ):
+        self.db_path = Path(db_path)
+        self.memory_max_entries = max(0, int(memory_max_entries))
+        self.disk_max_bytes = max(0, int(disk_max_bytes))
+        # 0 = sin caducidad
+        self.ttl_s = max(0, int(ttl_s))
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._stats = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def make_key(**parts: Any) -> str:
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10)
+            # WAL permite lectores concurrentes (varios workers de uvicorn sobre el mismo fichero)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl_s) and (now - created_at) > self.ttl_s
+
+    def _remember(self, key: str, value: str, created_at: float) -> None:
+        if self.memory_max_entries <= 0:
+            return
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None:
+                value, created_at = hit
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats["hits_memory"] += 1
+                    return value
+                self._memory.pop(key, None)
+
+            try:
+                db = self._db()
+                row = db.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, created_at = row
+                    if self._expired(created_at, now):
+                        db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                        db.commit()
+                    else:
+                        db.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                        db.commit()
+                        self._remember(key, value, created_at)
+                        self._stats["hits_disk"] += 1
+                        return value
+            except sqlite3.Error as e:
+                print(f"[WARN] Caché LLM (lectura) no disponible: {e}")
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        if not isinstance(value, str) or not value:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._stats["writes"] += 1
+            try:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value.encode("utf-8")), now, now),
+                )
+                self._evict(db, now)
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"[WARN] Caché LLM (escritura) no disponible: {e}")
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        """Elimina entradas caducadas y, si se supera el tamaño, las menos usadas."""
+        if self.ttl_s:
+            cur = db.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_s,))
+            self._stats["evictions"] += max(0, cur.rowcount or 0)
+        if not self.disk_max_bytes:
+            return
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        excess = total - self.disk_max_bytes
+        freed = 0
+        victims = []
+        for k, size in db.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC"):
+            victims.append((k,))
+            freed += size
+            if freed >= excess:
+                break
+        db.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        for (k,) in victims:
+            self._memory.pop(k, None)
+        self._stats["evictions"] += len(victims)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            try:
+                db = self._db()
+                db.execute("DELETE FROM llm_cache")
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"[WARN] No se pudo vaciar la caché LLM: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["memory_entries"] = len(self._memory)
+            try:
+                count, size = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+                out["disk_entries"] = count
+                out["disk_bytes"] = size
+            except sqlite3.Error:
+                out["disk_entries"] = None
+                out["disk_bytes"] = None
+        hits = out["hits_memory"] + out["hits_disk"]
+        lookups = hits + out["misses"]
+        out["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        return out
+
+
+_CACHE_LOCK = threading.Lock()
+_CACHE: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """
+    Devuelve la caché compartida del proceso, o None si está desactivada (LLM_CACHE_ENABLED).
+    """
+    global _CACHE
+    if not LLM_CACHE_CONFIG.get("enabled"):
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = LLMResponseCache(
+                db_path=STORAGE_DIR / "cache" / "llm_cache.sqlite3",
+                memory_max_entries=int(LLM_CACHE_CONFIG.get("memory_max_entries") or 0),
+                disk_max_bytes=int(LLM_CACHE_CONFIG.get("disk_max_mb") or 0) * 1024 * 1024,
+                ttl_s=int(LLM_CACHE_CONFIG.get("ttl_s") or 0),
+            )
+        return _CACHE
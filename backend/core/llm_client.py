@@ -1,16 +1,136 @@
 """
 Cliente LLM para interactuar con diferentes proveedores de modelos de lenguaje
 """
+import asyncio
 import requests
 import json
 import re
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, Callable
 import time
 import random
+import threading
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
-from config import LLAMA_CONFIG, ANYTHINGLLM_CONFIG, HUGGINGFACE_CONFIG
+from config import LLAMA_CONFIG, ANYTHINGLLM_CONFIG, HUGGINGFACE_CONFIG, RATE_LIMIT_CONFIG
+from core.http_pool import CancelScope, get_session, get_async_client, httpx
+from core.llm_cache import get_llm_cache
+from core.llm_logger import log_llm_response
+from core.rate_limiter import estimate_tokens, get_rate_limiter
+
+
+# Rutas de AnythingLLM ya descubiertas, compartidas por todos los clientes del proceso:
+# (base_url, api_key, slug configurado) -> {"slug", "chat_url", "expires"}
+_ANYTHINGLLM_ROUTES_LOCK = threading.Lock()
+_ANYTHINGLLM_ROUTES: Dict[tuple, Dict[str, Any]] = {}
+
+# Endpoint del router de Hugging Face que respondió para cada modelo: model_id -> (url, expira)
+_HF_ENDPOINTS_LOCK = threading.Lock()
+_HF_ENDPOINTS: Dict[str, tuple] = {}
+# Metadatos del modelo que pide el chequeo de estado: sólo los proveedores que lo sirven
+_HF_MODEL_INFO_PARAMS = {"expand[]": "inferenceProviderMapping"}
+
+# Cada cuánto se consulta `cancel_check` mientras hay una llamada en curso
+_CANCEL_POLL_S = 0.1
+
+
+class LLMCancelledError(Exception):
+    """La llamada al LLM se abortó porque la ejecución se canceló (ver `LLMClient.cancel_check`)."""
+
+
+class _CancelWatcher:
+    """
+    Hilo único del proceso que vigila las llamadas cancelables en curso: cuando el
+    `cancel_check` de una se activa, corta sus conexiones (`CancelScope.cancel`) y la
+    llamada, que sigue en su propio hilo, termina al momento.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._calls: Dict[int, tuple] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, scope: CancelScope, check: Callable[[], bool]) -> None:
+        with self._lock:
+            self._calls[id(scope)] = (scope, check)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="llm-cancel-watch", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def remove(self, scope: CancelScope) -> None:
+        with self._lock:
+            self._calls.pop(id(scope), None)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._calls:
+                    self._wake.wait()
+                calls = list(self._calls.values())
+            for scope, check in calls:
+                if not scope.cancelled and check():
+                    scope.cancel()
+            time.sleep(_CANCEL_POLL_S)
+
+
+_CANCEL_WATCHER = _CancelWatcher()
+
+
+class _ThinkStreamFilter:
+    """
+    Elimina bloques <think>...</think> de un flujo de texto incremental.
+
+    Los tags pueden llegar partidos entre fragmentos ("<thi" + "nk>"), así que se
+    retiene el sufijo que todavía podría ser el inicio de un tag.
+    """
+
+    _OPEN = "<think>"
+    _CLOSE = "</think>"
+
+    def __init__(self):
+        self._buf = ""
+        self._in_think = False
+
+    @staticmethod
+    def _partial_tag_len(text: str, tag: str) -> int:
+        low = text.lower()
+        for n in range(min(len(tag) - 1, len(low)), 0, -1):
+            if low.endswith(tag[:n]):
+                return n
+        return 0
+
+    def feed(self, chunk: str) -> str:
+        self._buf += chunk or ""
+        out = []
+        while self._buf:
+            if not self._in_think:
+                idx = self._buf.lower().find(self._OPEN)
+                if idx >= 0:
+                    out.append(self._buf[:idx])
+                    self._buf = self._buf[idx + len(self._OPEN):]
+                    self._in_think = True
+                    continue
+                keep = self._partial_tag_len(self._buf, self._OPEN)
+                out.append(self._buf[: len(self._buf) - keep])
+                self._buf = self._buf[len(self._buf) - keep:]
+                break
+            idx = self._buf.lower().find(self._CLOSE)
+            if idx >= 0:
+                self._buf = self._buf[idx + len(self._CLOSE):]
+                self._in_think = False
+                continue
+            # Dentro de <think>: descartar todo salvo un posible "</thi" parcial
+            keep = self._partial_tag_len(self._buf, self._CLOSE)
+            self._buf = self._buf[len(self._buf) - keep:]
+            break
+        return "".join(out)
+
+    def flush(self) -> str:
+        rest = "" if self._in_think else self._buf
+        self._buf = ""
+        return rest
 
 
 class LLMClient:
@@ -26,8 +146,13 @@ class LLMClient:
         """
         self.provider = provider.lower()
         self.config = config or {}
-        # Timestamp monotónico para throttling entre llamadas.
-        self._last_request_ts: float = 0.0
+        # Campos añadidos a cada registro del log de respuestas (run_id, respondent...).
+        self.log_context: Dict[str, Any] = {}
+        # Contadores de la última generación según el proveedor (Ollama: prompt_eval_count, eval_count...).
+        self.last_stats: Dict[str, Any] = {}
+        # Si se asigna (p.ej. el motor con la cancelación del job), las llamadas en curso
+        # se abortan en cuanto devuelve True: la petición HTTP se cierra y se lanza LLMCancelledError.
+        self.cancel_check: Optional[Callable[[], bool]] = None
         
         if self.provider == "llama":
             self._init_llama()
@@ -58,6 +183,8 @@ class LLMClient:
             self.base_url = (self.config.get("base_url") or ANYTHINGLLM_CONFIG["base_url"]).strip()
             self.api_key = (self.config.get("api_key") or ANYTHINGLLM_CONFIG.get("api_key", "") or "").strip()
             self.workspace_slug = (self.config.get("workspace_slug") or ANYTHINGLLM_CONFIG.get("workspace_slug", "") or "").strip()
+            # `workspace_slug` puede normalizarse al resolverlo; el configurado identifica la ruta cacheada
+            self._configured_workspace_slug = self.workspace_slug
             self.mode = (self.config.get("mode") or ANYTHINGLLM_CONFIG.get("mode") or "query").strip().lower()
             self.min_delay_ms = int(self.config.get("min_delay_ms") or ANYTHINGLLM_CONFIG.get("min_delay_ms") or 0)
             self.max_retries = int(self.config.get("max_retries") or ANYTHINGLLM_CONFIG.get("max_retries") or 0)
@@ -69,28 +196,136 @@ class LLMClient:
         else:
             raise ValueError(f"Proveedor LLM no soportado: {llama_provider}")
 
-    def _maybe_throttle(self) -> None:
+    def _rate_limiter(self):
         """
-        Inserta una pausa mínima entre llamadas para evitar rate limits por ráfagas.
+        Limitador compartido del endpoint de este cliente (ver core/rate_limiter.py).
+        Lo comparten todos los LLMClient del proceso, así que el espaciado entre
+        llamadas se respeta entre respondientes y entre jobs concurrentes.
         """
-        ms = int(getattr(self, "min_delay_ms", 0) or 0)
-        if ms <= 0:
+        provider = getattr(self, "llama_provider", self.provider)
+        rps = self.config.get("rate_limit_rps")
+        if rps is None:
+            rps = (RATE_LIMIT_CONFIG.get(provider) or {}).get("rps", 0)
+        rps = float(rps or 0)
+        if rps <= 0:
+            # Compatibilidad: min_delay_ms equivale a 1 petición cada min_delay_ms
+            ms = int(getattr(self, "min_delay_ms", 0) or 0)
+            rps = 1000.0 / ms if ms > 0 else 0.0
+        return get_rate_limiter(
+            provider,
+            getattr(self, "base_url", "") or "",
+            rps=rps,
+            tokens_per_min=self.config.get("rate_limit_tpm"),
+        )
+
+    def _maybe_throttle(self, prompt: str = "") -> None:
+        """
+        Espera turno en el limitador compartido para evitar rate limits por ráfagas.
+        """
+        cancel_check = self._cancel_requested if self.cancel_check is not None else None
+        self._rate_limiter().acquire(estimate_tokens(prompt), cancel_check=cancel_check)
+        self._raise_if_cancelled()
+
+    async def _amaybe_throttle(self, prompt: str = "") -> None:
+        """Versión async de `_maybe_throttle` (no bloquea el event loop)."""
+        await self._rate_limiter().aacquire(estimate_tokens(prompt))
+
+    def _penalize_rate_limit(self, retry_after: Optional[str] = None) -> float:
+        """
+        Tras un 429, bloquea el endpoint para todos los clientes (Retry-After o backoff por defecto).
+        """
+        try:
+            seconds = float(retry_after) if retry_after else 0.0
+        except (TypeError, ValueError):
+            seconds = 0.0
+        if seconds <= 0:
+            seconds = float(RATE_LIMIT_CONFIG.get("backoff_429_s") or 0)
+        self._rate_limiter().penalize(seconds)
+        return seconds
+
+    def _cancel_requested(self) -> bool:
+        check = self.cancel_check
+        if check is None:
+            return False
+        try:
+            return bool(check())
+        except Exception:
+            return False
+
+    def _raise_if_cancelled(self) -> None:
+        if self._cancel_requested():
+            raise LLMCancelledError("Llamada al LLM cancelada.")
+
+    def _iter_cancellable(self, make_source: Callable[[], Any]) -> Iterator[Any]:
+        """
+        Itera `make_source()` en el hilo actual de forma cancelable: sus conexiones HTTP
+        quedan en un `CancelScope` y `_CANCEL_WATCHER` las corta en cuanto se activa
+        `cancel_check` (también mientras se espera la respuesta, p.ej. durante la
+        evaluación del prompt). La llamada termina entonces con LLMCancelledError.
+        Sin `cancel_check` itera directamente.
+        """
+        if self.cancel_check is None:
+            yield from make_source()
             return
-        now = time.monotonic()
-        elapsed = now - float(getattr(self, "_last_request_ts", 0.0) or 0.0)
-        wait_s = (ms / 1000.0) - elapsed
-        if wait_s > 0:
-            time.sleep(wait_s)
-        self._last_request_ts = time.monotonic()
-    
+        self._raise_if_cancelled()
+        scope = CancelScope()
+        _CANCEL_WATCHER.add(scope, self._cancel_requested)
+        source: Optional[Iterator[Any]] = None
+        try:
+            while True:
+                try:
+                    with scope.active():
+                        if source is None:
+                            source = iter(make_source())
+                        item = next(source)
+                except StopIteration:
+                    return
+                except LLMCancelledError:
+                    raise
+                except Exception:
+                    if scope.cancelled:
+                        raise LLMCancelledError("Llamada al LLM cancelada.") from None
+                    raise
+                self._raise_if_cancelled()
+                yield item
+        finally:
+            _CANCEL_WATCHER.remove(scope)
+            close = getattr(source, "close", None)
+            if close is not None:
+                # Un stream abandonado a medias cierra aquí su conexión
+                close()
+
+    def _call_cancellable(self, fn: Callable[..., str], *args, **kwargs) -> str:
+        """Ejecuta una llamada bloqueante con `_iter_cancellable` y devuelve su resultado."""
+        for value in self._iter_cancellable(lambda: [fn(*args, **kwargs)]):
+            return value
+        return ""
+
+    def _http(self, url: Optional[str] = None) -> requests.Session:
+        """
+        Sesión HTTP compartida (pool keep-alive) para el host de `url` o de `base_url`.
+        """
+        provider = getattr(self, "llama_provider", self.provider)
+        return get_session(provider, url or getattr(self, "base_url", "") or "")
+
+    def _ahttp(self, url: Optional[str] = None) -> "httpx.AsyncClient":
+        """Cliente HTTP asíncrono compartido (pool keep-alive por event loop)."""
+        provider = getattr(self, "llama_provider", self.provider)
+        return get_async_client(provider, url or getattr(self, "base_url", "") or "")
+
     def _get_available_model(self, preferred_model: str) -> str:
         """Intenta obtener el modelo preferido o el primero disponible"""
         try:
-            url = f"{self.base_url}/api/tags"
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            models_data = response.json()
-            available_models = [model.get("name", "") for model in models_data.get("models", [])]
+            # Lista del último sondeo en segundo plano; sólo se consulta /api/tags si no hay dato.
+            from core.health_monitor import get_cached_models
+
+            available_models = get_cached_models(self.base_url)
+            if available_models is None:
+                url = f"{self.base_url}/api/tags"
+                response = self._http().get(url, timeout=5)
+                response.raise_for_status()
+                models_data = response.json()
+                available_models = [model.get("name", "") for model in models_data.get("models", [])]
             
             if available_models:
                 # Si el modelo preferido está disponible, usarlo
@@ -123,9 +358,70 @@ class LLMClient:
         Returns:
             Respuesta del modelo como string
         """
-        # Throttling global por instancia (aplica a cualquier proveedor).
-        self._maybe_throttle()
+        # Etapa del pipeline (perfil, survey, sintesis...): sólo se usa en el log.
+        stage = kwargs.pop("stage", None)
+        self.last_stats = {}
+        cache_key = self._cache_key(prompt, temperature, max_tokens, kwargs.get("seed"))
+        if cache_key:
+            cached = get_llm_cache().get(cache_key)
+            if cached is not None:
+                return cached
+
+        # Throttling compartido por endpoint (aplica a cualquier proveedor).
+        self._maybe_throttle(prompt)
+        
+        started = time.monotonic()
+        response_text = self._call_cancellable(self._generate_raw, prompt, temperature, max_tokens, **kwargs)
         
+        self._log_raw_response(prompt, response_text, time.monotonic() - started, stage)
+        self._rate_limiter().record_usage(estimate_tokens(response_text))
+
+        # Limpiar razonamiento (tags <think>...</think>) si existen
+        text = self._clean_reasoning(response_text)
+        if cache_key:
+            get_llm_cache().put(cache_key, text)
+        return text
+
+    def _cache_key(self, prompt: str, temperature: Optional[float], max_tokens: Optional[int],
+                   seed: Optional[int] = None) -> Optional[str]:
+        """
+        Clave de caché para esta llamada, o None si la caché está desactivada
+        (globalmente o para esta ejecución vía `cache_bypass`).
+        """
+        cache = get_llm_cache()
+        if cache is None or self.config.get("cache_bypass") or self.provider != "llama":
+            return None
+        provider = getattr(self, "llama_provider", "ollama")
+        if provider == "anythingllm":
+            # AnythingLLM no expone el modelo: lo identifica el workspace
+            model = f"{getattr(self, 'base_url', '')}|{getattr(self, 'workspace_slug', '')}|{getattr(self, 'mode', '')}"
+            defaults: Dict[str, Any] = {}
+        elif provider == "huggingface":
+            model = getattr(self, "model", "")
+            defaults = HUGGINGFACE_CONFIG
+        else:
+            model = getattr(self, "model", "")
+            defaults = LLAMA_CONFIG
+        return cache.make_key(
+            provider=provider,
+            model=model,
+            prompt=prompt,
+            temperature=temperature if temperature is not None else self.config.get("temperature", defaults.get("temperature")),
+            max_tokens=max_tokens if max_tokens is not None else self.config.get("max_tokens", defaults.get("max_tokens")),
+            seed=self._seed(seed),
+        )
+
+    def _seed(self, seed: Optional[int] = None) -> Optional[int]:
+        """Seed explícita de la llamada o, si no hay, la de la configuración del cliente."""
+        value = seed if seed is not None else self.config.get("seed")
+        try:
+            return int(value) if value is not None and str(value).strip() != "" else None
+        except (TypeError, ValueError):
+            return None
+
+    def _generate_raw(self, prompt: str, temperature: Optional[float] = None,
+                      max_tokens: Optional[int] = None, **kwargs) -> str:
+        """Despacha al proveedor y devuelve la respuesta cruda (sin limpiar)."""
         response_text = ""
         if self.provider == "llama":
             provider = getattr(self, "llama_provider", "ollama")
@@ -137,27 +433,111 @@ class LLMClient:
                 response_text = self._generate_llama(prompt, temperature, max_tokens, **kwargs)
         elif self.provider == "chatgpt":
             response_text = self._generate_chatgpt(prompt, temperature, max_tokens, **kwargs)
-        
-        # LOG DE DEPURACIÓN: Guardar la respuesta cruda para analizar por qué falla el filtrado
-        try:
-            from config import STORAGE_DIR
-            log_dir = STORAGE_DIR / "logs"
-            log_dir.mkdir(parents=True, exist_ok=True)
-            log_file = log_dir / "raw_llm_responses.log"
-            with open(log_file, "a", encoding="utf-8") as f:
-                import datetime
-                timestamp = datetime.datetime.now().isoformat()
-                f.write(f"\n{'='*50}\n")
-                f.write(f"TIMESTAMP: {timestamp}\n")
-                f.write(f"PROVIDER: {self.provider}\n")
-                f.write(f"PROMPT (primeros 100 caracteres): {prompt[:100]}...\n")
-                f.write(f"RAW RESPONSE:\n{response_text}\n")
-                f.write(f"{'='*50}\n")
-        except Exception as e:
-            print(f"Error al escribir log de LLM: {e}")
+        return response_text
 
-        # Limpiar razonamiento (tags <think>...</think>) si existen
-        return self._clean_reasoning(response_text)
+    def generate_stream(self, prompt: str, temperature: Optional[float] = None,
+                        max_tokens: Optional[int] = None, **kwargs):
+        """
+        Genera texto en streaming.
+
+        Emite los fragmentos visibles según llegan (ya sin bloques <think>) y, al
+        agotarse, devuelve (StopIteration.value) el texto final limpio, igual que `generate`.
+        Ollama se lee token a token (NDJSON); el resto de proveedores emiten la
+        respuesta completa en un único fragmento.
+        """
+        stage = kwargs.pop("stage", None)
+        self.last_stats = {}
+        cache_key = self._cache_key(prompt, temperature, max_tokens, kwargs.get("seed"))
+        if cache_key:
+            cached = get_llm_cache().get(cache_key)
+            if cached is not None:
+                if cached:
+                    yield cached
+                return cached
+
+        self._maybe_throttle(prompt)
+
+        started = time.monotonic()
+        if self.provider == "llama" and getattr(self, "llama_provider", "ollama") == "ollama":
+            source: Iterator[str] = self._iter_cancellable(lambda: self._stream_llama(prompt, temperature, max_tokens, **kwargs))
+        else:
+            source = iter([self._call_cancellable(self._generate_raw, prompt, temperature, max_tokens, **kwargs)])
+
+        think_filter = _ThinkStreamFilter()
+        raw_parts = []
+        for chunk in source:
+            raw_parts.append(chunk)
+            visible = think_filter.feed(chunk)
+            if visible:
+                yield visible
+        tail = think_filter.flush()
+        if tail:
+            yield tail
+
+        response_text = "".join(raw_parts)
+        self._log_raw_response(prompt, response_text, time.monotonic() - started, stage)
+        self._rate_limiter().record_usage(estimate_tokens(response_text))
+        text = self._clean_reasoning(response_text)
+        if cache_key:
+            get_llm_cache().put(cache_key, text)
+        return text
+
+    async def agenerate(self, prompt: str, temperature: Optional[float] = None,
+                        max_tokens: Optional[int] = None, **kwargs) -> str:
+        """
+        Versión asíncrona de `generate`: mismo despacho por proveedor, throttling,
+        fallback de AnythingLLM y limpieza de <think>, sobre un cliente HTTP async.
+        Permite lanzar muchas llamadas concurrentes desde un único event loop.
+        """
+        stage = kwargs.pop("stage", None)
+        self.last_stats = {}
+        cache_key = self._cache_key(prompt, temperature, max_tokens, kwargs.get("seed"))
+        if cache_key:
+            cached = await asyncio.to_thread(get_llm_cache().get, cache_key)
+            if cached is not None:
+                return cached
+
+        await self._amaybe_throttle(prompt)
+
+        started = time.monotonic()
+        response_text = ""
+        if self.provider == "llama":
+            provider = getattr(self, "llama_provider", "ollama")
+            if provider == "anythingllm":
+                response_text = await self._agenerate_anythingllm(prompt, **kwargs)
+            elif provider == "huggingface":
+                response_text = await self._agenerate_huggingface(prompt, temperature, max_tokens, **kwargs)
+            else:
+                response_text = await self._agenerate_llama(prompt, temperature, max_tokens, **kwargs)
+        elif self.provider == "chatgpt":
+            response_text = self._generate_chatgpt(prompt, temperature, max_tokens, **kwargs)
+
+        # Sólo encola el registro: la escritura a disco ocurre en segundo plano.
+        self._log_raw_response(prompt, response_text, time.monotonic() - started, stage)
+        self._rate_limiter().record_usage(estimate_tokens(response_text))
+
+        text = self._clean_reasoning(response_text)
+        if cache_key:
+            await asyncio.to_thread(get_llm_cache().put, cache_key, text)
+        return text
+
+    def _log_raw_response(self, prompt: str, response_text: str,
+                          latency_s: Optional[float] = None, stage: Optional[str] = None) -> None:
+        """
+        LOG DE DEPURACIÓN: registra la respuesta cruda (JSONL rotado, ver core/llm_logger.py)
+        para analizar por qué falla el filtrado.
+        """
+        provider = getattr(self, "llama_provider", self.provider) if self.provider == "llama" else self.provider
+        model = getattr(self, "model", None) or getattr(self, "workspace_slug", None)
+        log_llm_response(
+            prompt,
+            response_text,
+            provider=provider,
+            model=model,
+            latency_s=latency_s,
+            context=self.log_context,
+            stage=stage,
+        )
 
     def _clean_reasoning(self, text: str) -> str:
         """
@@ -196,9 +576,9 @@ class LLMClient:
 
         return text.strip()
     
-    def _generate_llama(self, prompt: str, temperature: Optional[float] = None,
-                       max_tokens: Optional[int] = None, **kwargs) -> str:
-        """Genera texto usando LLaMA vía Ollama"""
+    def _llama_request(self, prompt: str, temperature: Optional[float] = None,
+                       max_tokens: Optional[int] = None, seed: Optional[int] = None) -> tuple[str, Dict[str, Any]]:
+        """Construye (url, payload) para /api/generate de Ollama"""
         # Usar valores por defecto si no se proporcionan
         temp = temperature if temperature is not None else self.config.get("temperature", LLAMA_CONFIG["temperature"])
         max_tok = max_tokens if max_tokens is not None else self.config.get("max_tokens", LLAMA_CONFIG["max_tokens"])
@@ -214,77 +594,294 @@ class LLMClient:
                 "num_predict": max_tok
             }
         }
-        
+        seed = self._seed(seed)
+        if seed is not None:
+            # Generación reproducible: misma seed + mismo prompt => misma respuesta
+            payload["options"]["seed"] = seed
+        keep_alive = self._keep_alive()
+        if keep_alive is not None:
+            # Evita que Ollama descargue el modelo entre respondientes
+            payload["keep_alive"] = keep_alive
+        return url, payload
+
+    def _keep_alive(self) -> Optional[Any]:
+        value = self.config.get("keep_alive")
+        if value is None:
+            value = LLAMA_CONFIG.get("keep_alive")
+        return self._parse_keep_alive(value)
+
+    @staticmethod
+    def _parse_keep_alive(value: Any) -> Optional[Any]:
+        if value is None or str(value).strip() == "":
+            return None
+        # Ollama acepta duraciones ("30m") o segundos como número (-1 = indefinido)
         try:
-            response = requests.post(url, json=payload, timeout=300)
+            return int(str(value).strip())
+        except ValueError:
+            return str(value).strip()
+
+    def _ollama_load_request(self, keep_alive: Optional[Any]) -> tuple[str, Dict[str, Any]]:
+        """
+        (url, payload) para cargar/descargar el modelo en Ollama sin generar nada:
+        un prompt vacío sólo carga el modelo; keep_alive=0 lo descarga.
+        """
+        payload: Dict[str, Any] = {"model": self.model, "prompt": "", "stream": False}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return f"{self.base_url}/api/generate", payload
+
+    def preload_model(self, keep_alive: Optional[Any] = None) -> Dict[str, Any]:
+        """
+        Carga el modelo de Ollama en memoria (keep_alive de la config si no se indica).
+        Devuelve {"status", "model", "load_duration_s"}.
+        """
+        if getattr(self, "llama_provider", None) != "ollama":
+            return {"status": "skipped", "message": "La precarga sólo aplica a Ollama"}
+        keep_alive = self._parse_keep_alive(keep_alive)
+        url, payload = self._ollama_load_request(keep_alive if keep_alive is not None else self._keep_alive())
+        try:
+            response = self._http().post(url, json=payload, timeout=300)
+            response.raise_for_status()
+            data = response.json() if response.content else {}
+        except requests.exceptions.RequestException as e:
+            return {"status": "error", "model": self.model, "message": f"No se pudo precargar el modelo: {e}"}
+        return {
+            "status": "loaded",
+            "model": self.model,
+            # Ollama informa en nanosegundos
+            "load_duration_s": round(float(data.get("load_duration") or 0) / 1e9, 3),
+        }
+
+    def unload_model(self) -> Dict[str, Any]:
+        """Descarga el modelo de Ollama de memoria (keep_alive=0)."""
+        if getattr(self, "llama_provider", None) != "ollama":
+            return {"status": "skipped", "message": "La descarga sólo aplica a Ollama"}
+        url, payload = self._ollama_load_request(0)
+        try:
+            response = self._http().post(url, json=payload, timeout=60)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            return {"status": "error", "model": self.model, "message": f"No se pudo descargar el modelo: {e}"}
+        return {"status": "unloaded", "model": self.model}
+
+    def _generate_llama(self, prompt: str, temperature: Optional[float] = None,
+                       max_tokens: Optional[int] = None, **kwargs) -> str:
+        """Genera texto usando LLaMA vía Ollama"""
+        if self.cancel_check is not None:
+            # En streaming la conexión se puede cerrar a mitad de generación (Ollama la aborta)
+            return "".join(self._stream_llama(prompt, temperature, max_tokens, **kwargs))
+        url, payload = self._llama_request(prompt, temperature, max_tokens, kwargs.get("seed"))
+        try:
+            response = self._http().post(url, json=payload, timeout=300)
             response.raise_for_status()
             result = response.json()
+            self._store_ollama_stats(result)
             return result.get("response", "")
         except requests.exceptions.RequestException as e:
             raise Exception(f"Error al generar con LLaMA: {str(e)}")
 
-    def _generate_huggingface(self, prompt: str, temperature: Optional[float] = None,
-                             max_tokens: Optional[int] = None, **kwargs) -> str:
-        """Genera texto usando Hugging Face Inference API"""
-        temp = temperature if temperature is not None else self.config.get("temperature", HUGGINGFACE_CONFIG["temperature"])
-        max_tok = max_tokens if max_tokens is not None else self.config.get("max_tokens", HUGGINGFACE_CONFIG["max_tokens"])
-        
-        model_id = self.model.strip()
-        headers = {
+    def _stream_llama(self, prompt: str, temperature: Optional[float] = None,
+                      max_tokens: Optional[int] = None, **kwargs) -> Iterator[str]:
+        """Lee la respuesta de Ollama incrementalmente (NDJSON, una línea por fragmento)"""
+        url, payload = self._llama_request(prompt, temperature, max_tokens, kwargs.get("seed"))
+        payload["stream"] = True
+        try:
+            # timeout=(conexión, entre fragmentos): un fragmento tarda mucho menos que la respuesta completa
+            with self._http().post(url, json=payload, stream=True, timeout=(10, 300)) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    # Salir del `with` cierra la conexión: Ollama deja de generar y libera el slot
+                    self._raise_if_cancelled()
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise Exception(str(data.get("error")))
+                    chunk = data.get("response") or ""
+                    if chunk:
+                        yield chunk
+                    if data.get("done"):
+                        self._store_ollama_stats(data)
+                        break
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"Error al generar con LLaMA: {str(e)}")
+
+    _OLLAMA_STATS_KEYS = (
+        "prompt_eval_count", "prompt_eval_duration", "eval_count",
+        "eval_duration", "load_duration", "total_duration",
+    )
+
+    def _store_ollama_stats(self, result: Dict[str, Any]) -> None:
+        """
+        Guarda los contadores de la respuesta final de Ollama en `last_stats`.
+        `prompt_eval_count` sólo cuenta los tokens del prompt evaluados de nuevo: si el
+        servidor reutiliza la caché KV de un prefijo común, baja respecto al tamaño del prompt.
+        """
+        self.last_stats = {k: result[k] for k in self._OLLAMA_STATS_KEYS if isinstance(result.get(k), (int, float))}
+
+    async def _agenerate_llama(self, prompt: str, temperature: Optional[float] = None,
+                               max_tokens: Optional[int] = None, **kwargs) -> str:
+        """Versión async de `_generate_llama`"""
+        url, payload = self._llama_request(prompt, temperature, max_tokens, kwargs.get("seed"))
+        try:
+            response = await self._ahttp().post(url, json=payload, timeout=300)
+            response.raise_for_status()
+            result = response.json()
+            self._store_ollama_stats(result)
+            return result.get("response", "")
+        except httpx.HTTPError as e:
+            raise Exception(f"Error al generar con LLaMA: {str(e)}")
+
+    def _huggingface_headers(self) -> Dict[str, str]:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
+
+    @staticmethod
+    def _huggingface_urls(model_id: str) -> list[str]:
         # Intentamos el endpoint v1 (OpenAI compatible) que es el recomendado por HF
         # Algunas variantes usan el model_id en la URL incluso para v1
-        urls_to_try = [
+        return [
             f"https://router.huggingface.co/models/{model_id}/v1/chat/completions",
             "https://router.huggingface.co/v1/chat/completions",
             f"https://router.huggingface.co/models/{model_id}"
         ]
+
+    def _huggingface_candidate_urls(self, model_id: str) -> list[str]:
+        """
+        URLs a probar para el modelo: la que ya funcionó (si se recuerda) va primero,
+        así la mayoría de llamadas no pagan los intentos fallidos (410, formato...).
+        """
+        urls = self._huggingface_urls(model_id)
+        with _HF_ENDPOINTS_LOCK:
+            known = _HF_ENDPOINTS.get(model_id)
+            if known and known[1] <= time.monotonic():
+                _HF_ENDPOINTS.pop(model_id, None)
+                known = None
+        if known and known[0] in urls:
+            urls.remove(known[0])
+            urls.insert(0, known[0])
+        return urls
+
+    @staticmethod
+    def _note_huggingface_endpoint(model_id: str, url: str, ok: bool) -> None:
+        """Recuerda la URL que respondió bien; si la recordada falla, se olvida."""
+        ttl = int(HUGGINGFACE_CONFIG.get("endpoint_cache_ttl_s") or 0)
+        with _HF_ENDPOINTS_LOCK:
+            if ok:
+                if ttl > 0:
+                    _HF_ENDPOINTS[model_id] = (url, time.monotonic() + ttl)
+            elif _HF_ENDPOINTS.get(model_id, (None,))[0] == url:
+                _HF_ENDPOINTS.pop(model_id, None)
+
+    @staticmethod
+    def _huggingface_payload(url: str, model_id: str, prompt: str, temp: float, max_tok: int) -> Dict[str, Any]:
+        if "/v1/chat/completions" in url:
+            return {
+                "model": model_id,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": max_tok,
+                "temperature": max(0.1, temp),
+                "stream": False
+            }
+        return {
+            "inputs": prompt,
+            "parameters": {"max_new_tokens": max_tok, "temperature": max(0.1, temp)},
+            "options": {"wait_for_model": True}
+        }
+
+    @staticmethod
+    def _parse_huggingface_result(result: Any) -> str:
+        if isinstance(result, dict) and "choices" in result:
+            return result["choices"][0]["message"]["content"]
+        if isinstance(result, list) and len(result) > 0:
+            return result[0].get("generated_text", "")
+        if isinstance(result, dict) and "generated_text" in result:
+            return result["generated_text"]
+        return str(result)
+
+    def _huggingface_params(self, temperature: Optional[float], max_tokens: Optional[int]) -> tuple[float, int]:
+        temp = temperature if temperature is not None else self.config.get("temperature", HUGGINGFACE_CONFIG["temperature"])
+        max_tok = max_tokens if max_tokens is not None else self.config.get("max_tokens", HUGGINGFACE_CONFIG["max_tokens"])
+        return temp, max_tok
+
+    def _generate_huggingface(self, prompt: str, temperature: Optional[float] = None,
+                             max_tokens: Optional[int] = None, **kwargs) -> str:
+        """Genera texto usando Hugging Face Inference API"""
+        temp, max_tok = self._huggingface_params(temperature, max_tokens)
+        model_id = self.model.strip()
+        headers = self._huggingface_headers()
         
         last_error = ""
-        for url in urls_to_try:
+        for url in self._huggingface_candidate_urls(model_id):
+            self._raise_if_cancelled()
             try:
-                if "/v1/chat/completions" in url:
-                    payload = {
-                        "model": model_id,
-                        "messages": [{"role": "user", "content": prompt}],
-                        "max_tokens": max_tok,
-                        "temperature": max(0.1, temp),
-                        "stream": False
-                    }
-                else:
-                    payload = {
-                        "inputs": prompt,
-                        "parameters": {"max_new_tokens": max_tok, "temperature": max(0.1, temp)},
-                        "options": {"wait_for_model": True}
-                    }
-                
-                response = requests.post(url, headers=headers, json=payload, timeout=120)
+                payload = self._huggingface_payload(url, model_id, prompt, temp, max_tok)
+                response = self._http(url).post(url, headers=headers, json=payload, timeout=120)
                 
                 if response.status_code == 200:
-                    result = response.json()
-                    if isinstance(result, dict) and "choices" in result:
-                        return result["choices"][0]["message"]["content"]
-                    if isinstance(result, list) and len(result) > 0:
-                        return result[0].get("generated_text", "")
-                    if isinstance(result, dict) and "generated_text" in result:
-                        return result["generated_text"]
-                    return str(result)
+                    self._note_huggingface_endpoint(model_id, url, ok=True)
+                    return self._parse_huggingface_result(response.json())
+                if response.status_code not in (429, 503):
+                    # 429/503 (cuota, modelo cargando) no invalidan el endpoint
+                    self._note_huggingface_endpoint(model_id, url, ok=False)
                 
                 last_error = f"HTTP {response.status_code}: {response.text}"
+                if response.status_code == 429:
+                    # Cuota agotada: frenar a todos los clientes de este endpoint
+                    self._penalize_rate_limit(response.headers.get("Retry-After"))
+                    raise Exception(f"Hugging Face rate limit (429): {response.text[:200]}")
                 if response.status_code == 410:
                     continue # Intentar siguiente URL
                 if response.status_code == 403:
                     raise Exception(f"Acceso denegado (403). Verifica si el modelo '{model_id}' es privado o requiere permisos.")
                 
             except requests.exceptions.RequestException as e:
+                # Conexión cortada por una cancelación: el endpoint no ha fallado
+                self._raise_if_cancelled()
+                self._note_huggingface_endpoint(model_id, url, ok=False)
                 last_error = str(e)
                 continue
         
         raise Exception(f"Hugging Face: No se pudo conectar con el modelo '{model_id}'. Último error: {last_error}")
 
+    async def _agenerate_huggingface(self, prompt: str, temperature: Optional[float] = None,
+                                     max_tokens: Optional[int] = None, **kwargs) -> str:
+        """Versión async de `_generate_huggingface`"""
+        temp, max_tok = self._huggingface_params(temperature, max_tokens)
+        model_id = self.model.strip()
+        headers = self._huggingface_headers()
+
+        last_error = ""
+        for url in self._huggingface_candidate_urls(model_id):
+            try:
+                payload = self._huggingface_payload(url, model_id, prompt, temp, max_tok)
+                response = await self._ahttp(url).post(url, headers=headers, json=payload, timeout=120)
+
+                if response.status_code == 200:
+                    self._note_huggingface_endpoint(model_id, url, ok=True)
+                    return self._parse_huggingface_result(response.json())
+                if response.status_code not in (429, 503):
+                    # 429/503 (cuota, modelo cargando) no invalidan el endpoint
+                    self._note_huggingface_endpoint(model_id, url, ok=False)
+
+                last_error = f"HTTP {response.status_code}: {response.text}"
+                if response.status_code == 429:
+                    self._penalize_rate_limit(response.headers.get("Retry-After"))
+                    raise Exception(f"Hugging Face rate limit (429): {response.text[:200]}")
+                if response.status_code == 410:
+                    continue
+                if response.status_code == 403:
+                    raise Exception(f"Acceso denegado (403). Verifica si el modelo '{model_id}' es privado o requiere permisos.")
+
+            except httpx.HTTPError as e:
+                self._note_huggingface_endpoint(model_id, url, ok=False)
+                last_error = str(e)
+                continue
+
+        raise Exception(f"Hugging Face: No se pudo conectar con el modelo '{model_id}'. Último error: {last_error}")
+
     def _anythingllm_headers(self) -> Dict[str, str]:
         headers = {"Content-Type": "application/json"}
         token = (getattr(self, "api_key", "") or "").strip()
@@ -331,97 +928,336 @@ class LLMClient:
                 f"{base}/api/v1/workspace/{slug}/chat",
                 f"{base}/v1/workspace/{slug}/chat",
             ])
-        return list(dict.fromkeys(urls))
+        urls = list(dict.fromkeys(urls))
+        # La variante que ya respondió antes va primero (evita pagar los 404 de las demás)
+        known = (self._anythingllm_route() or {}).get("chat_url")
+        if known in urls:
+            urls.remove(known)
+            urls.insert(0, known)
+        return urls
 
-    def _resolve_anythingllm_workspace_slug(self, force: bool = False) -> Optional[str]:
-        """
-        Resuelve un workspace slug para AnythingLLM.
+    def _anythingllm_route_key(self) -> tuple:
+        return (
+            (getattr(self, "base_url", "") or "").strip().rstrip("/"),
+            getattr(self, "api_key", "") or "",
+            getattr(self, "_configured_workspace_slug", "") or "",
+        )
 
-        - Si ya viene configurado, se usa tal cual.
-        - Si está vacío, intentamos autodetectar el primer workspace vía API.
-          (Requiere normalmente API key con permisos suficientes.)
+    def _anythingllm_route(self) -> Optional[Dict[str, Any]]:
+        """Ruta recordada (slug / URL de chat) para este servidor y API key, si no ha caducado."""
+        with _ANYTHINGLLM_ROUTES_LOCK:
+            route = _ANYTHINGLLM_ROUTES.get(self._anythingllm_route_key())
+            if route is None:
+                return None
+            if route["expires"] <= time.monotonic():
+                _ANYTHINGLLM_ROUTES.pop(self._anythingllm_route_key(), None)
+                return None
+            return dict(route)
+
+    def _remember_anythingllm_route(self, **fields: Any) -> None:
+        ttl = int(ANYTHINGLLM_CONFIG.get("route_cache_ttl_s") or 0)
+        if ttl <= 0:
+            return
+        with _ANYTHINGLLM_ROUTES_LOCK:
+            route = _ANYTHINGLLM_ROUTES.setdefault(self._anythingllm_route_key(), {})
+            route.update(fields)
+            route["expires"] = time.monotonic() + ttl
+
+    def _forget_anythingllm_route(self, chat_url_only: bool = False) -> None:
+        with _ANYTHINGLLM_ROUTES_LOCK:
+            key = self._anythingllm_route_key()
+            if chat_url_only and key in _ANYTHINGLLM_ROUTES:
+                _ANYTHINGLLM_ROUTES[key].pop("chat_url", None)
+            else:
+                _ANYTHINGLLM_ROUTES.pop(key, None)
+
+    def _anythingllm_note_chat_result(self, url: str, status_code: int, kind: str) -> None:
         """
-        slug = (getattr(self, "workspace_slug", "") or "").strip()
+        Actualiza la ruta recordada tras una llamada de chat: se guarda la URL que
+        respondió y sólo se invalida ante 404 (URL/slug ya no válidos) o 401/403 (credenciales).
+        """
+        if kind == "ok":
+            self._remember_anythingllm_route(slug=getattr(self, "workspace_slug", ""), chat_url=url)
+        elif status_code in (401, 403):
+            self._forget_anythingllm_route()
+        elif status_code == 404 and (self._anythingllm_route() or {}).get("chat_url") == url:
+            self._forget_anythingllm_route(chat_url_only=True)
+
+    def _cached_anythingllm_slug(self, force: bool) -> Optional[str]:
+        """Slug ya resuelto (sin llamadas HTTP). Con `force` se descarta y se vuelve a resolver."""
+        if force:
+            self._forget_anythingllm_route()
+            return None
+        slug = (self._anythingllm_route() or {}).get("slug")
+        if slug:
+            self.workspace_slug = slug
+        return slug or None
 
+    def _anythingllm_workspace_urls(self) -> list[str]:
+        urls: list[str] = []
         for base in self._anythingllm_base_variants():
-            candidate_urls = [
+            urls.extend([
                 f"{base}/api/v1/workspaces",
                 f"{base}/v1/workspaces",
                 f"{base}/api/v1/workspace",
                 f"{base}/v1/workspace",
                 f"{base}/api/workspaces",
                 f"{base}/api/workspace",
-            ]
+            ])
+        return urls
 
-            for url in candidate_urls:
-                try:
-                    resp = requests.get(url, headers=self._anythingllm_headers(), timeout=8)
-                    if resp.status_code == 404:
-                        continue
-                    resp.raise_for_status()
-                    data = resp.json() if resp.content else None
-
-                    # Formatos típicos: { "workspaces": [ { "slug": "..." }, ... ] } o lista directa
-                    workspaces = None
-                    if isinstance(data, dict):
-                        if isinstance(data.get("workspaces"), list):
-                            workspaces = data.get("workspaces")
-                        elif isinstance(data.get("data"), list):
-                            workspaces = data.get("data")
-                    elif isinstance(data, list):
-                        workspaces = data
-
-                    if not isinstance(workspaces, list) or not workspaces:
-                        continue
+    def _pick_anythingllm_workspace_slug(self, data: Any, force: bool) -> Optional[str]:
+        """
+        Elige un slug a partir del listado de workspaces devuelto por la API.
+        Devuelve None si el listado no sirve (se probará el siguiente endpoint).
+        """
+        slug = (getattr(self, "workspace_slug", "") or "").strip()
 
-                    # Si hay un slug configurado, intentamos validar/normalizar:
-                    # - Si coincide con un slug, lo mantenemos
-                    # - Si coincide con el nombre, lo convertimos al slug correcto
-                    wanted = slug.strip().lower() if slug else None
-
-                    for ws in workspaces:
-                        if not isinstance(ws, dict):
-                            continue
-                        s = ws.get("slug") or ws.get("workspaceSlug") or ws.get("workspace_slug")
-                        name = ws.get("name")
-
-                        s_norm = s.strip() if isinstance(s, str) else ""
-                        name_norm = name.strip() if isinstance(name, str) else ""
-
-                        if wanted and (s_norm.lower() == wanted or name_norm.lower() == wanted):
-                            # Normalizar a slug real
-                            if s_norm:
-                                self.workspace_slug = s_norm
-                                return self.workspace_slug
-
-                    # Si venimos forzando o no hay slug configurado, elegimos el primero disponible
-                    if force or not slug:
-                        for ws in workspaces:
-                            if not isinstance(ws, dict):
-                                continue
-                            s = ws.get("slug") or ws.get("workspaceSlug") or ws.get("workspace_slug")
-                            if isinstance(s, str) and s.strip():
-                                self.workspace_slug = s.strip()
-                                return self.workspace_slug
-                except Exception:
+        # Formatos típicos: { "workspaces": [ { "slug": "..." }, ... ] } o lista directa
+        workspaces = None
+        if isinstance(data, dict):
+            if isinstance(data.get("workspaces"), list):
+                workspaces = data.get("workspaces")
+            elif isinstance(data.get("data"), list):
+                workspaces = data.get("data")
+        elif isinstance(data, list):
+            workspaces = data
+
+        if not isinstance(workspaces, list) or not workspaces:
+            return None
+
+        # Si hay un slug configurado, intentamos validar/normalizar:
+        # - Si coincide con un slug, lo mantenemos
+        # - Si coincide con el nombre, lo convertimos al slug correcto
+        wanted = slug.strip().lower() if slug else None
+
+        for ws in workspaces:
+            if not isinstance(ws, dict):
+                continue
+            s = ws.get("slug") or ws.get("workspaceSlug") or ws.get("workspace_slug")
+            name = ws.get("name")
+
+            s_norm = s.strip() if isinstance(s, str) else ""
+            name_norm = name.strip() if isinstance(name, str) else ""
+
+            if wanted and (s_norm.lower() == wanted or name_norm.lower() == wanted):
+                # Normalizar a slug real
+                if s_norm:
+                    return s_norm
+
+        # Si venimos forzando o no hay slug configurado, elegimos el primero disponible
+        if force or not slug:
+            for ws in workspaces:
+                if not isinstance(ws, dict):
+                    continue
+                s = ws.get("slug") or ws.get("workspaceSlug") or ws.get("workspace_slug")
+                if isinstance(s, str) and s.strip():
+                    return s.strip()
+        return None
+
+    def _resolve_anythingllm_workspace_slug(self, force: bool = False) -> Optional[str]:
+        """
+        Resuelve un workspace slug para AnythingLLM.
+
+        - Si ya viene configurado, se usa tal cual.
+        - Si está vacío, intentamos autodetectar el primer workspace vía API.
+          (Requiere normalmente API key con permisos suficientes.)
+        """
+        slug = (getattr(self, "workspace_slug", "") or "").strip()
+        cached = self._cached_anythingllm_slug(force)
+        if cached:
+            return cached
+
+        for url in self._anythingllm_workspace_urls():
+            try:
+                resp = self._http().get(url, headers=self._anythingllm_headers(), timeout=8)
+                if resp.status_code == 404:
                     continue
+                resp.raise_for_status()
+                data = resp.json() if resp.content else None
+                picked = self._pick_anythingllm_workspace_slug(data, force)
+                if picked:
+                    self.workspace_slug = picked
+                    self._remember_anythingllm_route(slug=picked)
+                    return self.workspace_slug
+            except Exception:
+                continue
 
         # Si no pudimos validar pero había uno configurado, devolvemos el que haya (mejor que None)
         if slug and not force:
+            # Se recuerda igualmente: si no es válido, el 404 del chat forzará otra resolución
+            self._remember_anythingllm_route(slug=slug)
             return slug
         return None
 
-    def _generate_anythingllm(self, prompt: str, **kwargs) -> str:
+    async def _aresolve_anythingllm_workspace_slug(self, force: bool = False) -> Optional[str]:
+        """Versión async de `_resolve_anythingllm_workspace_slug`"""
+        slug = (getattr(self, "workspace_slug", "") or "").strip()
+        cached = self._cached_anythingllm_slug(force)
+        if cached:
+            return cached
+
+        for url in self._anythingllm_workspace_urls():
+            try:
+                resp = await self._ahttp().get(url, headers=self._anythingllm_headers(), timeout=8)
+                if resp.status_code == 404:
+                    continue
+                resp.raise_for_status()
+                data = resp.json() if resp.content else None
+                picked = self._pick_anythingllm_workspace_slug(data, force)
+                if picked:
+                    self.workspace_slug = picked
+                    self._remember_anythingllm_route(slug=picked)
+                    return self.workspace_slug
+            except Exception:
+                continue
+
+        if slug and not force:
+            # Se recuerda igualmente: si no es válido, el 404 del chat forzará otra resolución
+            self._remember_anythingllm_route(slug=slug)
+            return slug
+        return None
+
+    @staticmethod
+    def _anythingllm_interpret(url: str, status_code: int, raw_text: str, data: Any) -> tuple[str, Any]:
         """
-        Genera texto usando AnythingLLM.
+        Interpreta una respuesta HTTP del endpoint de chat de AnythingLLM.
 
-        Endpoint esperado (según issue/documentación de la comunidad):
-        - POST /v1/workspace/{slug}/chat
-          body: {"message": "...", "mode": "query"|"chat"}
+        Returns:
+            ("ok", texto) | ("404", error) | ("fatal", error) | ("next", error)
+            - "fatal": no tiene sentido probar otra URL (auth, cuota, rate limit)
+            - "next": error en esta URL, probar la siguiente variante
+        """
+        # 404: puede ser path incorrecto o slug incorrecto
+        if status_code == 404:
+            return "404", Exception(f"AnythingLLM endpoint no encontrado en {url} (404)")
+
+        # Muchísimas instalaciones de AnythingLLM devuelven errores del proveedor como:
+        # HTTP 500 con body JSON { type: "abort", error: "429 ... quota ..." }.
+        # Por eso miramos el JSON ANTES del status.
+        if isinstance(data, dict) and data.get("type") == "abort" and isinstance(data.get("error"), str):
+            return "fatal", Exception(f"AnythingLLM abort: {data.get('error')}")
+
+        if status_code == 429:
+            return "fatal", Exception("AnythingLLM rate limit (429): Too Many Requests")
+        # Mensaje más útil para auth
+        if status_code in (401, 403):
+            return "fatal", Exception("AnythingLLM: no autorizado (revisa API key y permisos)")
+        if status_code >= 400:
+            return "next", Exception(f"HTTP {status_code} en {url}: {(raw_text or '')[:200]}")
+
+        # Algunas rutas pueden devolver texto/stream aunque sea 200.
+        # Si no era JSON, tratamos de parsear una línea "data: {...}".
+        if not isinstance(data, (dict, list)):
+            raw_text = (raw_text or "").strip()
+            if not raw_text:
+                data = {}
+            elif raw_text.startswith("data:"):
+                first = raw_text.splitlines()[0]
+                maybe_json = first.replace("data:", "", 1).strip()
+                try:
+                    data = json.loads(maybe_json)
+                except Exception:
+                    data = {"text": raw_text}
+            else:
+                data = {"text": raw_text}
+
+        # Respuesta típica: incluye texto generado por LLM y sources.
+        # No dependemos de un esquema exacto: buscamos campos comunes.
+        for key in ["textResponse", "response", "message", "answer", "text"]:
+            val = data.get(key) if isinstance(data, dict) else None
+            if isinstance(val, str) and val.strip():
+                return "ok", val
+
+        # Algunos formatos devuelven { "data": { "textResponse": ... } }
+        if isinstance(data, dict) and isinstance(data.get("data"), dict):
+            inner = data["data"]
+            for key in ["textResponse", "response", "message", "answer", "text"]:
+                val = inner.get(key)
+                if isinstance(val, str) and val.strip():
+                    return "ok", val
+
+        # Fallback: serializar
+        return "ok", json.dumps(data, ensure_ascii=False)
+
+    def _anythingllm_chat_once(self, prompt: str, mode: str) -> tuple[Optional[str], Optional[Exception], bool]:
+        """Prueba las variantes de URL de chat una vez. Devuelve (texto, error, hubo_404)."""
+        last_err: Optional[Exception] = None
+        any_404 = False
+        for url in self._anythingllm_chat_urls():
+            try:
+                response = self._http().post(url, headers=self._anythingllm_headers(), json={"message": prompt, "mode": mode}, timeout=300)
+            except requests.exceptions.RequestException as e:
+                # Conexión cortada por una cancelación: no probar más variantes
+                self._raise_if_cancelled()
+                last_err = e
+                continue
+            data = None
+            try:
+                if response.content:
+                    data = response.json()
+            except Exception:
+                data = None
+            kind, value = self._anythingllm_interpret(url, response.status_code, response.text, data)
+            self._anythingllm_note_chat_result(url, response.status_code, kind)
+            if kind == "ok":
+                return value, None, any_404
+            if kind == "404":
+                any_404 = True
+                # No machacar un error previo más informativo (p.ej. abort/quota)
+                if last_err is None:
+                    last_err = value
+                continue
+            if kind == "fatal":
+                return None, value, any_404
+            last_err = value
+        return None, last_err, any_404
+
+    async def _achat_anythingllm_once(self, prompt: str, mode: str) -> tuple[Optional[str], Optional[Exception], bool]:
+        """Versión async de `_anythingllm_chat_once`"""
+        last_err: Optional[Exception] = None
+        any_404 = False
+        for url in self._anythingllm_chat_urls():
+            try:
+                response = await self._ahttp().post(url, headers=self._anythingllm_headers(), json={"message": prompt, "mode": mode}, timeout=300)
+            except httpx.HTTPError as e:
+                last_err = e
+                continue
+            data = None
+            try:
+                if response.content:
+                    data = response.json()
+            except Exception:
+                data = None
+            kind, value = self._anythingllm_interpret(url, response.status_code, response.text, data)
+            self._anythingllm_note_chat_result(url, response.status_code, kind)
+            if kind == "ok":
+                return value, None, any_404
+            if kind == "404":
+                any_404 = True
+                if last_err is None:
+                    last_err = value
+                continue
+            if kind == "fatal":
+                return None, value, any_404
+            last_err = value
+        return None, last_err, any_404
+
+    def _anythingllm_flow(self):
+        """
+        Lógica de reintentos y fallbacks de AnythingLLM, independiente del transporte.
+
+        Es un generador que emite acciones y recibe su resultado vía `send()`:
+          ("resolve", force) -> slug | None
+          ("chat", mode)     -> (texto, error, hubo_404)
+          ("backoff", segundos) -> None   (bloquea el endpoint y espera turno)
+        Termina devolviendo el texto final o lanzando la excepción.
+        Así `_generate_anythingllm` (requests) y `_agenerate_anythingllm` (httpx)
+        comparten exactamente el mismo comportamiento.
         """
         if not getattr(self, "base_url", None):
             raise Exception("AnythingLLM: falta base_url")
-        slug = self._resolve_anythingllm_workspace_slug()
+        slug = yield ("resolve", False)
         if not slug:
             raise Exception(
                 "AnythingLLM: falta workspace_slug. "
@@ -444,167 +1280,104 @@ class LLMClient:
             ]
             return any(n in t for n in needles)
 
-        def _payload(_mode: str) -> dict:
-            return {"message": prompt, "mode": _mode}
-
         def _is_rate_limit_error(err: Optional[Exception]) -> bool:
             if not err:
                 return False
             msg = str(err).lower()
             return ("429" in msg) or ("too many requests" in msg) or ("rate limit" in msg) or ("ratelimit" in msg)
 
-        def _try_chat_once() -> tuple[Optional[str], Optional[Exception], bool]:
-            last_err: Optional[Exception] = None
-            any_404 = False
-            for url in self._anythingllm_chat_urls():
-                try:
-                    response = requests.post(url, headers=self._anythingllm_headers(), json=_payload(mode), timeout=300)
-                    # 404: puede ser path incorrecto o slug incorrecto
-                    if response.status_code == 404:
-                        any_404 = True
-                        # No machacar un error previo más informativo (p.ej. abort/quota)
-                        if last_err is None:
-                            last_err = Exception(f"AnythingLLM endpoint no encontrado en {url} (404)")
-                        continue
-                    # Muchísimas instalaciones de AnythingLLM devuelven errores del proveedor como:
-                    # HTTP 500 con body JSON { type: "abort", error: "429 ... quota ..." }.
-                    # Por eso intentamos parsear JSON ANTES de raise_for_status.
-                    data = None
-                    try:
-                        if response.content:
-                            data = response.json()
-                    except Exception:
-                        data = None
-
-                    if isinstance(data, dict) and data.get("type") == "abort" and isinstance(data.get("error"), str):
-                        return None, Exception(f"AnythingLLM abort: {data.get('error')}"), any_404
-
-                    if response.status_code == 429:
-                        return None, Exception("AnythingLLM rate limit (429): Too Many Requests"), any_404
-                    response.raise_for_status()
-                    # Algunas rutas pueden devolver texto/stream aunque sea 200.
-                    # Intentamos JSON primero; si falla, tratamos de parsear una línea "data: {...}".
-                    try:
-                        data = data if isinstance(data, (dict, list)) else (response.json() if response.content else {})
-                    except Exception:
-                        raw_text = (response.text or "").strip()
-                        if raw_text.startswith("data:"):
-                            first = raw_text.splitlines()[0]
-                            maybe_json = first.replace("data:", "", 1).strip()
-                            try:
-                                data = json.loads(maybe_json)
-                            except Exception:
-                                data = {"text": raw_text}
-                        else:
-                            data = {"text": raw_text}
-
-                    # Respuesta típica: incluye texto generado por LLM y sources.
-                    # No dependemos de un esquema exacto: buscamos campos comunes.
-                    for key in ["textResponse", "response", "message", "answer", "text"]:
-                        val = data.get(key) if isinstance(data, dict) else None
-                        if isinstance(val, str) and val.strip():
-                            return val, None, any_404
-
-                    # Algunos formatos devuelven { "data": { "textResponse": ... } }
-                    if isinstance(data, dict) and isinstance(data.get("data"), dict):
-                        inner = data["data"]
-                        for key in ["textResponse", "response", "message", "answer", "text"]:
-                            val = inner.get(key)
-                            if isinstance(val, str) and val.strip():
-                                return val, None, any_404
-
-                    # Fallback: serializar
-                    return json.dumps(data, ensure_ascii=False), None, any_404
-                except requests.exceptions.HTTPError as e:
-                    last_err = e
-                    # Mensaje más útil para auth
-                    if response is not None and response.status_code in (401, 403):
-                        return None, Exception("AnythingLLM: no autorizado (revisa API key y permisos)"), any_404
-                    if response is not None and response.status_code == 429:
-                        return None, Exception("AnythingLLM rate limit (429): Too Many Requests"), any_404
-                except requests.exceptions.RequestException as e:
-                    last_err = e
+        retries = int(getattr(self, "max_retries", 0) or 0)
+
+        def _chat_with_retries(_mode: str):
+            # Reintentos en rate limit con backoff exponencial y jitter pequeño.
+            # El backoff se aplica al limitador compartido: el resto de clientes
+            # del mismo endpoint también esperan en vez de provocar más 429.
+            text, err, any_404 = None, None, False
+            for attempt in range(retries + 1):
+                text, err, any_404 = yield ("chat", _mode)
+                if text is not None:
+                    break
+                if _is_rate_limit_error(err) and attempt < retries:
+                    sleep_s = min(8.0, (0.6 * (2 ** attempt)) + random.random() * 0.2)
+                    yield ("backoff", sleep_s)
                     continue
-            return None, last_err, any_404
+                break
+            return text, err, any_404
 
         # 1) Intento con slug actual (con reintentos en rate limit)
-        retries = int(getattr(self, "max_retries", 0) or 0)
-        text: Optional[str] = None
-        err: Optional[Exception] = None
-        any_404 = False
-        for attempt in range(retries + 1):
-            text, err, any_404 = _try_chat_once()
-            if text is not None:
-                break
-            if _is_rate_limit_error(err) and attempt < retries:
-                # Backoff exponencial con jitter pequeño.
-                sleep_s = min(8.0, (0.6 * (2 ** attempt)) + random.random() * 0.2)
-                time.sleep(sleep_s)
-                continue
-            break
+        text, err, any_404 = yield from _chat_with_retries(mode)
 
         if text is not None:
             # Fallback: si estamos en query y el workspace no tiene chunks relevantes,
             # reintentamos en modo chat para que responda el LLM igualmente.
             if mode == "query" and _is_no_relevant_info(text):
-                mode = "chat"
-                # Reintentar con el mismo esquema (incluye rate-limit retries)
-                text2 = None
-                err2: Optional[Exception] = None
-                any_404_2 = False
-                for attempt in range(retries + 1):
-                    text2, err2, any_404_2 = _try_chat_once()
-                    if text2 is not None:
-                        break
-                    if _is_rate_limit_error(err2) and attempt < retries:
-                        sleep_s = min(8.0, (0.6 * (2 ** attempt)) + random.random() * 0.2)
-                        time.sleep(sleep_s)
-                        continue
-                    break
+                text2, _err2, _ = yield from _chat_with_retries("chat")
                 if text2 is not None:
                     return text2
-                err = err2 or err
-                any_404 = any_404 or any_404_2
                 # si falló el fallback, devolvemos el mensaje original (más informativo para el usuario)
-                return text
             return text
 
         # 2) Si dio 404, puede ser slug incorrecto: intentamos autodetectar y reintentar
         if any_404:
-            resolved = self._resolve_anythingllm_workspace_slug(force=True)
+            resolved = yield ("resolve", True)
             if resolved:
-                text2 = None
-                err2: Optional[Exception] = None
-                for attempt in range(retries + 1):
-                    text2, err2, _ = _try_chat_once()
-                    if text2 is not None:
-                        break
-                    if _is_rate_limit_error(err2) and attempt < retries:
-                        sleep_s = min(8.0, (0.6 * (2 ** attempt)) + random.random() * 0.2)
-                        time.sleep(sleep_s)
-                        continue
-                    break
+                text2, err2, _ = yield from _chat_with_retries(mode)
                 if text2 is not None:
                     if mode == "query" and _is_no_relevant_info(text2):
-                        mode = "chat"
-                        text3 = None
-                        err3: Optional[Exception] = None
-                        for attempt in range(retries + 1):
-                            text3, err3, _ = _try_chat_once()
-                            if text3 is not None:
-                                break
-                            if _is_rate_limit_error(err3) and attempt < retries:
-                                sleep_s = min(8.0, (0.6 * (2 ** attempt)) + random.random() * 0.2)
-                                time.sleep(sleep_s)
-                                continue
-                            break
+                        text3, _err3, _ = yield from _chat_with_retries("chat")
                         if text3 is not None:
                             return text3
-                        err2 = err3 or err2
                     return text2
                 err = err2 or err
 
         raise Exception(f"Error al generar con AnythingLLM: {err}")
+
+    def _generate_anythingllm(self, prompt: str, **kwargs) -> str:
+        """
+        Genera texto usando AnythingLLM.
+
+        Endpoint esperado (según issue/documentación de la comunidad):
+        - POST /v1/workspace/{slug}/chat
+          body: {"message": "...", "mode": "query"|"chat"}
+        """
+        flow = self._anythingllm_flow()
+        try:
+            action = next(flow)
+            while True:
+                self._raise_if_cancelled()
+                kind, arg = action
+                if kind == "resolve":
+                    result = self._resolve_anythingllm_workspace_slug(force=arg)
+                elif kind == "chat":
+                    result = self._anythingllm_chat_once(prompt, arg)
+                else:
+                    limiter = self._rate_limiter()
+                    limiter.penalize(arg)
+                    limiter.acquire()
+                    result = None
+                action = flow.send(result)
+        except StopIteration as stop:
+            return stop.value
+
+    async def _agenerate_anythingllm(self, prompt: str, **kwargs) -> str:
+        """Versión async de `_generate_anythingllm` (mismo flujo de reintentos/fallback)"""
+        flow = self._anythingllm_flow()
+        try:
+            action = next(flow)
+            while True:
+                kind, arg = action
+                if kind == "resolve":
+                    result = await self._aresolve_anythingllm_workspace_slug(force=arg)
+                elif kind == "chat":
+                    result = await self._achat_anythingllm_once(prompt, arg)
+                else:
+                    limiter = self._rate_limiter()
+                    limiter.penalize(arg)
+                    await limiter.aacquire()
+                    result = None
+                action = flow.send(result)
+        except StopIteration as stop:
+            return stop.value
     
     def _generate_chatgpt(self, prompt: str, temperature: Optional[float] = None,
                         max_tokens: Optional[int] = None, **kwargs) -> str:
@@ -636,20 +1409,27 @@ class LLMClient:
             return {"status": "not_implemented", "message": "ChatGPT no implementado"}
         else:
             return {"status": "error", "message": f"Proveedor desconocido: {self.provider}"}
-    
-    def _check_ollama_connection(self) -> Dict[str, Any]:
-        """Verifica la conexión con Ollama"""
-        try:
-            # Intentar listar modelos disponibles
-            url = f"{self.base_url}/api/tags"
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            models_data = response.json()
-            models = [model.get("name", "") for model in models_data.get("models", [])]
-            
+
+    async def acheck_connection(self) -> Dict[str, Any]:
+        """Versión async de `check_connection`"""
+        if self.provider == "llama":
+            provider = getattr(self, "llama_provider", "ollama")
+            if provider == "anythingllm":
+                return await self._acheck_anythingllm_connection()
+            if provider == "huggingface":
+                return await self._acheck_huggingface_connection()
+            return await self._acheck_ollama_connection()
+        elif self.provider == "chatgpt":
+            return {"status": "not_implemented", "message": "ChatGPT no implementado"}
+        else:
+            return {"status": "error", "message": f"Proveedor desconocido: {self.provider}"}
+
+    def _ollama_status(self, status: str, models: Optional[list] = None, error: Optional[Exception] = None) -> Dict[str, Any]:
+        """Construye la respuesta de estado de Ollama (compartido sync/async)"""
+        if status == "connected":
+            models = models or []
             # Verificar si el modelo configurado está disponible
             model_available = self.model in models if models else False
-            
             return {
                 "status": "connected",
                 "base_url": self.base_url,
@@ -658,27 +1438,75 @@ class LLMClient:
                 "available_models": models,
                 "message": f"Conectado a Ollama. Modelo '{self.model}' {'disponible' if model_available else 'no encontrado'}"
             }
+        messages = {
+            "disconnected": f"No se pudo conectar a Ollama en {self.base_url}. Verifica que Ollama esté corriendo.",
+            "timeout": f"Timeout al conectar con Ollama en {self.base_url}",
+            "error": f"Error al verificar conexión: {str(error)}",
+        }
+        return {
+            "status": status,
+            "base_url": self.base_url,
+            "model": self.model,
+            "message": messages.get(status, str(error)),
+        }
+
+    def _check_ollama_connection(self) -> Dict[str, Any]:
+        """Verifica la conexión con Ollama"""
+        try:
+            # Intentar listar modelos disponibles
+            url = f"{self.base_url}/api/tags"
+            response = self._http().get(url, timeout=5)
+            response.raise_for_status()
+            models_data = response.json()
+            models = [model.get("name", "") for model in models_data.get("models", [])]
+            return self._ollama_status("connected", models)
         except requests.exceptions.ConnectionError:
-            return {
-                "status": "disconnected",
-                "base_url": self.base_url,
-                "model": self.model,
-                "message": f"No se pudo conectar a Ollama en {self.base_url}. Verifica que Ollama esté corriendo."
-            }
+            return self._ollama_status("disconnected")
         except requests.exceptions.Timeout:
-            return {
-                "status": "timeout",
-                "base_url": self.base_url,
-                "model": self.model,
-                "message": f"Timeout al conectar con Ollama en {self.base_url}"
-            }
+            return self._ollama_status("timeout")
         except Exception as e:
-            return {
-                "status": "error",
-                "base_url": self.base_url,
-                "model": self.model,
-                "message": f"Error al verificar conexión: {str(e)}"
-            }
+            return self._ollama_status("error", error=e)
+
+    async def _acheck_ollama_connection(self) -> Dict[str, Any]:
+        """Versión async de `_check_ollama_connection`"""
+        try:
+            url = f"{self.base_url}/api/tags"
+            response = await self._ahttp().get(url, timeout=5)
+            response.raise_for_status()
+            models_data = response.json()
+            models = [model.get("name", "") for model in models_data.get("models", [])]
+            return self._ollama_status("connected", models)
+        except httpx.ConnectError:
+            return self._ollama_status("disconnected")
+        except httpx.TimeoutException:
+            return self._ollama_status("timeout")
+        except Exception as e:
+            return self._ollama_status("error", error=e)
+
+    def _anythingllm_status(self, status_code: Optional[int] = None, status: Optional[str] = None,
+                            error: Optional[Exception] = None) -> Dict[str, Any]:
+        """Construye la respuesta de estado de AnythingLLM (compartido sync/async)"""
+        base = (getattr(self, "base_url", "") or "").rstrip("/")
+        slug = (getattr(self, "workspace_slug", "") or "").strip()
+        out: Dict[str, Any] = {"provider": "anythingllm", "base_url": base, "workspace_slug": slug or None}
+        if status_code is not None:
+            if status_code >= 500:
+                out.update({"status": "error", "message": f"AnythingLLM respondió {status_code} en /api/docs"})
+                return out
+            # 200/301/302/401/403 son señales de reachability
+            reachable = status_code in {200, 301, 302, 401, 403}
+            out.update({
+                "status": "connected" if reachable else "disconnected",
+                "message": "AnythingLLM accesible" if reachable else f"AnythingLLM no accesible (HTTP {status_code})",
+            })
+            return out
+        messages = {
+            "disconnected": f"No se pudo conectar a AnythingLLM en {base}.",
+            "timeout": f"Timeout al conectar con AnythingLLM en {base}.",
+            "error": f"Error al verificar AnythingLLM: {str(error)}",
+        }
+        out.update({"status": status or "error", "message": messages.get(status or "error", str(error))})
+        return out
 
     def _check_anythingllm_connection(self) -> Dict[str, Any]:
         """
@@ -688,88 +1516,77 @@ class LLMClient:
         Esto no valida credenciales ni workspace, pero confirma reachability.
         """
         base = (getattr(self, "base_url", "") or "").rstrip("/")
-        slug = (getattr(self, "workspace_slug", "") or "").strip()
         try:
-            url = f"{base}/api/docs"
-            resp = requests.get(url, timeout=5)
-            if resp.status_code >= 500:
-                return {
-                    "status": "error",
-                    "provider": "anythingllm",
-                    "base_url": base,
-                    "workspace_slug": slug or None,
-                    "message": f"AnythingLLM respondió {resp.status_code} en /api/docs",
-                }
-            # 200/301/302/401/403 son señales de reachability
-            reachable = resp.status_code in {200, 301, 302, 401, 403}
-            return {
-                "status": "connected" if reachable else "disconnected",
-                "provider": "anythingllm",
-                "base_url": base,
-                "workspace_slug": slug or None,
-                "message": "AnythingLLM accesible" if reachable else f"AnythingLLM no accesible (HTTP {resp.status_code})",
-            }
+            resp = self._http().get(f"{base}/api/docs", timeout=5)
+            return self._anythingllm_status(status_code=resp.status_code)
         except requests.exceptions.ConnectionError:
-            return {
-                "status": "disconnected",
-                "provider": "anythingllm",
-                "base_url": base,
-                "workspace_slug": slug or None,
-                "message": f"No se pudo conectar a AnythingLLM en {base}.",
-            }
+            return self._anythingllm_status(status="disconnected")
         except requests.exceptions.Timeout:
-            return {
-                "status": "timeout",
-                "provider": "anythingllm",
-                "base_url": base,
-                "workspace_slug": slug or None,
-                "message": f"Timeout al conectar con AnythingLLM en {base}.",
-            }
+            return self._anythingllm_status(status="timeout")
         except Exception as e:
+            return self._anythingllm_status(status="error", error=e)
+
+    async def _acheck_anythingllm_connection(self) -> Dict[str, Any]:
+        """Versión async de `_check_anythingllm_connection`"""
+        base = (getattr(self, "base_url", "") or "").rstrip("/")
+        try:
+            resp = await self._ahttp().get(f"{base}/api/docs", timeout=5)
+            return self._anythingllm_status(status_code=resp.status_code)
+        except httpx.ConnectError:
+            return self._anythingllm_status(status="disconnected")
+        except httpx.TimeoutException:
+            return self._anythingllm_status(status="timeout")
+        except Exception as e:
+            return self._anythingllm_status(status="error", error=e)
+
+    @staticmethod
+    def _huggingface_model_info_url(model_id: str) -> str:
+        hub_url = (HUGGINGFACE_CONFIG.get("hub_url") or "https://huggingface.co").rstrip("/")
+        return f"{hub_url}/api/models/{model_id}"
+
+    @staticmethod
+    def _huggingface_info_status(status_code: int, data: Any, model_id: str) -> Dict[str, Any]:
+        if status_code == 200:
+            if isinstance(data, dict) and not data.get("inferenceProviderMapping"):
+                return {
+                    "status": "error",
+                    "message": f"El modelo '{model_id}' no está disponible en los Inference Providers de Hugging Face.",
+                }
             return {
-                "status": "error",
-                "provider": "anythingllm",
-                "base_url": base,
-                "workspace_slug": slug or None,
-                "message": f"Error al verificar AnythingLLM: {str(e)}",
+                "status": "connected",
+                "provider": "huggingface",
+                "model": model_id,
+                "message": f"Conectado a Hugging Face. Modelo '{model_id}' listo."
             }
+        if status_code in (401, 403):
+            return {"status": "error", "message": "Hugging Face: API key inválida o sin acceso al modelo."}
+        if status_code == 404:
+            return {"status": "error", "message": f"Hugging Face: modelo '{model_id}' no encontrado."}
+        return {"status": "error", "message": f"Hugging Face: HTTP {status_code}"}
 
     def _check_huggingface_connection(self) -> Dict[str, Any]:
-        """Verifica la conexión con Hugging Face Inference API"""
+        """
+        Verifica la conexión con Hugging Face consultando los metadatos del modelo en el
+        Hub: valida la API key y el modelo sin generar (no consume cuota de inferencia).
+        """
         model_id = getattr(self, "model", "").strip()
         headers = {"Authorization": f"Bearer {self.api_key}"}
-        
-        urls_to_try = [
-            f"https://router.huggingface.co/models/{model_id}/v1/chat/completions",
-            "https://router.huggingface.co/v1/chat/completions",
-            f"https://router.huggingface.co/models/{model_id}"
-        ]
-        
-        last_error = ""
-        for url in urls_to_try:
-            try:
-                if "/v1/chat/completions" in url:
-                    payload = {"model": model_id, "messages": [{"role": "user", "content": "ping"}], "max_tokens": 1}
-                else:
-                    payload = {"inputs": "ping"}
-                
-                response = requests.post(url, headers=headers, json=payload, timeout=15)
-                
-                if response.status_code == 200:
-                    return {
-                        "status": "connected",
-                        "provider": "huggingface",
-                        "model": model_id,
-                        "message": f"Conectado a Hugging Face. Modelo '{model_id}' listo."
-                    }
-                
-                if response.status_code == 503:
-                    return {"status": "connected", "message": f"El modelo '{model_id}' está cargando. Reintenta en unos segundos."}
-                
-                last_error = f"HTTP {response.status_code}: {response.text}"
-                
-            except Exception as e:
-                last_error = str(e)
-                continue
-                
-        return {"status": "error", "message": f"Hugging Face: {last_error}"}
+        url = self._huggingface_model_info_url(model_id)
+        try:
+            response = self._http(url).get(url, headers=headers, params=_HF_MODEL_INFO_PARAMS, timeout=15)
+            data = response.json() if response.status_code == 200 else None
+            return self._huggingface_info_status(response.status_code, data, model_id)
+        except Exception as e:
+            return {"status": "error", "message": f"Hugging Face: {str(e)}"}
+
+    async def _acheck_huggingface_connection(self) -> Dict[str, Any]:
+        """Versión async de `_check_huggingface_connection`"""
+        model_id = getattr(self, "model", "").strip()
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        url = self._huggingface_model_info_url(model_id)
+        try:
+            response = await self._ahttp(url).get(url, headers=headers, params=_HF_MODEL_INFO_PARAMS, timeout=15)
+            data = response.json() if response.status_code == 200 else None
+            return self._huggingface_info_status(response.status_code, data, model_id)
+        except Exception as e:
+            return {"status": "error", "message": f"Hugging Face: {str(e)}"}
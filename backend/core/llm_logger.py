@@ -0,0 +1,165 @@
+"""
+Log estructurado (JSONL) de las respuestas crudas del LLM.
+
+Las llamadas sólo encolan el registro (QueueHandler); un hilo de fondo
+(QueueListener) lo escribe en `storage/logs/raw_llm_responses.jsonl` con
+rotación por tamaño y, opcionalmente, compresión gzip de los ficheros rotados.
+Así el log no añade I/O de disco a la latencia de cada llamada y el espacio
+ocupado queda acotado a max_bytes * (backup_count + 1).
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import shutil
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import LLM_LOG_CONFIG, STORAGE_DIR
+
+
+_LOGGER_NAME = "synthetic_users.llm_raw"
+_LOCK = threading.Lock()
+_LISTENER: Optional[logging.handlers.QueueListener] = None
+
+
+class _JsonlFormatter(logging.Formatter):
+    """El mensaje ya es el dict del registro: se serializa tal cual en una línea."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = record.msg if isinstance(record.msg, dict) else {"message": record.getMessage()}
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Encola el registro sin formatear (la serialización JSON ocurre en el hilo
+    escritor) y lo descarta si la cola está llena en vez de bloquear.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _build_file_handler() -> logging.Handler:
+    log_dir = STORAGE_DIR / "logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(
+        log_dir / "raw_llm_responses.jsonl",
+        maxBytes=int(LLM_LOG_CONFIG.get("max_bytes") or 0),
+        backupCount=int(LLM_LOG_CONFIG.get("backup_count") or 0),
+        encoding="utf-8",
+        # No crear el fichero hasta el primer registro
+        delay=True,
+    )
+    if LLM_LOG_CONFIG.get("compress"):
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+    handler.setFormatter(_JsonlFormatter())
+    return handler
+
+
+def _get_logger() -> logging.Logger:
+    global _LISTENER
+    logger = logging.getLogger(_LOGGER_NAME)
+    if _LISTENER is not None:
+        return logger
+    with _LOCK:
+        if _LISTENER is None:
+            q: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=int(LLM_LOG_CONFIG.get("queue_size") or 0))
+            logger.handlers = [_DroppingQueueHandler(q)]
+            logger.setLevel(logging.INFO)
+            # No duplicar en la salida del root logger (uvicorn)
+            logger.propagate = False
+            listener = logging.handlers.QueueListener(q, _build_file_handler(), respect_handler_level=False)
+            listener.start()
+            _LISTENER = listener
+    return logger
+
+
+def _truncate(text: str, limit: int) -> str:
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return text[:limit] + f"... [+{len(text) - limit} caracteres]"
+
+
+def log_llm_response(
+    prompt: str,
+    response_text: str,
+    provider: str,
+    model: Optional[str] = None,
+    latency_s: Optional[float] = None,
+    context: Optional[Dict[str, Any]] = None,
+    **extra: Any,
+) -> None:
+    """
+    Encola un registro de la llamada. No bloquea: si la cola está llena el
+    registro se descarta (el log es de depuración, nunca debe frenar la generación).
+    """
+    if not LLM_LOG_CONFIG.get("enabled"):
+        return
+    sample_rate = float(LLM_LOG_CONFIG.get("sample_rate", 1.0))
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+
+    prompt = prompt or ""
+    response_text = response_text or ""
+    max_chars = int(LLM_LOG_CONFIG.get("max_payload_chars") or 0)
+    record: Dict[str, Any] = {
+        "ts": datetime.now().isoformat(),
+        "provider": provider,
+        "model": model,
+        **(context or {}),
+        **extra,
+        "latency_s": round(latency_s, 3) if latency_s is not None else None,
+        "prompt_chars": len(prompt),
+        "response_chars": len(response_text),
+        "prompt": _truncate(prompt, max_chars),
+        "response": _truncate(response_text, max_chars),
+    }
+    try:
+        _get_logger().info(record)
+    except Exception as e:
+        print(f"Error al encolar log de LLM: {e}")
+
+
+def stop_llm_logger() -> None:
+    """Vacía la cola pendiente y detiene el hilo escritor (p.ej. al apagar la API)."""
+    global _LISTENER
+    with _LOCK:
+        listener, _LISTENER = _LISTENER, None
+    if listener is None:
+        return
+    try:
+        listener.stop()
+        for h in listener.handlers:
+            h.close()
+    except Exception as e:
+        print(f"Error al cerrar log de LLM: {e}")
@@ -204,11 +204,16 @@ ResearchType = Literal["cuestionario", "entrevista", "mixed"]
 
 class CuestionarioStep(BaseModel):
     type: Literal["cuestionario"] = "cuestionario"
+    # Identificador dentro del plan y unidades de las que depende ("perfil" u otros steps)
+    id: Optional[str] = None
+    depends_on: List[str] = Field(default_factory=lambda: ["perfil"])
     questions: List[str] = Field(default_factory=list)
 
 
 class EntrevistaStep(BaseModel):
     type: Literal["entrevista"] = "entrevista"
+    id: Optional[str] = None
+    depends_on: List[str] = Field(default_factory=lambda: ["perfil"])
     # Entrevista en un solo turno (una sola llamada) por respondiente.
     n_questions: int = Field(default=6, ge=1)
 
@@ -3,29 +3,80 @@ Motor de investigación por etapas (pipeline) para múltiples respondientes.
 
 Pipeline v1:
 1) Planner -> ResearchPlan (ya se genera fuera y se pasa aquí)
-2) Para cada respondiente:
+2) Para cada respondiente (hasta `concurrency` unidades en paralelo, eventos en orden de índice):
    - Generar perfil (prompt_perfil)
-   - Ejecutar steps (survey / interview / behavior_sim)
+   - Ejecutar steps (survey / interview / behavior_sim) según sus dependencias (`depends_on`)
    - Guardar artefacto por respondiente
-3) Síntesis agregada (prompt_investigacion) y guardado del resultado final
+3) Síntesis agregada (prompt_investigacion) y guardado del resultado final; con muchos
+   respondientes, resúmenes por respondiente fusionados por lotes (core/synthesis.py)
+
+En modo coordinador (CLUSTER_MODE=coordinator) las unidades de cada respondiente las
+ejecuta un nodo remoto (core/cluster.py); este proceso guarda lo que suben y hace la síntesis.
 """
 
 from __future__ import annotations
 
+import heapq
 import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
-from core.llm_client import LLMClient
+from core.cluster import get_task_queue
+from core.llm_client import LLMClient, LLMCancelledError
+from core.planner import normalize_steps
+from core.run_manifest import RunManifest, new_run_id
+from core.synthesis import RunningSynthesis, reduce_to_budget, respondent_block
 from core.synthetic_user import SyntheticUser
 
 import sys
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent))
-from config import STORAGE_DIR, DEFAULT_PROMPTS
+from config import CLUSTER_CONFIG, STORAGE_DIR, DEFAULT_PROMPTS, RESEARCH_CONFIG, SYNTHESIS_CONFIG
+
+
+# Cabecera con la que empezaban los prompts de cuestionario/entrevista antiguos.
+_LEGACY_PROFILE_HEADER = "Eres {nombre_usuario}, con el siguiente perfil:\n{perfil_usuario}"
+_SEED_LINE = "Seed para variabilidad: {seed}"
+
+
+def _prefix_friendly_template(template: str) -> str:
+    """
+    Reordena un prompt antiguo que empieza por el perfil del respondiente para que
+    el contexto común (producto, investigación, preguntas, reglas) vaya primero y
+    la parte propia de cada respondiente (perfil, seed) al final.
+
+    Con el prefijo idéntico entre respondientes, Ollama/llama.cpp reutiliza la caché
+    KV del prompt y no vuelve a evaluar esos tokens en cada llamada.
+    """
+    text = template.replace("\r\n", "\n")
+    stripped = text.lstrip()
+    if not stripped.startswith(_LEGACY_PROFILE_HEADER):
+        return template
+    body = stripped[len(_LEGACY_PROFILE_HEADER):]
+    has_seed = _SEED_LINE in body
+    if has_seed:
+        body = "\n".join(line for line in body.split("\n") if line.strip() != _SEED_LINE)
+    while "\n\n\n" in body:
+        body = body.replace("\n\n\n", "\n\n")
+    tail = "\n\nTU PERFIL:\n" + _LEGACY_PROFILE_HEADER
+    if has_seed:
+        tail += "\n\n" + _SEED_LINE
+    return body.strip() + tail
 
 
+class _UnitFailure:
+    """Resultado de una unidad (perfil o step) que falló tras agotar los reintentos."""
+
+    def __init__(self, unit: str, error: BaseException, attempts: int):
+        self.unit = unit
+        self.error = error
+        self.attempts = attempts
 
 
 class MultiResearchEngine:
@@ -43,6 +94,13 @@ class MultiResearchEngine:
         investigacion_objetivo: Optional[str] = "",
         investigacion_preguntas: Optional[str] = "",
         estilo_investigacion: Optional[str] = None,
+        stream_tokens: bool = False,
+        concurrency: Optional[int] = None,
+        incremental_synthesis: Optional[bool] = None,
+        run_id: Optional[str] = None,
+        resume: bool = False,
+        remote: Optional[bool] = None,
+        manifest: Optional[RunManifest] = None,
     ):
         self.respondents = respondents
         self.producto = producto
@@ -59,18 +117,123 @@ class MultiResearchEngine:
         self.prompt_cuestionario = prompt_cuestionario
         self.prompt_entrevista = prompt_entrevista
         self.prompt_sintesis = prompt_sintesis
+        # Si está activo, `execute_stream` emite eventos "token" con el texto según se genera.
+        self.stream_tokens = bool(stream_tokens)
+        # Respondientes en paralelo (ver `_run_respondents`); por defecto RESEARCH_CONFIG
+        try:
+            concurrency = int(concurrency if concurrency is not None else RESEARCH_CONFIG.get("concurrency", 1))
+        except (TypeError, ValueError):
+            concurrency = 1
+        self.concurrency = max(1, min(concurrency, int(RESEARCH_CONFIG.get("max_concurrency") or 1)))
+        # Síntesis incremental (eventos "partial_synthesis"); por defecto SYNTHESIS_CONFIG
+        self.incremental_synthesis = bool(
+            incremental_synthesis if incremental_synthesis is not None else SYNTHESIS_CONFIG.get("incremental")
+        )
 
-        self._run_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self._run_iso = datetime.now().isoformat()
+        # `run_id` (p.ej. el del job) es el nombre del directorio del run; con `resume`
+        # se reutilizan las unidades ya persistidas en él (ver core/run_manifest.py)
+        self._run_ts = run_id or new_run_id()
+        self.resume = bool(resume)
+        self.manifest = manifest or RunManifest(self._run_ts)
+        # Respondientes ejecutados por nodos remotos (por defecto según CLUSTER_CONFIG)
+        self.remote = bool(remote if remote is not None else CLUSTER_CONFIG.get("mode") == "coordinator")
+        # (idx, unidad) que subió un nodo remoto: los steps se recuperan del manifiesto
+        self._remote_units: set = set()
+        self._run_iso = self.manifest.data.get("created_at") if self.resume else None
+        self._run_iso = self._run_iso or datetime.now().isoformat()
+        self._steps: List[Dict[str, Any]] = []
+        # Cancelación del run (la asigna `execute_stream`); se pasa a cada LLMClient
+        self._cancel_check: Optional[Callable[[], bool]] = None
+        self._failed_respondents: List[Dict[str, Any]] = []
+
+        # Métrica de reutilización del prefijo común entre respondientes (ver `_note_prompt_stats`)
+        self._prompt_stats_lock = threading.Lock()
+        self._prompt_stats: Dict[str, int] = {
+            "calls": 0,
+            "prompt_chars": 0,
+            "shared_prefix_chars": 0,
+            "prompt_tokens_est": 0,
+            "prompt_eval_count": 0,
+            "calls_with_eval_count": 0,
+        }
+        self._last_prompt_by_stage: Dict[str, str] = {}
 
-    def _fresh_llm_client(self) -> LLMClient:
+    def _fresh_llm_client(self, respondent: Optional[int] = None) -> LLMClient:
         """
         Crea un LLMClient nuevo clonando configuración del prototipo.
+        `respondent` (1-based) se añade al log de respuestas junto al run.
         """
         proto = self.llm_client
         provider = getattr(proto, "provider", "llama")
         config = dict(getattr(proto, "config", {}) or {})
-        return LLMClient(provider=provider, config=config)
+        client = LLMClient(provider=provider, config=config)
+        client.log_context = {"run_id": self._run_ts, "respondent": respondent}
+        # Al cancelar el job se aborta también la petición en curso (no sólo entre steps)
+        client.cancel_check = self._cancel_check
+        return client
+
+    def _llm_generate(self, client: LLMClient, prompt: str, **meta):
+        """
+        Llamada al LLM desde `execute_stream`.
+
+        Se usa con `yield from`: si `stream_tokens` está activo emite eventos
+        {"event": "token", **meta, "text": ...} y devuelve el texto final completo.
+        """
+        if not self.stream_tokens:
+            text = client.generate(prompt, stage=meta.get("stage"))
+        else:
+            stream = client.generate_stream(prompt, stage=meta.get("stage"))
+            while True:
+                try:
+                    delta = next(stream)
+                except StopIteration as stop:
+                    text = stop.value or ""
+                    break
+                yield {"event": "token", **meta, "text": delta}
+        self._note_prompt_stats(client, prompt, meta.get("stage"))
+        return text
+
+    def _note_prompt_stats(self, client: LLMClient, prompt: str, stage: Optional[str]) -> None:
+        """
+        Acumula, para las llamadas de los steps (cuestionario/entrevista), cuánto prompt
+        comparten con la llamada anterior del mismo tipo y cuántos tokens tuvo que
+        evaluar realmente Ollama (`prompt_eval_count`, baja si reutiliza la caché KV).
+        """
+        if stage in (None, "perfil", "sintesis", "refinado"):
+            return
+        from core.rate_limiter import estimate_tokens
+
+        eval_count = (getattr(client, "last_stats", None) or {}).get("prompt_eval_count")
+        with self._prompt_stats_lock:
+            prev = self._last_prompt_by_stage.get(stage)
+            self._last_prompt_by_stage[stage] = prompt
+            st = self._prompt_stats
+            st["calls"] += 1
+            st["prompt_chars"] += len(prompt)
+            if prev is not None:
+                st["shared_prefix_chars"] += len(os.path.commonprefix([prev, prompt]))
+            if isinstance(eval_count, (int, float)):
+                st["prompt_tokens_est"] += estimate_tokens(prompt)
+                st["prompt_eval_count"] += int(eval_count)
+                st["calls_with_eval_count"] += 1
+
+    def _prompt_cache_metrics(self) -> Dict[str, Any]:
+        with self._prompt_stats_lock:
+            out: Dict[str, Any] = dict(self._prompt_stats)
+        # Fracción del prompt idéntica a la llamada anterior (lo que el servidor puede reutilizar)
+        out["shared_prefix_ratio"] = round(out["shared_prefix_chars"] / out["prompt_chars"], 4) if out["prompt_chars"] else 0.0
+        # Fracción de tokens del prompt que Ollama no tuvo que evaluar (estimación: ~4 chars/token)
+        if out["prompt_tokens_est"]:
+            reuse = 1.0 - out["prompt_eval_count"] / out["prompt_tokens_est"]
+            out["prefix_reuse_ratio"] = round(min(1.0, max(0.0, reuse)), 4)
+        else:
+            out["prefix_reuse_ratio"] = None
+        return out
+
+    def _synthesis_generate(self, prompt: str, stage: str, max_tokens: int) -> str:
+        """Llamada de las fases map/reduce de la síntesis (ver core/synthesis.py)."""
+        client = self._fresh_llm_client()
+        return self._clean_output(client.generate(prompt, max_tokens=max_tokens, stage=stage))
 
     def _clean_output(self, text: str) -> str:
         """
@@ -107,7 +270,7 @@ class MultiResearchEngine:
         try:
             client = self._fresh_llm_client()
             prompt = DEFAULT_PROMPTS.get("refinado", "{texto}").format(texto=text)
-            refined = client.generate(prompt, temperature=0.0)
+            refined = client.generate(prompt, temperature=0.0, stage="refinado")
             return refined.strip()
         except Exception as e:
             print(f"Error en refinado LLM: {e}")
@@ -140,6 +303,8 @@ class MultiResearchEngine:
         # forzamos el uso del prompt por defecto para asegurar que el cuestionario funcione.
         if "{preguntas}" not in prompt_template:
             prompt_template = DEFAULT_PROMPTS["cuestionario"]
+        # Prompts antiguos con el perfil al principio: contexto común primero (caché de prefijo)
+        prompt_template = _prefix_friendly_template(prompt_template)
 
         return prompt_template.format(
             nombre_usuario=nombre_usuario,
@@ -168,6 +333,8 @@ class MultiResearchEngine:
         # usamos el por defecto que ya incluye el contexto de las preguntas deseadas.
         if "{investigacion_preguntas}" not in prompt_template:
             prompt_template = DEFAULT_PROMPTS["entrevista"]
+        # Prompts antiguos con el perfil al principio: contexto común primero (caché de prefijo)
+        prompt_template = _prefix_friendly_template(prompt_template)
 
         return prompt_template.format(
             nombre_usuario=nombre_usuario,
@@ -182,287 +349,700 @@ class MultiResearchEngine:
         )
 
 
-    def execute(self) -> Dict[str, Any]:
-        # Guardar configuraciones utilizadas
+    def _save_run_configs(self) -> str:
+        """Guarda las configuraciones utilizadas y el plan. Devuelve el id del plan."""
+        plan_id = "plan.json"
+        if self.resume and (self._resultados_dir() / plan_id).exists():
+            # Al reanudar se conservan las entradas originales del run
+            return plan_id
         self._save_json("producto.json", self.producto, subdir="configs")
         self._save_json("investigacion.json", {
             "descripcion": self.investigacion_descripcion,
             "objetivo": self.investigacion_objetivo,
             "preguntas": self.investigacion_preguntas,
+            "estilo_investigacion": self.estilo_investigacion,
         }, subdir="configs")
         self._save_json("respondientes_config.json", {"respondents": self.respondents}, subdir="configs")
 
-        # Guardar plan
-        plan_id = "plan.json"
         self._save_json(plan_id, {"timestamp": self._run_iso, "plan": self.plan})
+        return plan_id
 
-        respondents_meta: List[Dict[str, Any]] = []
-        respondents_artifacts: List[Dict[str, Any]] = []
-
-        steps = self.plan.get("steps") if isinstance(self.plan, dict) else []
-        if not isinstance(steps, list):
-            steps = []
-
-        for idx, perfil_basico in enumerate(self.respondents):
-            llm_client_r = self._fresh_llm_client()
-            usuario = SyntheticUser(perfil_basico)
-            perfil_det = usuario.generate_profile(llm_client_r, self.prompt_perfil)
-            
-            # Limpiar solo tags técnicos del perfil generado
-            if perfil_det and "perfil_generado" in perfil_det:
-                perfil_det["perfil_generado"] = self._clean_output(perfil_det["perfil_generado"])
-                
-            perfil_text = (perfil_det or {}).get("perfil_generado", "")
-            nombre = (perfil_det or {}).get("nombre") or usuario.nombre or f"Respondent_{idx+1}"
-
-            artifact_steps: List[Dict[str, Any]] = []
-
-            for step in steps:
-                if not isinstance(step, dict):
-                    continue
-                stype = step.get("type")
-
-                if stype == "cuestionario":
-                    questions = step.get("questions", [])
-                    if not isinstance(questions, list):
-                        questions = []
-                    questions = [q for q in questions if isinstance(q, str) and q.strip()]
-                    out = ""
-                    if questions:
-                        prompt = self._cuestionario_prompt(nombre, perfil_text, questions)
-                        out = self._clean_output(llm_client_r.generate(prompt))
-                    artifact_steps.append({"type": "cuestionario", "questions": questions, "respuestas": out})
-
-                elif stype == "entrevista":
-                    n_questions = step.get("n_questions", 6)
-                    try:
-                        n_i = max(1, int(n_questions))
-                    except Exception:
-                        n_i = 6
-                    prompt = self._entrevista_prompt(nombre, perfil_text, n_questions=n_i, seed=idx + 1)
-                    out = self._clean_output(llm_client_r.generate(prompt))
-                    artifact_steps.append({"type": "entrevista", "n_questions": n_i, "transcripcion": out})
-
-            respondent_filename = f"respondent_{idx+1:02d}.json"
-            artifact = {
-                "timestamp": self._run_iso,
-                "respondent_id": respondent_filename,
+    def _resumed_unit(self, idx: int, unit: str) -> Optional[Dict[str, Any]]:
+        """
+        Salida ya persistida de una unidad al reanudar (None si hay que ejecutarla).
+        Para runs anteriores al manifiesto se recurre a respondents/respondent_XX.json.
+        """
+        if (idx, unit) in self._remote_units:
+            return self.manifest.load_unit(idx + 1, unit)
+        if not self.resume:
+            return None
+        payload = self.manifest.load_unit(idx + 1, unit)
+        if payload is not None or not self.manifest.persistent:
+            return payload
+        path = self._resultados_dir() / "respondents" / f"respondent_{idx+1:02d}.json"
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                artifact = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if unit == "perfil":
+            perfil_basico = artifact.get("perfil_basico")
+            return {
                 "perfil_basico": perfil_basico,
-                "usuario_nombre": nombre,
-                "perfil_generado": perfil_text,
-                "steps": artifact_steps,
+                "arquetipo": (perfil_basico or {}).get("arquetipo", "Personalizado") if isinstance(perfil_basico, dict) else "Personalizado",
+                "perfil_text": artifact.get("perfil_generado", ""),
+                "nombre": artifact.get("usuario_nombre") or f"Respondent_{idx+1}",
             }
-            self._save_json(respondent_filename, artifact, subdir="respondents")
-
-            respondents_meta.append({"respondent_id": respondent_filename, "arquetipo": perfil_basico.get("arquetipo", "Personalizado")})
-            respondents_artifacts.append(artifact)
-
-        # 3) Síntesis agregada
-        prompt_template = self.prompt_sintesis or DEFAULT_PROMPTS["sintesis"]
+        pos = next((i for i, s in enumerate(self._steps) if s["id"] == unit), None)
+        saved = artifact.get("steps") or []
+        if pos is None or pos >= len(saved) or saved[pos].get("type") != self._steps[pos].get("type"):
+            return None
+        return saved[pos]
 
-        if len(respondents_artifacts) == 1:
-            nombre_usuario = "1 respondiente"
-        else:
-            counts: Dict[str, int] = {}
-            for r in respondents_meta:
-                a = r.get("arquetipo") or "Personalizado"
-                counts[a] = counts.get(a, 0) + 1
-            mix = ", ".join(f"{k} x{v}" for k, v in counts.items())
-            nombre_usuario = f"{len(respondents_meta)} respondientes ({mix})"
-
-        base_prompt = prompt_template.format(
-            nombre_usuario=nombre_usuario,
-            nombre_producto=self.producto.get("nombre_producto", "Producto"),
-            descripcion_producto=self.producto.get("descripcion", ""),
-            investigacion_descripcion=self.investigacion_descripcion,
-            investigacion_objetivo=self.investigacion_objetivo,
-            investigacion_preguntas=self.investigacion_preguntas,
+    def _profile_unit(self, idx: int, perfil_basico: Any, total: int, is_cancelled):
+        """
+        Unidad "perfil" de un respondiente. Se usa con `yield from`.
+        Devuelve el estado que necesitan sus steps, o None si se canceló.
+        """
+        if is_cancelled():
+            return None
+        arquetipo = (perfil_basico or {}).get("arquetipo", "Personalizado") if isinstance(perfil_basico, dict) else "Personalizado"
+        resumed = self._resumed_unit(idx, "perfil")
+        yield {
+            "event": "respondent_start",
+            "i": idx + 1,
+            "n": total,
+            "arquetipo": arquetipo,
+            "message": f"Respondiente {idx+1}/{total} ({arquetipo})",
+            **({"resumed": True} if resumed else {}),
+        }
+        if self.remote:
+            done = self._done_units(idx)
+            if len(done) < 1 + len(self._steps):
+                return (yield from self._remote_respondent(idx, perfil_basico, total, is_cancelled, done))
+        if resumed:
+            return resumed
+
+        llm_client_r = self._fresh_llm_client(respondent=idx + 1)
+        usuario = SyntheticUser(perfil_basico if isinstance(perfil_basico, dict) else {})
+        perfil_raw = yield from self._llm_generate(
+            llm_client_r, usuario.build_profile_prompt(self.prompt_perfil), i=idx + 1, n=total, stage="perfil"
         )
+        perfil_det = usuario.set_generated_profile(perfil_raw)
 
-        # Crear un resumen de datos más legible (texto plano en lugar de JSON)
-        datos_texto = []
-        for r, a in zip(respondents_meta, respondents_artifacts):
-            arquetipo = r.get("arquetipo", "Personalizado")
-            nombre = a.get("usuario_nombre", "Usuario")
-            datos_texto.append(f"\n=== RESPONDIENTE: {nombre} ({arquetipo}) ===")
-            
-            for step in a.get("steps", []):
-                if step.get("type") == "cuestionario":
-                    datos_texto.append("\n--- CUESTIONARIO ---")
-                    datos_texto.append(step.get("respuestas", ""))
-                elif step.get("type") == "entrevista":
-                    datos_texto.append("\n--- ENTREVISTA ---")
-                    datos_texto.append(step.get("transcripcion", ""))
-
-        synthesis_prompt = (
-            base_prompt
-            + "\n\n" + "="*50 + "\n"
-            + "DATOS RECOPILADOS:\n"
-            + "\n".join(datos_texto)
-        )
+        # Limpiar solo tags técnicos del perfil generado
+        if perfil_det and "perfil_generado" in perfil_det:
+            perfil_det["perfil_generado"] = self._clean_output(perfil_det["perfil_generado"])
 
-        llm_client_s = self._fresh_llm_client()
-        resultado_texto = self._clean_output(llm_client_s.generate(synthesis_prompt))
-
-        # 4) Resultado final (analisis.json)
-        final_filename = "analisis.json"
-        usuario_basico: Dict[str, Any]
-        if len(respondents_artifacts) == 1:
-            usuario_basico = dict(respondents_artifacts[0].get("perfil_basico") or {})
-        else:
-            usuario_basico = {"mode": "population", "arquetipo": "Población"}
+        profile = {
+            "perfil_basico": perfil_basico,
+            "arquetipo": arquetipo,
+            "perfil_text": (perfil_det or {}).get("perfil_generado", ""),
+            "nombre": (perfil_det or {}).get("nombre") or usuario.nombre or f"Respondent_{idx+1}",
+        }
+        self.manifest.save_unit(idx + 1, "perfil", profile)
+        return profile
 
-        final = {
-            "timestamp": self._run_iso,
-            "resultado_id": self._run_ts, # Usamos el timestamp de la carpeta como ID
-            "usuario": usuario_basico,
-            "usuario_nombre": nombre_usuario,
+    def _step_unit(self, idx: int, step: Dict[str, Any], profile: Dict[str, Any], total: int, is_cancelled):
+        """
+        Unidad de un step (cuestionario / entrevista) de un respondiente. Se usa con `yield from`.
+        Cada step usa su propio LLMClient para poder ejecutarse en paralelo con los demás.
+        Devuelve el artefacto del step, o None si se canceló.
+        """
+        if is_cancelled():
+            return None
+        stype = step.get("type")
+        nombre = profile["nombre"]
+        perfil_text = profile["perfil_text"]
+        resumed = self._resumed_unit(idx, step["id"])
+        remote = (idx, step["id"]) in self._remote_units
+        flag = {"remote": True} if remote else {"resumed": True}
+        yield {
+            "event": "step_start",
+            "i": idx + 1,
+            "n": total,
+            "step_type": stype,
+            "step_id": step.get("id"),
+            "message": f"Ejecutando '{stype}' para {nombre}...",
+            **(flag if resumed else {}),
+        }
+        if resumed:
+            yield {
+                "event": "step_done",
+                "i": idx + 1,
+                "n": total,
+                "step_type": stype,
+                "step_id": step.get("id"),
+                **flag,
+                "message": f"'{stype}' {'completado en un nodo remoto' if remote else 'recuperado'} para {nombre}.",
+            }
+            return resumed
+
+        llm_client_r = self._fresh_llm_client(respondent=idx + 1)
+        result: Dict[str, Any] = {"type": stype}
+        if stype == "cuestionario":
+            questions = step.get("questions", [])
+            if not isinstance(questions, list):
+                questions = []
+            questions = [q for q in questions if isinstance(q, str) and q.strip()]
+            out = ""
+            if questions:
+                prompt = self._cuestionario_prompt(nombre, perfil_text, questions)
+                out = self._clean_output((yield from self._llm_generate(llm_client_r, prompt, i=idx + 1, n=total, stage=stype)))
+            result = {"type": "cuestionario", "questions": questions, "respuestas": out}
+
+        elif stype == "entrevista":
+            n_questions = step.get("n_questions", 6)
+            try:
+                n_i = max(1, int(n_questions))
+            except Exception:
+                n_i = 6
+            prompt = self._entrevista_prompt(nombre, perfil_text, n_questions=n_i, seed=idx + 1)
+            out = self._clean_output((yield from self._llm_generate(llm_client_r, prompt, i=idx + 1, n=total, stage=stype)))
+            result = {"type": "entrevista", "n_questions": n_i, "transcripcion": out}
+
+        self.manifest.save_unit(idx + 1, step["id"], result)
+        yield {
+            "event": "step_done",
+            "i": idx + 1,
+            "n": total,
+            "step_type": stype,
+            "step_id": step.get("id"),
+            "message": f"'{stype}' completado para {nombre}.",
+        }
+        return result
+
+    def _done_units(self, idx: int) -> Dict[str, Dict[str, Any]]:
+        """Unidades del respondiente que ya están hechas (al reanudar), por id."""
+        done: Dict[str, Dict[str, Any]] = {}
+        for uid in ["perfil"] + [s["id"] for s in self._steps]:
+            payload = self._resumed_unit(idx, uid)
+            if payload is not None:
+                done[uid] = payload
+        return done
+
+    def _remote_engine_args(self) -> Dict[str, Any]:
+        """Entradas del run que necesita un nodo para ejecutar un respondiente (sin secretos)."""
+        proto = self.llm_client
+        # Cada nodo usa su propio endpoint y sus API keys (las de su entorno)
+        llm_config = {k: v for k, v in (getattr(proto, "config", {}) or {}).items() if k not in ("api_key", "base_url")}
+        return {
             "producto": self.producto,
-            "investigacion": {
-                "descripcion": self.investigacion_descripcion,
-                "objetivo": self.investigacion_objetivo,
-                "preguntas": self.investigacion_preguntas,
-                "estilo_investigacion": self.estilo_investigacion,
-            },
-            "resultado": resultado_texto,
+            "investigacion_descripcion": self.investigacion_descripcion,
+            "investigacion_objetivo": self.investigacion_objetivo,
+            "investigacion_preguntas": self.investigacion_preguntas,
+            "estilo_investigacion": self.estilo_investigacion,
             "plan": self.plan,
-            "respondents": respondents_meta,
-            "artifacts": {
-                "plan_id": "plan.json",
-            },
+            "prompt_perfil": self.prompt_perfil,
+            "prompt_cuestionario": self.prompt_cuestionario,
+            "prompt_entrevista": self.prompt_entrevista,
+            "llm": {"provider": getattr(proto, "provider", "llama"), "config": llm_config},
         }
-        self._save_json(final_filename, final)
-        return final
 
-    def execute_stream(self, cancel_check=None):
+    def _remote_respondent(self, idx: int, perfil_basico: Any, total: int, is_cancelled,
+                           done: Dict[str, Dict[str, Any]]):
+        """
+        Modo coordinador: publica el respondiente como tarea (core/cluster.py), espera a
+        que un nodo suba sus unidades y las guarda en el manifiesto del run; sus steps
+        se recuperan después de ahí. Se usa con `yield from`.
+        Devuelve el perfil, None si se canceló; lanza RuntimeError si la tarea falló
+        (el reintento de la unidad vuelve a publicarla).
+        """
+        tasks = get_task_queue()
+        task_id = tasks.submit(self._run_ts, idx + 1, {
+            "respondent": idx + 1,
+            "total": total,
+            "perfil_basico": perfil_basico,
+            "done_units": done,
+            "engine": self._remote_engine_args(),
+        })
+        poll_s = max(0.05, float(CLUSTER_CONFIG.get("poll_s") or 0.5))
+        seen = None
+        try:
+            while True:
+                task = tasks.get(task_id)
+                if task is None:
+                    raise RuntimeError("La tarea remota ya no está en la cola")
+                if task["status"] == "done":
+                    return self._save_remote_units(idx, (task["result"] or {}).get("units") or {}, done)
+                if task["status"] == "failed":
+                    raise RuntimeError(f"Nodo {task['worker']}: {task['error']}")
+                if task["status"] == "leased":
+                    if task["lease_expires"] < time.time() and task["attempts"] >= tasks.max_attempts:
+                        raise RuntimeError(f"El nodo {task['worker']} dejó de responder ({task['attempts']} asignaciones sin resultado)")
+                    if (task["worker"], task["attempts"]) != seen:
+                        seen = (task["worker"], task["attempts"])
+                        yield {
+                            "event": "remote_task",
+                            "i": idx + 1,
+                            "n": total,
+                            "worker": task["worker"],
+                            "attempt": task["attempts"],
+                            "message": f"Respondiente {idx+1}/{total} asignado al nodo {task['worker']} (intento {task['attempts']}).",
+                        }
+                deadline = time.monotonic() + poll_s
+                while time.monotonic() < deadline:
+                    if is_cancelled():
+                        return None
+                    time.sleep(min(0.1, max(0.0, deadline - time.monotonic())))
+        finally:
+            # Consumida o cancelada: el nodo que la tuviera pierde el lease (y aborta)
+            tasks.delete(task_id)
+
+    def _save_remote_units(self, idx: int, units: Dict[str, Any], done: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Guarda en el manifiesto del run las unidades que subió un nodo. Devuelve el perfil."""
+        expected = ["perfil"] + [s["id"] for s in self._steps]
+        missing = [uid for uid in expected if not isinstance(units.get(uid) or done.get(uid), dict)]
+        if missing:
+            raise RuntimeError(f"El nodo no devolvió las unidades: {', '.join(missing)}")
+        for uid in expected:
+            if uid not in done:
+                self.manifest.save_unit(idx + 1, uid, units[uid])
+            self._remote_units.add((idx, uid))
+        return done.get("perfil") or units["perfil"]
+
+    def run_respondent(self, idx: int, perfil_basico: Any, total: int, cancel_check=None) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Ejecuta sólo las unidades (perfil y steps) del respondiente `idx` (0-based), sin
+        eventos ni artefactos del run: lo usa un nodo del modo coordinador (worker_node.py),
+        que sube el resultado. Las unidades que ya estén en el manifiesto no se repiten.
+        Devuelve {unidad: salida}, None si se canceló; lanza RuntimeError si una unidad
+        agotó los reintentos.
+        """
         def _is_cancelled() -> bool:
             try:
                 return bool(cancel_check()) if callable(cancel_check) else False
             except Exception:
                 return False
 
-        # Guardar configuraciones utilizadas
-        self._save_json("producto.json", self.producto, subdir="configs")
-        self._save_json("investigacion.json", {
-            "descripcion": self.investigacion_descripcion,
-            "objetivo": self.investigacion_objetivo,
-            "preguntas": self.investigacion_preguntas,
-        }, subdir="configs")
-        self._save_json("respondientes_config.json", {"respondents": self.respondents}, subdir="configs")
+        def _drain(gen):
+            while True:
+                try:
+                    next(gen)
+                except StopIteration as stop:
+                    return stop.value
+
+        self._cancel_check = _is_cancelled if callable(cancel_check) else None
+        self._steps = normalize_steps(self.plan.get("steps") if isinstance(self.plan, dict) else [])
+        profile = _drain(self._unit_with_retries(
+            idx, "perfil", total, _is_cancelled, lambda: self._profile_unit(idx, perfil_basico, total, _is_cancelled)
+        ))
+        units: Dict[str, Dict[str, Any]] = {}
+        for step in [None] + self._steps:
+            if step is not None:
+                res = _drain(self._unit_with_retries(
+                    idx, step["id"], total, _is_cancelled, lambda: self._step_unit(idx, step, profile, total, _is_cancelled)
+                ))
+            else:
+                res = profile
+            if res is None:
+                return None
+            if isinstance(res, _UnitFailure):
+                raise RuntimeError(f"'{res.unit}' falló tras {res.attempts} intento(s): {res.error}")
+            units[step["id"] if step is not None else "perfil"] = res
+        return units
+
+    def _finish_respondent(self, idx: int, profile: Dict[str, Any], step_results: List[Dict[str, Any]]):
+        """Guarda el artefacto del respondiente. Devuelve (meta, artifact)."""
+        respondent_filename = f"respondent_{idx+1:02d}.json"
+        artifact = {
+            "timestamp": self._run_iso,
+            "respondent_id": respondent_filename,
+            "perfil_basico": profile["perfil_basico"],
+            "usuario_nombre": profile["nombre"],
+            "perfil_generado": profile["perfil_text"],
+            "steps": [r for r in step_results if r.get("type") in ("cuestionario", "entrevista")],
+        }
+        self._save_json(respondent_filename, artifact, subdir="respondents")
+        return {"respondent_id": respondent_filename, "arquetipo": profile["arquetipo"]}, artifact
 
-        # Guardar plan
-        plan_id = "plan.json"
-        self._save_json(plan_id, {"timestamp": self._run_iso, "plan": self.plan})
-        yield {"event": "plan_saved", "plan_id": plan_id, "message": "Plan de investigación preparado."}
+    def _unit_with_retries(self, idx: int, unit: str, total: int, is_cancelled, make_gen):
+        """
+        Ejecuta una unidad (`make_gen()` crea su generador) con reintentos y backoff
+        exponencial (RESEARCH_CONFIG). Se usa con `yield from`.
+        Devuelve el valor de la unidad, None si se canceló o `_UnitFailure` si agotó los reintentos.
+        """
+        retries = max(0, int(RESEARCH_CONFIG.get("unit_retries") or 0))
+        backoff_s = float(RESEARCH_CONFIG.get("retry_backoff_s") or 0)
+        attempt = 0
+        while True:
+            try:
+                return (yield from make_gen())
+            except LLMCancelledError:
+                return None
+            except Exception as e:
+                attempt += 1
+                if attempt > retries or is_cancelled():
+                    print(f"[WARN] Unidad '{unit}' del respondiente {idx+1} falló tras {attempt} intento(s): {e}")
+                    return _UnitFailure(unit, e, attempt)
+                yield {
+                    "event": "unit_retry",
+                    "i": idx + 1,
+                    "n": total,
+                    "unit": unit,
+                    "attempt": attempt,
+                    "retries": retries,
+                    "error": str(e),
+                    "message": f"Reintentando '{unit}' del respondiente {idx+1} ({attempt}/{retries}): {e}",
+                }
+                deadline = time.monotonic() + backoff_s * (2 ** (attempt - 1))
+                while time.monotonic() < deadline:
+                    if is_cancelled():
+                        return None
+                    time.sleep(min(0.2, max(0.0, deadline - time.monotonic())))
+
+    def _respondent_failed_event(self, idx: int, total: int, failure: "_UnitFailure") -> Dict[str, Any]:
+        info = {
+            "respondent_id": f"respondent_{idx+1:02d}.json",
+            "i": idx + 1,
+            "unit": failure.unit,
+            "attempts": failure.attempts,
+            "error": str(failure.error),
+        }
+        self._failed_respondents.append(info)
+        return {
+            "event": "respondent_failed",
+            "n": total,
+            **info,
+            "message": f"Respondiente {idx+1}/{total} falló en '{failure.unit}': {failure.error}",
+        }
 
-        respondents_meta: List[Dict[str, Any]] = []
-        respondents_artifacts: List[Dict[str, Any]] = []
+    @staticmethod
+    def _respondent_done_event(idx: int, total: int, meta: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "event": "respondent_done",
+            "i": idx + 1,
+            "n": total,
+            "respondent_id": meta["respondent_id"],
+            "message": f"Respondiente {idx+1}/{total} guardado.",
+        }
 
-        steps = self.plan.get("steps") if isinstance(self.plan, dict) else []
-        if not isinstance(steps, list):
-            steps = []
+    def _run_respondents(
+        self,
+        steps: List[Dict[str, Any]],
+        total: int,
+        is_cancelled,
+        on_respondent_done: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None,
+    ):
+        """
+        Ejecuta todos los respondientes como un grafo de unidades (perfil -> steps).
 
-        total = len(self.respondents) if isinstance(self.respondents, list) else 0
-        if total <= 0:
-            total = 1
+        Cada respondiente tiene una unidad "perfil" y una por step; un step se lanza en
+        cuanto terminan las unidades de su `depends_on` (ver planner.normalize_steps),
+        así que los steps independientes corren a la vez. Las unidades se ejecutan en un
+        pool de `self.concurrency` hilos, con prioridad para los respondientes más
+        antiguos, y se admiten como mucho `self.concurrency` respondientes en curso: el
+        perfil del respondiente i+1 empieza mientras el i está en sus steps. En modo
+        coordinador el límite es CLUSTER_CONFIG["max_inflight"] (tareas remotas a la vez).
 
-        for idx, perfil_basico in enumerate(self.respondents):
-            if _is_cancelled():
-                yield {"event": "cancelled", "message": "Investigación cancelada por el usuario."}
-                return
-            arquetipo = (perfil_basico or {}).get("arquetipo", "Personalizado") if isinstance(perfil_basico, dict) else "Personalizado"
-            yield {
-                "event": "respondent_start",
-                "i": idx + 1,
-                "n": total,
-                "arquetipo": arquetipo,
-                "message": f"Respondiente {idx+1}/{total} ({arquetipo})",
-            }
+        Los eventos se reemiten en el orden de la ejecución secuencial (respondiente,
+        luego unidad en orden del plan): la unidad en cabeza sale en vivo y el resto se
+        guarda hasta que le toque.
 
-            llm_client_r = self._fresh_llm_client()
-            usuario = SyntheticUser(perfil_basico if isinstance(perfil_basico, dict) else {})
-            perfil_det = usuario.generate_profile(llm_client_r, self.prompt_perfil)
-            
-            # Limpiar solo tags técnicos del perfil generado
-            if perfil_det and "perfil_generado" in perfil_det:
-                perfil_det["perfil_generado"] = self._clean_output(perfil_det["perfil_generado"])
-                
-            perfil_text = (perfil_det or {}).get("perfil_generado", "")
-            nombre = (perfil_det or {}).get("nombre") or usuario.nombre or f"Respondent_{idx+1}"
-            
-            artifact_steps: List[Dict[str, Any]] = []
+        `on_respondent_done(meta, artifact)` se llama para cada respondiente, en orden,
+        justo antes de emitir su "respondent_done".
+
+        Se usa con `yield from`. Devuelve la lista [(meta, artifact)] en orden, o None si se canceló.
+        """
+        n = len(self.respondents)
+        # En modo coordinador cada hilo sólo espera a un nodo remoto: caben muchos más en curso
+        slots = max(1, int(CLUSTER_CONFIG.get("max_inflight") or 1)) if self.remote else self.concurrency
+        workers = min(slots, n * (1 + len(steps)))
+        results: List[Any] = []
+
+        if workers <= 1:
+            for idx, perfil_basico in enumerate(self.respondents):
+                profile = yield from self._unit_with_retries(
+                    idx, "perfil", total, is_cancelled,
+                    lambda: self._profile_unit(idx, perfil_basico, total, is_cancelled),
+                )
+                if profile is None:
+                    return None
+                if isinstance(profile, _UnitFailure):
+                    yield self._respondent_failed_event(idx, total, profile)
+                    continue
+                step_results = []
+                failure: Optional[_UnitFailure] = None
+                for step in steps:
+                    res = yield from self._unit_with_retries(
+                        idx, step["id"], total, is_cancelled,
+                        lambda: self._step_unit(idx, step, profile, total, is_cancelled),
+                    )
+                    if res is None:
+                        return None
+                    if isinstance(res, _UnitFailure):
+                        failure = res
+                        break
+                    step_results.append(res)
+                if failure is not None:
+                    yield self._respondent_failed_event(idx, total, failure)
+                    continue
+                meta, artifact = self._finish_respondent(idx, profile, step_results)
+                results.append((meta, artifact))
+                if on_respondent_done:
+                    on_respondent_done(meta, artifact)
+                yield self._respondent_done_event(idx, total, meta)
+            return results
+
+        unit_ids = ["perfil"] + [s["id"] for s in steps]
+        step_by_id = {s["id"]: s for s in steps}
+        # Orden de emisión de eventos: el de la ejecución secuencial
+        sequence = [(idx, uid) for idx in range(n) for uid in unit_ids]
+
+        events: "queue.Queue[tuple]" = queue.Queue()
+        # Para los hilos en curso si el orquestador termina antes (cancelación o error)
+        stop = threading.Event()
+
+        def _stopped() -> bool:
+            return stop.is_set() or is_cancelled()
+
+        # Los LLMClient de las unidades abortan su petición en curso también con `stop`
+        run_cancel_check = self._cancel_check
+        self._cancel_check = _stopped
+
+        profiles: Dict[int, Dict[str, Any]] = {}
+
+        def _work(idx: int, uid: str, profile: Optional[Dict[str, Any]]) -> None:
+            # `profile` se fija al lanzar la unidad: si el respondiente falla mientras tanto,
+            # `profiles[idx]` ya no existe
+            try:
+                if uid == "perfil":
+                    make = lambda: self._profile_unit(idx, self.respondents[idx], total, _stopped)
+                else:
+                    make = lambda: self._step_unit(idx, step_by_id[uid], profile, total, _stopped)
+                gen = self._unit_with_retries(idx, uid, total, _stopped, make)
+                while True:
+                    try:
+                        ev = next(gen)
+                    except StopIteration as done:
+                        events.put((idx, uid, "done", done.value))
+                        return
+                    events.put((idx, uid, "event", ev))
+            except BaseException as e:
+                events.put((idx, uid, "error", e))
+
+        done_units: Dict[int, Dict[str, Any]] = {}
+        scheduled: Dict[int, set] = {}
+        finished: Dict[int, Any] = {}
+        # Respondientes con una unidad fallida tras los reintentos: se descartan sus unidades restantes
+        failed: Dict[int, _UnitFailure] = {}
+        buffered: Dict[tuple, List[Dict[str, Any]]] = {}
+        ready: List[tuple] = []
+        in_flight = 0
+        admitted = 0
+        active = 0
+        head = 0
+
+        def _push_ready(idx: int) -> None:
+            for pos, uid in enumerate(unit_ids):
+                if uid in scheduled[idx]:
+                    continue
+                deps = step_by_id[uid]["depends_on"] if uid != "perfil" else []
+                if all(d in done_units[idx] for d in deps):
+                    scheduled[idx].add(uid)
+                    heapq.heappush(ready, (idx, pos, uid))
 
-            for step in steps:
-                if not isinstance(step, dict):
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="respondent")
+        try:
+            while head < len(sequence):
+                # Admitir respondientes y lanzar las unidades listas (primero las más antiguas)
+                while admitted < n and active < workers:
+                    done_units[admitted], scheduled[admitted] = {}, set()
+                    _push_ready(admitted)
+                    admitted += 1
+                    active += 1
+                while ready and in_flight < workers:
+                    idx, _pos, uid = heapq.heappop(ready)
+                    if idx in failed:
+                        continue
+                    executor.submit(_work, idx, uid, profiles.get(idx))
+                    in_flight += 1
+
+                try:
+                    idx, uid, kind, payload = events.get(timeout=0.5)
+                except queue.Empty:
+                    if is_cancelled():
+                        return None
                     continue
-                stype = step.get("type")
-                if not stype:
+
+                if kind == "event":
+                    if idx in failed:
+                        continue
+                    if (idx, uid) == sequence[head]:
+                        yield payload
+                    else:
+                        buffered.setdefault((idx, uid), []).append(payload)
                     continue
-                if _is_cancelled():
-                    yield {"event": "cancelled", "message": "Investigación cancelada por el usuario."}
-                    return
 
-                yield {
-                    "event": "step_start",
-                    "i": idx + 1,
-                    "n": total,
-                    "step_type": stype,
-                    "message": f"Ejecutando '{stype}' para {nombre}...",
-                }
+                in_flight -= 1
+                if kind == "error":
+                    raise payload
+                if payload is None:
+                    return None
+                if idx in failed:
+                    continue
+                if isinstance(payload, _UnitFailure):
+                    failed[idx] = payload
+                    profiles.pop(idx, None)
+                    active -= 1
+                    # Sus unidades aún no lanzadas ya no se ejecutan
+                    ready[:] = [entry for entry in ready if entry[0] != idx]
+                    heapq.heapify(ready)
+                else:
+                    done_units[idx][uid] = payload
+                    if uid == "perfil":
+                        profiles[idx] = payload
+                if idx not in failed and len(done_units[idx]) == len(unit_ids):
+                    step_results = [done_units[idx][s["id"]] for s in steps]
+                    finished[idx] = self._finish_respondent(idx, profiles.pop(idx), step_results)
+                    active -= 1
+                elif idx not in failed:
+                    _push_ready(idx)
+
+                # Avanzar la cabeza por las unidades ya terminadas, vaciando lo que tenían guardado
+                while head < len(sequence):
+                    h_idx, h_uid = sequence[head]
+                    if h_idx in failed:
+                        # Saltar el resto de unidades del respondiente fallido (emitiendo lo ya guardado)
+                        for uid_rest in unit_ids[head % len(unit_ids) + 1:]:
+                            for ev in buffered.pop((h_idx, uid_rest), []):
+                                yield ev
+                        head = (h_idx + 1) * len(unit_ids)
+                        done_units.pop(h_idx, None)
+                        yield self._respondent_failed_event(h_idx, total, failed[h_idx])
+                        if head < len(sequence):
+                            for ev in buffered.pop(sequence[head], []):
+                                yield ev
+                        continue
+                    if h_uid not in done_units.get(h_idx, {}):
+                        break
+                    head += 1
+                    if h_uid == unit_ids[-1]:
+                        done_units.pop(h_idx, None)
+                        meta, artifact = finished.pop(h_idx)
+                        results.append((meta, artifact))
+                        if on_respondent_done:
+                            on_respondent_done(meta, artifact)
+                        yield self._respondent_done_event(h_idx, total, meta)
+                    if head < len(sequence):
+                        for ev in buffered.pop(sequence[head], []):
+                            yield ev
+            return results
+        finally:
+            stop.set()
+            # Las unidades en curso (y su llamada al LLM) ven `stop` enseguida: se esperan para
+            # que nada siga escribiendo en el run una vez se da por cancelado o con error
+            executor.shutdown(wait=True, cancel_futures=True)
+            self._cancel_check = run_cancel_check
+
+    def _cancelled_event(self) -> Dict[str, Any]:
+        self.manifest.set_status("cancelled")
+        return {"event": "cancelled", "message": "Investigación cancelada por el usuario."}
+
+    @staticmethod
+    def _with_partial_synthesis(gen, running: RunningSynthesis):
+        """
+        Reemite los eventos de `gen` intercalando los "partial_synthesis" ya listos.
+        Se usa con `yield from` y devuelve el valor de retorno de `gen`.
+        """
+        try:
+            while True:
+                try:
+                    ev = next(gen)
+                except StopIteration as stop:
+                    return stop.value
+                yield ev
+                for partial in running.ready_events():
+                    yield partial
+        finally:
+            gen.close()
+
+    def execute(self, cancel_check=None) -> Dict[str, Any]:
+        """Ejecuta la investigación completa y devuelve el resultado final (sin eventos)."""
+        for ev in self.execute_stream(cancel_check=cancel_check):
+            if ev.get("event") == "done":
+                return ev["result"]
+            if ev.get("event") == "cancelled":
+                raise RuntimeError(ev.get("message") or "Investigación cancelada.")
+        raise RuntimeError("La investigación terminó sin resultado.")
 
-                if stype == "cuestionario":
-                    questions = step.get("questions", [])
-                    if not isinstance(questions, list):
-                        questions = []
-                    questions = [q for q in questions if isinstance(q, str) and q.strip()]
-                    out = ""
-                    if questions:
-                        prompt = self._cuestionario_prompt(nombre, perfil_text, questions)
-                        out = self._clean_output(llm_client_r.generate(prompt))
-                    artifact_steps.append({"type": "cuestionario", "questions": questions, "respuestas": out})
-
-                elif stype == "entrevista":
-                    n_questions = step.get("n_questions", 6)
-                    try:
-                        n_i = max(1, int(n_questions))
-                    except Exception:
-                        n_i = 6
-                    prompt = self._entrevista_prompt(nombre, perfil_text, n_questions=n_i, seed=idx + 1)
-                    out = self._clean_output(llm_client_r.generate(prompt))
-                    artifact_steps.append({"type": "entrevista", "n_questions": n_i, "transcripcion": out})
+    def execute_stream(self, cancel_check=None):
+        def _is_cancelled() -> bool:
+            try:
+                return bool(cancel_check()) if callable(cancel_check) else False
+            except Exception:
+                return False
 
-                yield {
-                    "event": "step_done",
-                    "i": idx + 1,
-                    "n": total,
-                    "step_type": stype,
-                    "message": f"'{stype}' completado para {nombre}.",
-                }
+        self._cancel_check = _is_cancelled if callable(cancel_check) else None
+        try:
+            yield from self._execute_stream(_is_cancelled)
+        except LLMCancelledError:
+            # Cancelado a mitad de una llamada de la síntesis
+            yield self._cancelled_event()
 
-            respondent_filename = f"respondent_{idx+1:02d}.json"
-            artifact = {
-                "timestamp": self._run_iso,
-                "respondent_id": respondent_filename,
-                "perfil_basico": perfil_basico,
-                "usuario_nombre": nombre,
-                "perfil_generado": perfil_text,
-                "steps": artifact_steps,
-            }
-            self._save_json(respondent_filename, artifact, subdir="respondents")
+    def _execute_stream(self, _is_cancelled: Callable[[], bool]):
+        plan_id = self._save_run_configs()
+        yield {"event": "plan_saved", "plan_id": plan_id, "message": "Plan de investigación preparado."}
+
+        # Steps con `id`/`depends_on` (los planes antiguos se completan aquí)
+        steps = normalize_steps(self.plan.get("steps") if isinstance(self.plan, dict) else [])
+        self._steps = steps
 
-            respondents_meta.append({"respondent_id": respondent_filename, "arquetipo": arquetipo})
-            respondents_artifacts.append(artifact)
+        total = len(self.respondents) if isinstance(self.respondents, list) else 0
+        if total <= 0:
+            total = 1
 
+        self.manifest.update(status="running", total_units=len(self.respondents) * (1 + len(steps)))
+        if self.resume:
             yield {
-                "event": "respondent_done",
-                "i": idx + 1,
-                "n": total,
-                "respondent_id": respondent_filename,
-                "message": f"Respondiente {idx+1}/{total} guardado.",
+                "event": "resumed",
+                "completed_units": self.manifest.completed_units(),
+                "message": f"Reanudando: {self.manifest.completed_units()} unidades ya completadas.",
             }
 
+        synthesis_context = {
+            "nombre_producto": self.producto.get("nombre_producto", "Producto"),
+            "investigacion_objetivo": self.investigacion_objetivo,
+            "investigacion_preguntas": self.investigacion_preguntas,
+        }
+        running: Optional[RunningSynthesis] = None
+        if self.incremental_synthesis:
+            running = RunningSynthesis(synthesis_context, self._synthesis_generate)
+        try:
+            if running is None:
+                results = yield from self._run_respondents(steps, total, _is_cancelled)
+            else:
+                results = yield from self._with_partial_synthesis(
+                    self._run_respondents(
+                        steps, total, _is_cancelled,
+                        on_respondent_done=lambda meta, artifact: running.add(respondent_block(meta, artifact)),
+                    ),
+                    running,
+                )
+                if results is not None:
+                    running.flush()
+                    if not (yield from running.drain(_is_cancelled)):
+                        results = None
+        finally:
+            if running is not None:
+                running.close()
+        if results is None:
+            yield self._cancelled_event()
+            return
+        if self._failed_respondents:
+            self.manifest.update(failed_respondents=self._failed_respondents)
+        if not results:
+            raise RuntimeError(
+                f"Todos los respondientes fallaron ({len(self._failed_respondents)}); no hay datos para la síntesis."
+            )
+        # La síntesis sigue con los respondientes que terminaron bien
+        respondents_meta: List[Dict[str, Any]] = [meta for meta, _ in results]
+        respondents_artifacts: List[Dict[str, Any]] = [artifact for _, artifact in results]
+
         if _is_cancelled():
-            yield {"event": "cancelled", "message": "Investigación cancelada por el usuario."}
+            yield self._cancelled_event()
             return
         
         yield {"event": "synthesis_start", "message": "Generando síntesis agregada..."}
@@ -487,30 +1067,34 @@ class MultiResearchEngine:
             investigacion_preguntas=self.investigacion_preguntas,
         )
 
-        # Crear un resumen de datos más legible (texto plano en lugar de JSON)
-        datos_texto = []
-        for r, a in zip(respondents_meta, respondents_artifacts):
-            arquetipo = r.get("arquetipo", "Personalizado")
-            nombre = a.get("usuario_nombre", "Usuario")
-            datos_texto.append(f"\n=== RESPONDIENTE: {nombre} ({arquetipo}) ===")
-            
-            for step in a.get("steps", []):
-                if step.get("type") == "cuestionario":
-                    datos_texto.append("\n--- CUESTIONARIO ---")
-                    datos_texto.append(step.get("respuestas", ""))
-                elif step.get("type") == "entrevista":
-                    datos_texto.append("\n--- ENTREVISTA ---")
-                    datos_texto.append(step.get("transcripcion", ""))
-
-        synthesis_prompt = (
-            base_prompt
-            + "\n\n" + "="*50 + "\n"
-            + "DATOS RECOPILADOS:\n"
-            + "\n".join(datos_texto)
-        )
+        header = "\n\n" + "="*50 + "\n" + "DATOS RECOPILADOS:\n"
+        if running is not None and running.complete:
+            # El informe final parte de las notas acumuladas (prompt mucho más corto)
+            datos_texto = [running.summary]
+            synthesis_stats = running.stats()
+            header = header.replace("DATOS RECOPILADOS:", f"DATOS RECOPILADOS (notas de síntesis de {running.n_included} respondientes):")
+        else:
+            # Datos en texto plano (no JSON); si no caben en el contexto se resumen por lotes (map-reduce)
+            blocks = [respondent_block(r, a) for r, a in zip(respondents_meta, respondents_artifacts)]
+            reduced = yield from reduce_to_budget(
+                blocks,
+                base_prompt + header,
+                synthesis_context,
+                self._synthesis_generate,
+                concurrency=self.concurrency,
+                is_cancelled=_is_cancelled,
+            )
+            if reduced is None:
+                yield self._cancelled_event()
+                return
+            datos_texto, synthesis_stats = reduced
+            if synthesis_stats["mode"] == "map_reduce":
+                header = header.replace("DATOS RECOPILADOS:", "DATOS RECOPILADOS (resúmenes por respondiente, fusionados por lotes):")
+
+        synthesis_prompt = base_prompt + header + "\n\n".join(datos_texto)
 
         llm_client_s = self._fresh_llm_client()
-        resultado_texto = self._clean_output(llm_client_s.generate(synthesis_prompt))
+        resultado_texto = self._clean_output((yield from self._llm_generate(llm_client_s, synthesis_prompt, stage="sintesis")))
         yield {"event": "synthesis_done", "message": "Síntesis completada."}
 
         final_filename = "analisis.json"
@@ -535,9 +1119,12 @@ class MultiResearchEngine:
             "resultado": resultado_texto,
             "plan": self.plan,
             "respondents": respondents_meta,
+            "failed_respondents": self._failed_respondents,
             "artifacts": {
                 "plan_id": "plan.json",
             },
+            "metrics": {"prompt_cache": self._prompt_cache_metrics(), "synthesis": synthesis_stats},
         }
         self._save_json(final_filename, final)
+        self.manifest.set_status("done")
         yield {"event": "done", "result": final, "message": "Investigación completada."}
@@ -10,7 +10,7 @@ Objetivo:
 from __future__ import annotations
 
 import re
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Set
 
 from core.models import ResearchPlan
 
@@ -91,6 +91,45 @@ def build_plan(descripcion: str, estilo_investigacion: str = "Entrevista", pregu
         steps.append({"type": "entrevista", "n_questions": n, "questions": questions})
         research_type = "entrevista"
 
-    plan = ResearchPlan(version=1, research_type=research_type, steps=steps)
+    plan = ResearchPlan(version=1, research_type=research_type, steps=normalize_steps(steps))
     return plan.model_dump()
 
+
+def normalize_steps(steps: Any) -> List[Dict[str, Any]]:
+    """
+    Completa el grafo de dependencias de los steps de un plan.
+
+    Cada step recibe un `id` único (por defecto su tipo) y `depends_on` (por
+    defecto sólo "perfil": los steps actuales sólo necesitan el perfil generado).
+    Se descartan dependencias desconocidas y las que formarían un ciclo, de modo
+    que el motor puede ejecutar en paralelo los steps independientes.
+    Mantiene el orden del plan. Sirve también para planes antiguos sin `id`.
+    """
+    if not isinstance(steps, list):
+        return []
+    out: List[Dict[str, Any]] = []
+    seen: Set[str] = set()
+    for step in steps:
+        if not isinstance(step, dict) or not step.get("type"):
+            continue
+        step = dict(step)
+        base = str(step.get("id") or step["type"]).strip() or str(step["type"])
+        sid, n = base, 2
+        while sid in seen or sid == "perfil":
+            sid, n = f"{base}_{n}", n + 1
+        seen.add(sid)
+        step["id"] = sid
+        deps = step.get("depends_on")
+        step["depends_on"] = [str(d) for d in deps] if isinstance(deps, list) else ["perfil"]
+        out.append(step)
+
+    # Sólo dependencias hacia steps anteriores del plan (así no puede haber ciclos)
+    earlier: Set[str] = {"perfil"}
+    for step in out:
+        deps = [d for d in step["depends_on"] if d in earlier]
+        if len(deps) != len(step["depends_on"]):
+            print(f"[WARN] Dependencias ignoradas en step '{step['id']}': {sorted(set(step['depends_on']) - set(deps))}")
+        step["depends_on"] = deps or ["perfil"]
+        earlier.add(step["id"])
+    return out
+
@@ -0,0 +1,171 @@
+"""
+Limitador de peticiones compartido por todo el proceso (token bucket).
+
+Hay un limitador por endpoint de proveedor (proveedor + scheme://host:puerto),
+común a todos los LLMClient y a todos los jobs, con dos cubos:
+- Peticiones por segundo (con ráfaga máxima `burst`)
+- Tokens por minuto (estimados a partir del tamaño de prompt y respuesta)
+
+Las esperas se calculan por reserva: se descuenta el coste bajo un lock y se
+devuelve cuánto hay que esperar, de modo que la espera (time.sleep o
+asyncio.sleep) ocurre fuera del lock y el mismo limitador sirve para hilos y
+para corrutinas. Un 429 bloquea el endpoint para todos durante el backoff.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import RATE_LIMIT_CONFIG
+from core.http_pool import _pool_key
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Estimación barata de tokens (~4 caracteres por token)."""
+    if not text:
+        return 0
+    return len(text) // 4 + 1
+
+
+class _Bucket:
+    """Cubo de tokens con reserva (el nivel puede quedar en negativo = deuda)."""
+
+    def __init__(self, rate_per_s: float, capacity: float):
+        self.rate = float(rate_per_s)
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def configure(self, rate_per_s: float, capacity: float) -> None:
+        self.rate = float(rate_per_s)
+        self.capacity = float(capacity)
+        self.level = min(self.level, self.capacity)
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, cost: float, now: float) -> float:
+        """Descuenta `cost` y devuelve los segundos a esperar hasta que esté cubierto."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        self.level -= cost
+        return 0.0 if self.level >= 0 else (-self.level / self.rate)
+
+    def charge(self, cost: float, now: float) -> None:
+        """Descuenta `cost` sin esperar (p.ej. tokens de la respuesta ya recibida)."""
+        if self.rate <= 0:
+            return
+        self._refill(now)
+        self.level -= cost
+
+
+class RateLimiter:
+    """Limitador de un endpoint: peticiones/s + tokens/min + bloqueo compartido tras 429."""
+
+    def __init__(self, rps: float = 0.0, burst: int = 1, tokens_per_min: int = 0):
+        self._lock = threading.Lock()
+        self._requests = _Bucket(0, 1)
+        self._tokens = _Bucket(0, 1)
+        self._blocked_until = 0.0
+        self.configure(rps, burst, tokens_per_min)
+        # Un limitador nuevo arranca con los cubos llenos (se permite la ráfaga inicial)
+        self._requests.level = self._requests.capacity
+        self._tokens.level = self._tokens.capacity
+
+    def configure(self, rps: float, burst: int, tokens_per_min: int) -> None:
+        with self._lock:
+            self.rps = max(0.0, float(rps or 0))
+            self.burst = max(1, int(burst or 1))
+            self.tokens_per_min = max(0, int(tokens_per_min or 0))
+            self._requests.configure(self.rps, self.burst)
+            self._tokens.configure(self.tokens_per_min / 60.0, self.tokens_per_min)
+
+    def _reserve(self, tokens: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            wait_s = max(
+                self._requests.reserve(1, now),
+                self._tokens.reserve(tokens, now),
+                self._blocked_until - now,
+            )
+        return max(0.0, wait_s)
+
+    def acquire(self, tokens: int = 0, cancel_check: Optional[Callable[[], bool]] = None) -> float:
+        """
+        Espera (bloqueante) hasta poder enviar una petición. Devuelve los segundos esperados.
+        Con `cancel_check` la espera se corta en cuanto devuelve True.
+        """
+        wait_s = self._reserve(tokens)
+        if wait_s > 0 and cancel_check is None:
+            time.sleep(wait_s)
+        elif wait_s > 0:
+            deadline = time.monotonic() + wait_s
+            while not cancel_check():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(min(0.1, remaining))
+        return wait_s
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        """Versión async de `acquire` (no bloquea el event loop)."""
+        wait_s = self._reserve(tokens)
+        if wait_s > 0:
+            await asyncio.sleep(wait_s)
+        return wait_s
+
+    def record_usage(self, tokens: int) -> None:
+        """Cuenta tokens consumidos tras la llamada (la respuesta no se conoce de antemano)."""
+        if tokens <= 0:
+            return
+        with self._lock:
+            self._tokens.charge(tokens, time.monotonic())
+
+    def penalize(self, seconds: float) -> None:
+        """Bloquea el endpoint para todos los clientes durante `seconds` (p.ej. tras un 429)."""
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + float(seconds))
+
+
+_LIMITERS_LOCK = threading.Lock()
+_LIMITERS: Dict[Tuple[str, str], RateLimiter] = {}
+
+
+def get_rate_limiter(
+    provider: str,
+    base_url: str,
+    rps: Optional[float] = None,
+    tokens_per_min: Optional[int] = None,
+    burst: Optional[int] = None,
+) -> RateLimiter:
+    """
+    Devuelve el limitador compartido del endpoint (provider, base_url).
+
+    Los límites no indicados salen de RATE_LIMIT_CONFIG[provider]. Si otro cliente
+    pide límites distintos para el mismo endpoint, se aplican los últimos.
+    """
+    key = _pool_key(provider, base_url)
+    defaults = RATE_LIMIT_CONFIG.get(key[0]) or {}
+    rps = float(rps if rps is not None else defaults.get("rps", 0) or 0)
+    tokens_per_min = int(tokens_per_min if tokens_per_min is not None else defaults.get("tokens_per_min", 0) or 0)
+    burst = int(burst if burst is not None else defaults.get("burst", RATE_LIMIT_CONFIG.get("burst", 1)) or 1)
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(key)
+        if limiter is None:
+            limiter = RateLimiter(rps=rps, burst=burst, tokens_per_min=tokens_per_min)
+            _LIMITERS[key] = limiter
+        elif (limiter.rps, limiter.burst, limiter.tokens_per_min) != (rps, max(1, burst), tokens_per_min):
+            limiter.configure(rps, burst, tokens_per_min)
+        return limiter
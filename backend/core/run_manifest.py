@@ -0,0 +1,221 @@
+"""
+Manifiesto de una ejecución de investigación (checkpoint para reanudar).
+
+Cada ejecución guarda en `storage/resultados/<run_id>/`:
+- manifest.json: estado del run y unidades completadas por respondiente
+  ("perfil" y el `id` de cada step)
+- units/respondent_XX/<unidad>.json: salida de cada unidad ya generada
+
+Al reanudar (`/api/investigacion/job/{run_id}/resume`) el motor recarga las
+unidades persistidas en lugar de volver a llamar al LLM y sólo ejecuta lo que
+falta. Las escrituras son atómicas (fichero temporal + rename) para que un
+reinicio a mitad de escritura no deje un JSON corrupto.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import STORAGE_DIR
+
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def new_run_id() -> str:
+    """Id único de un run (timestamp legible + sufijo aleatorio: dos runs en el mismo segundo no colisionan)."""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:10]}"
+
+
+def run_dir(run_id: str) -> Path:
+    return STORAGE_DIR / "resultados" / run_id
+
+
+def _write_json_atomic(path: Path, data: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_json(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else None
+    except (OSError, ValueError):
+        return None
+
+
+class RunManifest:
+    """Estado persistido de un run: unidades completadas y salidas por unidad."""
+
+    # False en DetachedManifest (no hay directorio del run en este proceso)
+    persistent = True
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.dir = run_dir(run_id)
+        self.path = self.dir / MANIFEST_FILENAME
+        self._lock = threading.Lock()
+        self.data: Dict[str, Any] = _read_json(self.path) or {
+            "run_id": run_id,
+            "created_at": datetime.now().isoformat(),
+            "status": "pending",
+            "respondents": {},
+        }
+
+    @classmethod
+    def load(cls, run_id: str) -> Optional["RunManifest"]:
+        """Manifiesto existente de `run_id`, o None si el run no tiene manifiesto."""
+        if not run_id or "/" in run_id or "\\" in run_id or run_id.startswith("."):
+            return None
+        if not (run_dir(run_id) / MANIFEST_FILENAME).exists():
+            return None
+        return cls(run_id)
+
+    def _save(self) -> None:
+        self.data["updated_at"] = datetime.now().isoformat()
+        _write_json_atomic(self.path, self.data)
+
+    def update(self, **fields: Any) -> None:
+        with self._lock:
+            self.data.update(fields)
+            self._save()
+
+    def set_status(self, status: str, message: Optional[str] = None) -> None:
+        with self._lock:
+            self.data["status"] = status
+            if message is not None:
+                self.data["message"] = message
+            else:
+                self.data.pop("message", None)
+            self._save()
+
+    @property
+    def status(self) -> str:
+        return str(self.data.get("status") or "pending")
+
+    # -------------------------
+    # Unidades
+    # -------------------------
+
+    def _unit_path(self, respondent: int, unit: str) -> Path:
+        return self.dir / "units" / f"respondent_{respondent:02d}" / f"{unit}.json"
+
+    def save_unit(self, respondent: int, unit: str, payload: Dict[str, Any]) -> None:
+        """Persiste la salida de una unidad (respondent es 1-based) y la marca como completada."""
+        _write_json_atomic(self._unit_path(respondent, unit), payload)
+        with self._lock:
+            units = self.data.setdefault("respondents", {}).setdefault(str(respondent), {})
+            units[unit] = datetime.now().isoformat()
+            self._save()
+
+    def load_unit(self, respondent: int, unit: str) -> Optional[Dict[str, Any]]:
+        """Salida persistida de una unidad completada, o None."""
+        with self._lock:
+            done = unit in (self.data.get("respondents") or {}).get(str(respondent), {})
+        if not done:
+            return None
+        return _read_json(self._unit_path(respondent, unit))
+
+    def completed_units(self) -> int:
+        with self._lock:
+            return sum(len(u) for u in (self.data.get("respondents") or {}).values())
+
+
+class DetachedManifest(RunManifest):
+    """
+    Manifiesto en memoria, sin escribir en disco. Lo usa un nodo del modo coordinador
+    (worker_node.py): las unidades que genera se suben al coordinador, que es quien
+    las guarda en el directorio del run. `units` (respondent -> {unidad: salida})
+    precarga las unidades que el run ya tenía completadas.
+    """
+
+    persistent = False
+
+    def __init__(self, run_id: str, units: Optional[Dict[int, Dict[str, Any]]] = None):
+        self.run_id = run_id
+        self.dir = run_dir(run_id)
+        self.path = self.dir / MANIFEST_FILENAME
+        self._lock = threading.Lock()
+        self.data = {
+            "run_id": run_id,
+            "created_at": datetime.now().isoformat(),
+            "status": "pending",
+            "respondents": {},
+        }
+        self._units: Dict[tuple, Dict[str, Any]] = {}
+        for respondent, by_unit in (units or {}).items():
+            for unit, payload in (by_unit or {}).items():
+                self.save_unit(int(respondent), unit, payload)
+
+    def _save(self) -> None:
+        self.data["updated_at"] = datetime.now().isoformat()
+
+    def save_unit(self, respondent: int, unit: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            self._units[(respondent, unit)] = payload
+            units = self.data.setdefault("respondents", {}).setdefault(str(respondent), {})
+            units[unit] = datetime.now().isoformat()
+
+    def load_unit(self, respondent: int, unit: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._units.get((respondent, unit))
+
+
+def load_run_inputs(run_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Entradas con las que se lanzó un run (configs/ y plan.json de su directorio),
+    para reanudarlo con exactamente los mismos datos. None si faltan.
+    """
+    d = run_dir(run_id)
+    producto = _read_json(d / "configs" / "producto.json")
+    investigacion = _read_json(d / "configs" / "investigacion.json")
+    respondientes = _read_json(d / "configs" / "respondientes_config.json")
+    plan = _read_json(d / "plan.json")
+    if producto is None or investigacion is None or respondientes is None or plan is None:
+        return None
+    respondents: List[Dict[str, Any]] = respondientes.get("respondents") or []
+    return {
+        "producto": producto,
+        "investigacion_descripcion": investigacion.get("descripcion", ""),
+        "investigacion_objetivo": investigacion.get("objetivo", ""),
+        "investigacion_preguntas": investigacion.get("preguntas", ""),
+        "estilo_investigacion": investigacion.get("estilo_investigacion"),
+        "respondents": respondents,
+        "plan": plan.get("plan") or {},
+    }
+
+
+def list_incomplete_runs(limit: int = 20) -> List[Dict[str, Any]]:
+    """Runs con manifiesto que no terminaron (los más recientes primero)."""
+    base = STORAGE_DIR / "resultados"
+    if not base.exists():
+        return []
+    out: List[Dict[str, Any]] = []
+    for path in base.glob(f"*/{MANIFEST_FILENAME}"):
+        data = _read_json(path)
+        if not data or data.get("status") == "done":
+            continue
+        out.append({
+            "run_id": path.parent.name,
+            "status": data.get("status"),
+            "message": data.get("message"),
+            "created_at": data.get("created_at"),
+            "updated_at": data.get("updated_at"),
+            "completed_units": sum(len(u) for u in (data.get("respondents") or {}).values()),
+            "total_units": data.get("total_units"),
+        })
+    out.sort(key=lambda r: r.get("updated_at") or "", reverse=True)
+    return out[:limit]
@@ -0,0 +1,344 @@
+"""
+Síntesis jerárquica (map-reduce) para poblaciones grandes.
+
+Con pocos respondientes la síntesis es un único prompt con todas las
+transcripciones (DATOS RECOPILADOS). Cuando eso no cabe en el contexto del
+modelo:
+1) Map: se resume cada respondiente por separado (prompt "sintesis_resumen")
+2) Reduce: los resúmenes se agrupan en lotes que caben en el contexto y se
+   fusionan (prompt "sintesis_fusion"), repitiendo hasta que el conjunto cabe
+   en el prompt final
+3) El informe final se genera sobre esas notas con el prompt de síntesis normal
+
+En modo incremental (`RunningSynthesis`) las notas se van actualizando por
+lotes según terminan los respondientes (eventos "partial_synthesis") y el
+informe final parte de ellas en lugar de las transcripciones completas.
+
+Los lotes se dimensionan con una estimación de tokens (~4 caracteres por
+token), así que el número de llamadas crece de forma lineal con N.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import DEFAULT_PROMPTS, SYNTHESIS_CONFIG
+from core.llm_client import LLMCancelledError
+from core.rate_limiter import estimate_tokens
+
+
+# Separador entre bloques en el prompt final y en los de fusión
+_JOIN = "\n\n"
+_MAX_REDUCE_LEVELS = 8
+
+
+def respondent_block(meta: Dict[str, Any], artifact: Dict[str, Any]) -> str:
+    """Texto plano con las aportaciones de un respondiente (formato de DATOS RECOPILADOS)."""
+    arquetipo = meta.get("arquetipo", "Personalizado")
+    nombre = artifact.get("usuario_nombre", "Usuario")
+    lines = [f"=== RESPONDIENTE: {nombre} ({arquetipo}) ==="]
+    for step in artifact.get("steps", []):
+        if step.get("type") == "cuestionario":
+            lines.append("\n--- CUESTIONARIO ---")
+            lines.append(step.get("respuestas", ""))
+        elif step.get("type") == "entrevista":
+            lines.append("\n--- ENTREVISTA ---")
+            lines.append(step.get("transcripcion", ""))
+    return "\n".join(lines)
+
+
+def input_budget(fixed_prompt: str) -> int:
+    """Tokens disponibles para datos en un prompt cuya parte fija es `fixed_prompt`."""
+    context = int(SYNTHESIS_CONFIG.get("context_tokens") or 0)
+    reserve = int(SYNTHESIS_CONFIG.get("reserve_output_tokens") or 0)
+    return max(256, context - reserve - estimate_tokens(fixed_prompt))
+
+
+def _total_tokens(blocks: List[str]) -> int:
+    return sum(estimate_tokens(b) for b in blocks) + estimate_tokens(_JOIN) * max(0, len(blocks) - 1)
+
+
+def pack_batches(blocks: List[str], budget_tokens: int) -> List[List[str]]:
+    """
+    Agrupa bloques consecutivos en lotes de como mucho `budget_tokens` (estimados).
+    Cada lote tiene al menos 2 bloques (si hay más de uno) para que la fusión reduzca.
+    """
+    batches: List[List[str]] = []
+    current: List[str] = []
+    used = 0
+    for block in blocks:
+        cost = estimate_tokens(block) + estimate_tokens(_JOIN)
+        if current and used + cost > budget_tokens and len(current) >= 2:
+            batches.append(current)
+            current, used = [], 0
+        current.append(block)
+        used += cost
+    if current:
+        if len(current) == 1 and batches:
+            batches[-1].append(current[0])
+        else:
+            batches.append(current)
+    return batches
+
+
+def _truncate_to_tokens(text: str, tokens: int) -> str:
+    max_chars = max(0, tokens) * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "\n[... recortado]"
+
+
+def _format(template_key: str, context: Dict[str, Any], datos: str, n_items: int = 1, **extra: Any) -> str:
+    return DEFAULT_PROMPTS[template_key].format(
+        nombre_producto=context.get("nombre_producto", "Producto"),
+        investigacion_objetivo=context.get("investigacion_objetivo", ""),
+        investigacion_preguntas=context.get("investigacion_preguntas", ""),
+        n_items=n_items,
+        datos=datos,
+        **extra,
+    )
+
+
+def reduce_to_budget(
+    blocks: List[str],
+    final_prompt: str,
+    context: Dict[str, Any],
+    generate: Callable[[str, str, int], str],
+    concurrency: int = 1,
+    is_cancelled: Optional[Callable[[], bool]] = None,
+):
+    """
+    Reduce los bloques de datos hasta que caben junto a `final_prompt`.
+
+    `generate(prompt, stage, max_tokens)` hace una llamada al LLM (ya limpia).
+    Se usa con `yield from`: emite eventos "synthesis_progress" y devuelve
+    (bloques, métricas), o None si se canceló.
+    """
+    mode = str(SYNTHESIS_CONFIG.get("mode") or "auto")
+    budget = input_budget(final_prompt)
+    stats: Dict[str, Any] = {
+        "mode": "single",
+        "input_tokens_est": _total_tokens(blocks),
+        "budget_tokens": budget,
+        "map_calls": 0,
+        "reduce_levels": 0,
+        "reduce_calls": 0,
+        "failed_calls": 0,
+    }
+    if mode == "single" or (mode != "map_reduce" and stats["input_tokens_est"] <= budget) or not blocks:
+        return blocks, stats
+
+    stats["mode"] = "map_reduce"
+    cancelled = is_cancelled or (lambda: False)
+    digest_tokens = int(SYNTHESIS_CONFIG.get("digest_max_tokens") or 400)
+    merge_tokens = int(SYNTHESIS_CONFIG.get("merge_max_tokens") or 900)
+
+    def _call(prompt: str, stage: str, max_tokens: int) -> str:
+        """Una llamada del map/reduce con un reintento (no se reintenta si se canceló)."""
+        try:
+            return generate(prompt, stage, max_tokens)
+        except LLMCancelledError:
+            raise
+        except Exception as e:
+            if cancelled():
+                raise
+            print(f"[WARN] Síntesis ({stage}): la llamada falló ({e}); se reintenta una vez.")
+            return generate(prompt, stage, max_tokens)
+
+    def _run(prompts: List[str], fallbacks: List[str], stage: str, max_tokens: int, phase: str, level: int):
+        """
+        Ejecuta las llamadas de una fase en paralelo; devuelve los textos en orden o None.
+        Si una llamada falla tras el reintento se usa su `fallbacks[i]` (datos recortados);
+        sólo se aborta si fallan todas.
+        """
+        out: List[Optional[str]] = [None] * len(prompts)
+        workers = max(1, min(int(concurrency or 1), len(prompts)))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="synthesis")
+        failed = 0
+        last_error: Optional[Exception] = None
+        try:
+            futures = {executor.submit(_call, p, stage, max_tokens): i for i, p in enumerate(prompts)}
+            done = 0
+            for fut in as_completed(futures):
+                i = futures[fut]
+                try:
+                    out[i] = fut.result()
+                except Exception as e:
+                    if cancelled():
+                        return None
+                    print(f"[WARN] Síntesis ({phase}): la llamada {i + 1}/{len(prompts)} falló tras el reintento ({e}); se usan los datos recortados.")
+                    out[i] = fallbacks[i]
+                    failed += 1
+                    last_error = e
+                done += 1
+                yield {
+                    "event": "synthesis_progress",
+                    "phase": phase,
+                    "level": level,
+                    "done": done,
+                    "total": len(prompts),
+                    "message": f"Síntesis ({phase}): {done}/{len(prompts)}",
+                }
+                if cancelled():
+                    return None
+        finally:
+            # Las llamadas en curso terminan (o abortan al cancelar) antes de seguir
+            executor.shutdown(wait=True, cancel_futures=True)
+        if failed == len(prompts) and last_error is not None:
+            raise last_error
+        stats["failed_calls"] += failed
+        return [t or "" for t in out]
+
+    # Map: un resumen por respondiente (recortando transcripciones que no caben ni solas)
+    digest_budget = input_budget(_format("sintesis_resumen", context, ""))
+    prompts = [_format("sintesis_resumen", context, _truncate_to_tokens(b, digest_budget)) for b in blocks]
+    # Si falla el resumen de un respondiente se usa su transcripción recortada (sin la cabecera)
+    fallbacks = [_truncate_to_tokens("\n".join(b.splitlines()[1:]), digest_tokens) for b in blocks]
+    digests = yield from _run(prompts, fallbacks, "sintesis_map", digest_tokens, "map", 0)
+    if digests is None:
+        return None
+    # Mantener la cabecera (nombre y arquetipo) para que la fusión pueda contar por arquetipo
+    items = [f"{b.splitlines()[0]}\n{d}" if b else d for b, d in zip(blocks, digests)]
+    stats["map_calls"] = len(prompts)
+
+    # Reduce: fusionar por lotes hasta que quepa en el prompt final
+    merge_budget = input_budget(_format("sintesis_fusion", context, "", n_items=99))
+    level = 0
+    while len(items) > 1 and _total_tokens(items) > budget and level < _MAX_REDUCE_LEVELS:
+        level += 1
+        batches = pack_batches(items, merge_budget)
+        prompts = [
+            _format("sintesis_fusion", context, _truncate_to_tokens(_JOIN.join(batch), merge_budget), n_items=len(batch))
+            for batch in batches
+        ]
+        fallbacks = [_truncate_to_tokens(_JOIN.join(batch), merge_tokens) for batch in batches]
+        merged = yield from _run(prompts, fallbacks, "sintesis_reduce", merge_tokens, "reduce", level)
+        if merged is None:
+            return None
+        stats["reduce_calls"] += len(prompts)
+        items = [f"=== NOTAS DEL LOTE {i + 1} ({len(batch)} resúmenes) ===\n{text}" for i, (batch, text) in enumerate(zip(batches, merged))]
+    stats["reduce_levels"] = level
+
+    if _total_tokens(items) > budget:
+        print(f"[WARN] Síntesis: los datos siguen sin caber en el contexto tras {level} niveles de fusión; se recortan.")
+        items = [_truncate_to_tokens(_JOIN.join(items), budget)]
+    return items, stats
+
+
+class RunningSynthesis:
+    """
+    Notas de síntesis acumuladas que se actualizan por lotes de respondientes.
+
+    `add` se llama al terminar cada respondiente (en orden); cada `batch_size`
+    respondientes se lanza una actualización en un único hilo de fondo, de modo
+    que las actualizaciones se encadenan (cada una parte de las notas anteriores)
+    sin frenar la ejecución de los respondientes. `ready_events` y `drain`
+    devuelven los eventos "partial_synthesis" ya terminados.
+    """
+
+    def __init__(self, context: Dict[str, Any], generate: Callable[[str, str, int], str], batch_size: Optional[int] = None):
+        self.context = context
+        self.generate = generate
+        self.batch_size = max(1, int(batch_size or SYNTHESIS_CONFIG.get("incremental_batch") or 1))
+        self.max_tokens = int(SYNTHESIS_CONFIG.get("merge_max_tokens") or 900)
+        self.summary = ""
+        self.n_included = 0
+        self.updates = 0
+        self.failed_updates = 0
+        self._pending: List[str] = []
+        self._futures: "deque[Future]" = deque()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="running-synthesis")
+
+    def add(self, block: str) -> None:
+        self._pending.append(block)
+        if len(self._pending) >= self.batch_size:
+            self._submit()
+
+    def flush(self) -> None:
+        """Lanza la actualización con los respondientes que queden pendientes."""
+        if self._pending:
+            self._submit()
+
+    def _submit(self) -> None:
+        blocks, self._pending = self._pending, []
+        self._futures.append(self._executor.submit(self._update, blocks))
+
+    def _update(self, blocks: List[str]) -> Optional[Dict[str, Any]]:
+        # Si el lote no cabe junto a las notas actuales, se aplica en varias actualizaciones
+        fixed = _format("sintesis_incremental", self.context, "", n_items=99, n_previos=self.n_included, resumen_actual="x" * (self.max_tokens * 4))
+        for batch in pack_batches(blocks, input_budget(fixed)) if len(blocks) > 1 else [blocks]:
+            prompt = _format(
+                "sintesis_incremental",
+                self.context,
+                _truncate_to_tokens(_JOIN.join(batch), input_budget(fixed)),
+                n_items=len(batch),
+                n_previos=self.n_included,
+                resumen_actual=self.summary or "(todavía no hay notas)",
+            )
+            try:
+                text = self.generate(prompt, "sintesis_incremental", self.max_tokens)
+            except LLMCancelledError:
+                return None
+            except Exception as e:
+                # Las notas se quedan como estaban: la síntesis final recurre a los datos completos
+                print(f"[WARN] Actualización de la síntesis incremental falló: {e}")
+                self.failed_updates += 1
+                return None
+            if text.strip():
+                self.summary = text.strip()
+            self.n_included += len(batch)
+            self.updates += 1
+        return {
+            "event": "partial_synthesis",
+            "n_respondents": self.n_included,
+            "text": self.summary,
+            "message": f"Síntesis parcial actualizada ({self.n_included} respondientes).",
+        }
+
+    def ready_events(self) -> List[Dict[str, Any]]:
+        """Eventos de las actualizaciones ya terminadas (en orden), sin esperar."""
+        out: List[Dict[str, Any]] = []
+        while self._futures and self._futures[0].done():
+            ev = self._futures.popleft().result()
+            if ev:
+                out.append(ev)
+        return out
+
+    def drain(self, is_cancelled: Optional[Callable[[], bool]] = None):
+        """Espera a las actualizaciones pendientes emitiendo sus eventos. Devuelve False si se canceló."""
+        while self._futures:
+            try:
+                ev = self._futures[0].result(timeout=0.5)
+            except FutureTimeoutError:
+                if is_cancelled and is_cancelled():
+                    return False
+                continue
+            self._futures.popleft()
+            if ev:
+                yield ev
+        return True
+
+    @property
+    def complete(self) -> bool:
+        """True si las notas incluyen a todos los respondientes añadidos."""
+        return bool(self.summary) and not self.failed_updates and not self._pending and not self._futures
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "incremental",
+            "batch_size": self.batch_size,
+            "updates": self.updates,
+            "failed_updates": self.failed_updates,
+            "respondents_included": self.n_included,
+            "summary_tokens_est": estimate_tokens(self.summary),
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
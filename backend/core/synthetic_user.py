@@ -44,6 +44,18 @@ class SyntheticUser:
         Returns:
             Diccionario con el perfil detallado generado
         """
+        prompt = self.build_profile_prompt(prompt_template)
+        
+        # Generar perfil usando LLM
+        respuesta = llm_client.generate(prompt, stage="perfil")
+        
+        return self.set_generated_profile(respuesta)
+
+    def build_profile_prompt(self, prompt_template: Optional[str] = None) -> str:
+        """
+        Construye el prompt de generación de perfil (sin llamar al LLM).
+        Permite que el motor gestione la llamada (p.ej. en streaming).
+        """
         prompt_template = prompt_template or DEFAULT_PROMPTS["perfil"]
         
         # Formatear el prompt con las características básicas.
@@ -63,11 +75,12 @@ class SyntheticUser:
             "experiencia_tecnologica": self.perfil_basico.get("experiencia_tecnologica", "N/A"),
             "intereses": ", ".join(self.perfil_basico.get("intereses", [])) if isinstance(self.perfil_basico.get("intereses"), list) else self.perfil_basico.get("intereses", "N/A"),
         })
-        prompt = prompt_template.format_map(format_data)
-        
-        # Generar perfil usando LLM
-        respuesta = llm_client.generate(prompt)
-        
+        return prompt_template.format_map(format_data)
+
+    def set_generated_profile(self, respuesta: str) -> Dict[str, Any]:
+        """
+        Registra el texto de perfil generado por el LLM y lo guarda en disco.
+        """
         # Nombre base para la investigación (simple y estable)
         # Si el arquetipo es uno de los predefinidos, lo usamos como etiqueta.
         arquetipo = (self.perfil_basico.get("arquetipo") or "").strip()
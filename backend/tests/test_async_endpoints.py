@@ -0,0 +1,80 @@
+"""
+Los endpoints que llaman al LLM no deben bloquear el event loop: mientras una
+generación está en curso, /health tiene que seguir respondiendo al momento.
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from api.main import app
+from core.llm_client import LLMClient
+
+
+# Duración simulada de cada llamada al LLM y latencia máxima admitida para /health
+LLM_DELAY_S = 1.0
+HEALTH_MAX_S = 0.25
+
+
+@pytest.fixture
+def slow_llm(monkeypatch):
+    """Sustituye ambas rutas de generación por un LLM lento (sin red)."""
+    async def slow_agenerate(self, prompt, *args, **kwargs):
+        await asyncio.sleep(LLM_DELAY_S)
+        return "respuesta lenta"
+
+    def slow_generate(self, prompt, *args, **kwargs):
+        # Si un handler async usara la ruta síncrona, esta espera bloquearía el event loop
+        time.sleep(LLM_DELAY_S)
+        return "respuesta lenta"
+
+    monkeypatch.setattr(LLMClient, "agenerate", slow_agenerate)
+    monkeypatch.setattr(LLMClient, "generate", slow_generate)
+
+
+async def _health_probe(client: httpx.AsyncClient, t0: float, at_s: float) -> float:
+    """Pide /health a los `at_s` segundos de `t0`; devuelve cuánto tardó respecto a ese instante."""
+    await asyncio.sleep(at_s)
+    response = await client.get("/health")
+    assert response.status_code == 200
+    # Contado desde el instante previsto: incluye lo que el event loop haya estado bloqueado
+    return time.perf_counter() - (t0 + at_s)
+
+
+async def _llm_calls_with_health_probes():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=10) as client:
+        t0 = time.perf_counter()
+        ficha = asyncio.create_task(client.post(
+            "/api/producto/generar_ficha",
+            json={
+                "producto": {"descripcion": "Un asistente de viajes", "nombre_producto": "Viajero"},
+                "system_config": {"llm_provider": "ollama"},
+            },
+        ))
+        refinar = asyncio.create_task(client.post(
+            "/api/resultados/refinar",
+            json={"text": "Texto suficientemente largo para refinar.", "llm_provider": "ollama"},
+        ))
+        # Sondeos repartidos mientras ambas generaciones están en curso
+        latencies = await asyncio.gather(*(_health_probe(client, t0, 0.1 * i) for i in range(1, 6)))
+        health_done_s = time.perf_counter() - t0
+        return await ficha, await refinar, latencies, health_done_s
+
+
+def test_health_stays_fast_while_llm_calls_are_in_flight(slow_llm):
+    ficha, refinar, latencies, health_done_s = asyncio.run(_llm_calls_with_health_probes())
+
+    assert max(latencies) < HEALTH_MAX_S, latencies
+    # Todos los sondeos terminaron mientras las generaciones seguían en curso
+    assert health_done_s < LLM_DELAY_S, health_done_s
+
+    assert ficha.status_code == 200
+    assert ficha.json()["ficha_producto"] == "respuesta lenta"
+    assert refinar.status_code == 200
+    assert refinar.json()["refined_text"] == "respuesta lenta"
@@ -0,0 +1,97 @@
+"""
+Cancelar una llamada al LLM corta su conexión HTTP al momento: el servidor ve la
+desconexión en menos de un segundo, esté evaluando el prompt (sin cabeceras aún)
+o a mitad del stream, y no queda ningún hilo por llamada esperando la respuesta.
+"""
+import json
+import select
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from core.llm_client import LLMCancelledError, LLMClient
+
+
+CANCEL_AFTER_S = 0.3
+RELEASE_MAX_S = 1.0
+
+
+class _StallingHandler(BaseHTTPRequestHandler):
+    """No termina nunca la respuesta; anota cuándo se desconecta el cliente (`mid_stream`: tras un fragmento)."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.server.mid_stream:
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            line = (json.dumps({"response": "hola", "done": False}) + "\n").encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            readable, _, _ = select.select([self.connection], [], [], 0.02)
+            if readable and self.connection.recv(1, socket.MSG_PEEK) == b"":
+                self.server.disconnected_at = time.monotonic()
+                return
+
+
+@pytest.fixture
+def stalling_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StallingHandler)
+    server.daemon_threads = True
+    server.mid_stream = False
+    server.disconnected_at = None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client_config(provider: str, base_url: str):
+    if provider == "anythingllm":
+        return {"provider": "anythingllm", "base_url": base_url, "api_key": "k", "workspace_slug": "ws", "mode": "chat"}
+    if provider == "huggingface":
+        return {"provider": "huggingface", "api_key": "k", "model": "org/modelo"}
+    return {"provider": "ollama", "base_url": base_url, "model": "modelo"}
+
+
+@pytest.mark.parametrize(
+    "provider, mid_stream",
+    [("ollama", False), ("ollama", True), ("huggingface", False), ("anythingllm", False)],
+)
+def test_cancel_closes_in_flight_request(stalling_server, monkeypatch, provider, mid_stream):
+    base_url = f"http://127.0.0.1:{stalling_server.server_address[1]}"
+    stalling_server.mid_stream = mid_stream
+    monkeypatch.setattr(LLMClient, "_huggingface_urls", staticmethod(lambda model_id: [f"{base_url}/v1/chat/completions"]))
+
+    client = LLMClient(provider="llama", config=_client_config(provider, base_url))
+    cancelled = threading.Event()
+    client.cancel_check = cancelled.is_set
+    threading.Timer(CANCEL_AFTER_S, cancelled.set).start()
+
+    start = time.monotonic()
+    with pytest.raises(LLMCancelledError):
+        for _ in client.generate_stream("hola"):
+            pass
+    assert time.monotonic() - start < CANCEL_AFTER_S + RELEASE_MAX_S
+
+    # El servidor ve cerrada la conexión: la petición no sigue abierta en segundo plano
+    deadline = time.monotonic() + RELEASE_MAX_S
+    while stalling_server.disconnected_at is None and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert stalling_server.disconnected_at is not None
+    assert stalling_server.disconnected_at - start < CANCEL_AFTER_S + RELEASE_MAX_S
+    assert not [t for t in threading.enumerate() if t.name == "llm-call"]
@@ -0,0 +1,124 @@
+"""
+Proceso worker de investigaciones (JOB_EXECUTION_MODE=worker).
+
+La API sólo registra los jobs en la cola duradera (SQLite, ver core/job_store.py)
+y sirve eventos y cancelaciones; este proceso los reclama y ejecuta. Se pueden
+lanzar varios (en la misma máquina o en otras con el mismo disco): cada job lo
+reclama un único worker y entre usuarios se reparte por turnos.
+
+    cd backend
+    python worker.py --jobs 2       # o, desde la raíz del repo: python -m backend.worker
+
+Cada worker renueva sus jobs en el registro cada JOB_LEASE_S/3 segundos. Si un
+worker muere, el primero que lo note marca sus jobs como "error" (se pueden
+reanudar con /job/{run_id}/resume).
+
+SIGTERM/SIGINT: deja de reclamar jobs, espera hasta JOB_DRAIN_TIMEOUT_S a los que
+están en ejecución y cancela los que sigan (quedan reanudables).
+"""
+import argparse
+import signal
+import sqlite3
+import threading
+import time
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+from config import JOB_CONFIG
+from api.routes import investigacion
+from core.http_pool import close_all_sessions
+from core.job_store import OWNER, close_job_store, get_job_store
+from core.llm_logger import stop_llm_logger
+
+
+def _heartbeat(stop: threading.Event, lease_s: float) -> None:
+    """Renueva los jobs en ejecución y marca los de workers muertos."""
+    store = get_job_store()
+    while not stop.wait(max(0.5, lease_s / 3)):
+        try:
+            for run_id in investigacion.running_job_ids():
+                store.update(run_id, owner=OWNER)
+            for run_id in store.reap_stale(lease_s):
+                print(f"[WARN] Job {run_id}: su worker dejó de responder; queda en error (reanudable)")
+                store.append_event(run_id, {
+                    "event": "error",
+                    "message": "El worker que ejecutaba la investigación dejó de responder. Puedes reanudarla.",
+                })
+        except sqlite3.Error as e:
+            print(f"[WARN] No se pudieron renovar los jobs en ejecución: {e}")
+
+
+def _slot(stop: threading.Event, poll_s: float) -> None:
+    """Bucle de un hueco de ejecución: reclama el siguiente job y lo ejecuta."""
+    store = get_job_store()
+    while not stop.is_set():
+        try:
+            claimed = store.claim_next(OWNER)
+        except sqlite3.Error as e:
+            print(f"[WARN] No se pudo leer la cola de jobs: {e}")
+            claimed = None
+        if claimed is None:
+            stop.wait(poll_s)
+            continue
+        run_id, payload = claimed
+        print(f"[INFO] Job {run_id} reclamado por {OWNER} ({threading.current_thread().name})")
+        try:
+            # Los que siguen en cola avanzan un puesto
+            store.refresh_queue_positions()
+        except sqlite3.Error as e:
+            print(f"[WARN] No se pudieron actualizar las posiciones en cola: {e}")
+        try:
+            investigacion.run_job(run_id, payload.get("system_config") or {}, bool(payload.get("resume")))
+        except Exception as e:
+            print(f"[WARN] Job {run_id} terminó con una excepción no controlada: {e}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Worker de investigaciones (cola duradera en SQLite)")
+    parser.add_argument("--jobs", type=int, default=int(JOB_CONFIG.get("workers") or 1),
+                        help="investigaciones a la vez en este proceso (JOB_WORKERS)")
+    parser.add_argument("--poll-interval", type=float, default=float(JOB_CONFIG.get("worker_poll_s") or 1.0),
+                        help="segundos entre consultas a la cola cuando no hay trabajo (JOB_WORKER_POLL_S)")
+    args = parser.parse_args()
+
+    if JOB_CONFIG.get("store") == "memory":
+        print("[ERROR] El worker necesita el registro compartido: JOB_STORE=sqlite")
+        sys.exit(1)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    slots = [
+        threading.Thread(target=_slot, args=(stop, max(0.05, args.poll_interval)), name=f"job-slot-{i + 1}", daemon=True)
+        for i in range(max(1, args.jobs))
+    ]
+    # El heartbeat sigue durante el apagado (los jobs en ejecución siguen vivos)
+    beat_stop = threading.Event()
+    threading.Thread(
+        target=_heartbeat, args=(beat_stop, float(JOB_CONFIG.get("lease_s") or 60)), name="job-heartbeat", daemon=True
+    ).start()
+    for t in slots:
+        t.start()
+    print(f"[INFO] Worker {OWNER} con {len(slots)} huecos esperando jobs")
+    while not stop.is_set():
+        stop.wait(1.0)
+
+    # Apagado ordenado: ya no se reclaman jobs; esperar (con tope) a los que están en ejecución
+    print("[INFO] Worker deteniéndose: esperando a los jobs en ejecución...")
+    deadline = time.monotonic() + float(JOB_CONFIG.get("drain_timeout_s") or 0)
+    for t in slots:
+        t.join(max(0.0, deadline - time.monotonic()))
+    if any(t.is_alive() for t in slots):
+        investigacion.cancel_running_jobs("El worker se está apagando: la investigación se detiene y se podrá reanudar.")
+        for t in slots:
+            t.join(5.0)
+    beat_stop.set()
+    close_job_store()
+    close_all_sessions()
+    stop_llm_logger()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Nodo worker del modo coordinador (CLUSTER_MODE=coordinator en la API).
+
+Pide tareas al coordinador por HTTP (una tarea = un respondiente de un run), las
+ejecuta con su propio LLM y sube las unidades generadas. Mientras ejecuta renueva
+el lease con heartbeats; si deja de hacerlo (el nodo muere) el coordinador
+reasigna la tarea a otro nodo. Ver core/cluster.py y api/routes/cluster.py.
+
+    cd backend
+    OLLAMA_BASE_URL=http://gpu-1:11434 python worker_node.py --coordinator http://api:8000 --slots 2
+
+Varios nodos en la misma máquina, cada uno con su servidor de inferencia:
+
+    python worker_node.py --llm-base-url http://127.0.0.1:11434
+    python worker_node.py --llm-base-url http://127.0.0.1:11435
+
+SIGTERM/SIGINT: deja de pedir tareas, espera hasta JOB_DRAIN_TIMEOUT_S a las que
+están en curso y abandona las que sigan (el coordinador las reintenta).
+"""
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import requests
+
+sys.path.append(str(Path(__file__).parent))
+from config import CLUSTER_CONFIG, JOB_CONFIG
+from core.http_pool import close_all_sessions, get_session
+from core.llm_client import LLMClient
+from core.llm_logger import stop_llm_logger
+from core.multi_research_engine import MultiResearchEngine
+from core.run_manifest import DetachedManifest
+
+
+class WorkerNode:
+    """Bucle lease -> ejecutar -> subir resultado, con `slots` respondientes a la vez."""
+
+    def __init__(self, coordinator: str, worker_id: str, slots: int = 1, poll_s: float = 2.0,
+                 llm_base_url: Optional[str] = None, token: str = ""):
+        self.coordinator = coordinator.rstrip("/")
+        self.worker_id = worker_id
+        self.slots = max(1, int(slots))
+        self.poll_s = max(0.1, float(poll_s))
+        self.llm_base_url = llm_base_url
+        self.headers = {"X-Cluster-Token": token} if token else {}
+        # `stop`: no pedir más tareas. `abort`: abandonar las que están en curso.
+        self.stop = threading.Event()
+        self.abort = threading.Event()
+
+    def _post(self, path: str, body: Dict[str, Any]) -> requests.Response:
+        session = get_session("cluster", self.coordinator)
+        return session.post(f"{self.coordinator}{path}", json=body, headers=self.headers, timeout=30)
+
+    def _lease(self) -> Optional[Dict[str, Any]]:
+        try:
+            resp = self._post("/api/cluster/lease", {"worker_id": self.worker_id})
+            resp.raise_for_status()
+            return resp.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"[WARN] No se pudo pedir tarea al coordinador {self.coordinator}: {e}")
+            return None
+
+    def _heartbeats(self, task_id: str, every_s: float, done: threading.Event, lost: threading.Event) -> None:
+        while not done.wait(every_s):
+            try:
+                resp = self._post(f"/api/cluster/tasks/{task_id}/heartbeat", {"worker_id": self.worker_id})
+            except requests.RequestException as e:
+                # Sin heartbeat el lease caduca y el coordinador reasigna la tarea
+                print(f"[WARN] Heartbeat de {task_id} falló: {e}")
+                continue
+            if resp.status_code == 409:
+                print(f"[WARN] Tarea {task_id} cancelada o reasignada: se abandona")
+                lost.set()
+                return
+
+    def _engine(self, run_id: str, payload: Dict[str, Any]) -> MultiResearchEngine:
+        args = payload.get("engine") or {}
+        llm = args.get("llm") or {}
+        llm_config = dict(llm.get("config") or {})
+        if self.llm_base_url:
+            llm_config["base_url"] = self.llm_base_url
+        return MultiResearchEngine(
+            respondents=[payload.get("perfil_basico")],
+            producto=args.get("producto") or {},
+            investigacion_descripcion=args.get("investigacion_descripcion") or "",
+            investigacion_objetivo=args.get("investigacion_objetivo"),
+            investigacion_preguntas=args.get("investigacion_preguntas"),
+            estilo_investigacion=args.get("estilo_investigacion"),
+            llm_client=LLMClient(provider=llm.get("provider") or "llama", config=llm_config),
+            plan=args.get("plan") or {},
+            prompt_perfil=args.get("prompt_perfil"),
+            prompt_cuestionario=args.get("prompt_cuestionario"),
+            prompt_entrevista=args.get("prompt_entrevista"),
+            concurrency=1,
+            run_id=run_id,
+            resume=True,
+            remote=False,
+            # Unidades ya hechas del respondiente; nada se escribe en el disco del nodo
+            manifest=DetachedManifest(run_id, {int(payload["respondent"]): payload.get("done_units") or {}}),
+        )
+
+    def _run_task(self, task: Dict[str, Any], heartbeat_s: float) -> None:
+        task_id = task["task_id"]
+        payload = task.get("payload") or {}
+        respondent = int(payload.get("respondent") or task["respondent"])
+        print(f"[INFO] Tarea {task_id} (intento {task.get('attempt')}) en {threading.current_thread().name}")
+        done, lost = threading.Event(), threading.Event()
+        hb = threading.Thread(target=self._heartbeats, args=(task_id, heartbeat_s, done, lost), daemon=True)
+        hb.start()
+        body: Dict[str, Any] = {"worker_id": self.worker_id}
+        try:
+            engine = self._engine(task["run_id"], payload)
+            units = engine.run_respondent(
+                respondent - 1,
+                payload.get("perfil_basico"),
+                int(payload.get("total") or respondent),
+                cancel_check=lambda: lost.is_set() or self.abort.is_set(),
+            )
+            if units is None:
+                if lost.is_set():
+                    return
+                body["error"] = "El nodo se detuvo antes de terminar el respondiente"
+            else:
+                body["units"] = units
+        except Exception as e:
+            print(f"[WARN] Tarea {task_id} falló: {e}")
+            body["error"] = str(e) or type(e).__name__
+        finally:
+            done.set()
+        try:
+            resp = self._post(f"/api/cluster/tasks/{task_id}/result", body)
+            if resp.status_code == 409:
+                print(f"[WARN] Resultado de {task_id} descartado: la tarea ya no era de este nodo")
+            else:
+                resp.raise_for_status()
+        except requests.RequestException as e:
+            print(f"[WARN] No se pudo subir el resultado de {task_id}: {e}")
+
+    def _slot(self) -> None:
+        while not self.stop.is_set():
+            lease = self._lease()
+            task = (lease or {}).get("task")
+            if not task:
+                self.stop.wait(self.poll_s)
+                continue
+            self._run_task(task, float(lease.get("heartbeat_s") or 10))
+
+    def run(self, drain_timeout_s: float) -> None:
+        threads = [
+            threading.Thread(target=self._slot, name=f"node-slot-{i + 1}", daemon=True)
+            for i in range(self.slots)
+        ]
+        for t in threads:
+            t.start()
+        print(f"[INFO] Nodo {self.worker_id} ({self.slots} huecos) pidiendo tareas a {self.coordinator}")
+        while not self.stop.is_set():
+            self.stop.wait(1.0)
+        deadline = time.monotonic() + max(0.0, drain_timeout_s)
+        for t in threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        if any(t.is_alive() for t in threads):
+            print("[WARN] Tareas en curso al apagar el nodo: se abandonan (el coordinador las reintenta)")
+            self.abort.set()
+            for t in threads:
+                t.join(10.0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Nodo worker del modo coordinador")
+    parser.add_argument("--coordinator", default=CLUSTER_CONFIG.get("coordinator_url"),
+                        help="URL de la API coordinadora (CLUSTER_COORDINATOR_URL)")
+    parser.add_argument("--slots", type=int, default=int(CLUSTER_CONFIG.get("node_slots") or 1),
+                        help="respondientes a la vez en este nodo (CLUSTER_NODE_SLOTS)")
+    parser.add_argument("--llm-base-url", default=None,
+                        help="endpoint del LLM de este nodo (por defecto el de su configuración, p.ej. OLLAMA_BASE_URL)")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}")
+    parser.add_argument("--poll-interval", type=float, default=2.0,
+                        help="segundos entre peticiones de tarea cuando no hay trabajo")
+    args = parser.parse_args()
+
+    node = WorkerNode(
+        args.coordinator,
+        args.worker_id,
+        slots=args.slots,
+        poll_s=args.poll_interval,
+        llm_base_url=args.llm_base_url,
+        token=str(CLUSTER_CONFIG.get("token") or ""),
+    )
+    signal.signal(signal.SIGTERM, lambda *_: node.stop.set())
+    signal.signal(signal.SIGINT, lambda *_: node.stop.set())
+    node.run(float(JOB_CONFIG.get("drain_timeout_s") or 0))
+    close_all_sessions()
+    stop_llm_logger()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import streamlit as st
 import time
+import uuid
 from sections.syntetic_users import render_usuarios_sinteticos
 from sections.product import render_producto
 from sections.research import render_investigacion
@@ -17,6 +18,8 @@ from config import (
     iniciar_investigacion_stream,
     iniciar_investigacion_job,
     obtener_job_events,
+    seguir_job_events,
+    obtener_job_result,
     cancelar_investigacion_job,
     obtener_resultados_latest,
 )
@@ -264,13 +267,24 @@ def _run_investigacion_from_sidebar(current_section: str, run_slot):
             st.session_state["system_config"] = system_cfg
 
         # 6) Start cancelable job (non-blocking)
-        run_id = iniciar_investigacion_job(system_cfg or st.session_state.get("system_config"))
+        if "client_id" not in st.session_state:
+            st.session_state["client_id"] = uuid.uuid4().hex
+        started = iniciar_investigacion_job(
+            system_cfg or st.session_state.get("system_config"),
+            client_id=st.session_state["client_id"],
+        )
+        run_id = started.get("run_id")
         if not run_id:
-            st.sidebar.error("❌ No se pudo iniciar la investigación (job).")
+            st.sidebar.error(f"❌ No se pudo iniciar la investigación: {started.get('error') or 'error desconocido'}")
             return
         st.session_state["investigacion_run_id"] = run_id
         st.session_state["investigacion_job_cursor"] = 0
-        st.session_state["investigacion_job_last_line"] = "Iniciando investigación..."
+        st.session_state.pop("investigacion_job_partial", None)
+        st.session_state.pop("investigacion_job_result", None)
+        position = int(started.get("queue_position") or 0)
+        st.session_state["investigacion_job_last_line"] = (
+            f"En cola: posición {position}" if position else "Iniciando investigación..."
+        )
         st.rerun()
 
 
@@ -289,7 +303,27 @@ def _render_job_progress(run_slot):
     events = data.get("events") if isinstance(data.get("events"), list) else []
     st.session_state["investigacion_job_cursor"] = int(data.get("cursor") or cursor)
     job_status = str(data.get("job_status") or "running")
-
+    st.session_state["investigacion_job_status"] = job_status
+    return _apply_job_events(run_slot, events, job_status)
+
+
+def _clear_job_state():
+    for key in (
+        "investigacion_run_id",
+        "investigacion_job_cursor",
+        "investigacion_job_last_line",
+        "investigacion_job_last_user_n",
+        "investigacion_job_progress_step",
+        "investigacion_job_progress_total",
+        "investigacion_job_partial",
+        "investigacion_job_result",
+        "investigacion_job_status",
+    ):
+        st.session_state.pop(key, None)
+
+
+def _apply_job_events(run_slot, events, job_status):
+    """Aplica un lote de eventos al estado del job y repinta `run_slot`. False si el job terminó."""
     # Update last line from events + recompute progress bar
     def _short(text: str, max_len: int = 80) -> str:
         t = str(text or "").strip().replace("\n", " ")
@@ -335,14 +369,14 @@ def _render_job_progress(run_slot):
             last_line = "Preparando investigación"
             progress_total = 10
             progress_step = 1
-        elif event in {"respondent_start", "profile_start", "profile_done", "step_start", "step_done", "respondent_done"}:
+        elif event in {"respondent_start", "profile_start", "profile_done", "step_start", "step_done", "respondent_done", "respondent_failed"}:
             if i_i and n_i:
                 last_user_n = n_i
                 last_line = f"Consulta usuario {i_i}/{n_i}"
                 progress_total = (2 * n_i) + 2
                 if event == "profile_done":
                     progress_step = (2 * (i_i - 1)) + 1
-                elif event == "respondent_done":
+                elif event in {"respondent_done", "respondent_failed"}:
                     progress_step = (2 * (i_i - 1)) + 2
                 elif progress_step is None:
                     progress_step = max(0, min((2 * (i_i - 1)) + 1, progress_total))
@@ -353,9 +387,18 @@ def _render_job_progress(run_slot):
                 progress_step = (2 * int(last_user_n)) + 1
         elif event == "done":
             last_line = "Completado"
+            st.session_state["investigacion_job_result"] = ev.get("result")
             if last_user_n:
                 progress_total = (2 * int(last_user_n)) + 2
                 progress_step = progress_total
+        elif event == "partial_synthesis":
+            # Hallazgos preliminares (síntesis incremental): no cambia la línea de progreso
+            st.session_state["investigacion_job_partial"] = {
+                "n": ev.get("n_respondents"),
+                "text": ev.get("text") or "",
+            }
+        elif event == "queued":
+            last_line = f"En cola: posición {ev.get('position')}"
         elif event in {"cancel_requested", "cancelled"}:
             last_line = "Cancelando…"
         elif event == "error":
@@ -379,27 +422,28 @@ def _render_job_progress(run_slot):
     bar_html = "<div class='run-bar'><div class='run-bar-fill' style='width:0%'></div></div>"
     if prog is not None:
         bar_html = "<div class='run-bar'>" + f"<div class='run-bar-fill' style='width:{prog*100:.1f}%'></div>" + "</div>"
-    run_slot.markdown(
-        f"<div class='{cls}'><div class='run-line'>{_short(last_line, 80)}</div>{bar_html}</div>",
-        unsafe_allow_html=True,
-    )
+    # Contenedor del placeholder: cada repintado sustituye al anterior (también durante el stream)
+    with run_slot.container():
+        st.markdown(
+            f"<div class='{cls}'><div class='run-line'>{_short(last_line, 80)}</div>{bar_html}</div>",
+            unsafe_allow_html=True,
+        )
+
+        partial = st.session_state.get("investigacion_job_partial")
+        if job_status == "running" and isinstance(partial, dict) and partial.get("text"):
+            with st.expander(f"Hallazgos preliminares ({partial.get('n')} respondientes)"):
+                st.markdown(partial["text"])
 
     # Handle terminal statuses
     if job_status == "done":
-        # Pull final result via last done event
-        final = None
-        for ev in reversed(events):
-            if isinstance(ev, dict) and ev.get("event") == "done":
-                final = ev.get("result")
-                break
+        # Final result from the done event (may have arrived in an earlier batch);
+        # jobs only reference it (`result_url`), so it is fetched once here
+        final = st.session_state.get("investigacion_job_result")
+        if not isinstance(final, dict):
+            final = obtener_job_result(str(st.session_state.get("investigacion_run_id") or ""))
         if isinstance(final, dict):
+            _clear_job_state()
             st.session_state["resultados_investigacion"] = final
-            st.session_state.pop("investigacion_run_id", None)
-            st.session_state.pop("investigacion_job_cursor", None)
-            st.session_state.pop("investigacion_job_last_line", None)
-            st.session_state.pop("investigacion_job_last_user_n", None)
-            st.session_state.pop("investigacion_job_progress_step", None)
-            st.session_state.pop("investigacion_job_progress_total", None)
             st.session_state["section"] = "resultados"
             try:
                 st.query_params["section"] = "resultados"
@@ -412,28 +456,44 @@ def _render_job_progress(run_slot):
 
     if job_status == "cancelled":
         st.sidebar.warning("Investigación cancelada.")
-        st.session_state.pop("investigacion_run_id", None)
-        st.session_state.pop("investigacion_job_cursor", None)
-        st.session_state.pop("investigacion_job_last_line", None)
-        st.session_state.pop("investigacion_job_last_user_n", None)
-        st.session_state.pop("investigacion_job_progress_step", None)
-        st.session_state.pop("investigacion_job_progress_total", None)
+        _clear_job_state()
         return False
 
     if job_status == "error":
         # Mostrar el error específico si está disponible
         error_detail = st.session_state.get("investigacion_job_last_line", "Error desconocido")
         st.sidebar.error(f"❌ {error_detail}")
-        st.session_state.pop("investigacion_run_id", None)
-        st.session_state.pop("investigacion_job_cursor", None)
-        st.session_state.pop("investigacion_job_last_line", None)
-        st.session_state.pop("investigacion_job_last_user_n", None)
-        st.session_state.pop("investigacion_job_progress_step", None)
-        st.session_state.pop("investigacion_job_progress_total", None)
+        _clear_job_state()
         return False
 
     return True
 
+
+def _follow_job_stream(run_slot):
+    """
+    Sigue el job por SSE hasta que termina, repintando `run_slot` sin rerun de la
+    página. Un clic (p.ej. Cancelar) interrumpe el bucle en el siguiente evento o
+    keepalive. Si el stream se corta se vuelve a consultar en un rerun.
+    """
+    run_id = str(st.session_state.get("investigacion_run_id") or "")
+    cursor = int(st.session_state.get("investigacion_job_cursor") or 0)
+    job_status = st.session_state.get("investigacion_job_status") or "running"
+    for kind, seq, data in seguir_job_events(run_id, cursor=cursor):
+        events = []
+        if kind == "event":
+            st.session_state["investigacion_job_cursor"] = seq or cursor
+            job_status = "queued" if data.get("event") == "queued" else "running"
+            events = [data]
+        elif kind == "end":
+            job_status = str(data.get("job_status") or "error")
+        # Keepalive: repintar da a Streamlit la ocasión de atender clics
+        if not _apply_job_events(run_slot, events, job_status):
+            return
+        if kind == "end":
+            break
+    time.sleep(1.0)
+    st.rerun()
+
 # ============================================
 # NAVEGACIÓN - BOTONES DE STREAMLIT
 # ============================================
@@ -491,12 +551,10 @@ st.sidebar.markdown('</div>', unsafe_allow_html=True)
 # ============================================
 # LOG DE INVESTIGACIÓN
 # ============================================
+still_running = False
 if st.session_state.get("investigacion_run_id"):
     run_slot = st.sidebar.empty()
     still_running = _render_job_progress(run_slot)
-    if still_running:
-        time.sleep(1.0)
-        st.rerun()
 
 # ============================================
 # HEADER - DISEÑO 02
@@ -538,43 +596,46 @@ st.sidebar.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Comentamos el check de estados porque es lento y bloquea la navegación.
-# Si se desea recuperar, se recomienda hacerlo de forma asíncrona o con caché mayor.
-# backend_status, llm_status = _get_statuses()
-# backend_ok = backend_status.get("status") == "connected"
-# llm_ok = llm_status.get("status") == "connected"
-# llm_model = (
-#     llm_status.get("model")
-#     or llm_status.get("provider")
-#     or llm_status.get("base_url")
-#     or "N/A"
-# )
-#
-# backend_state = "ON" if backend_ok else "OFF"
-#
-# llm_state = "ON" if llm_ok else "OFF"
-#
-# backend_pill_bg = "rgba(46, 204, 113, 0.18)" if backend_ok else "rgba(231, 76, 60, 0.16)"
-# backend_pill_border = "rgba(46, 204, 113, 0.35)" if backend_ok else "rgba(231, 76, 60, 0.32)"
-# backend_pill_text = "rgba(22, 110, 62, 0.95)" if backend_ok else "rgba(140, 32, 24, 0.95)"
-#
-# llm_pill_bg = "rgba(46, 204, 113, 0.18)" if llm_ok else "rgba(231, 76, 60, 0.16)"
-# llm_pill_border = "rgba(46, 204, 113, 0.35)" if llm_ok else "rgba(231, 76, 60, 0.32)"
-# llm_pill_text = "rgba(22, 110, 62, 0.95)" if llm_ok else "rgba(140, 32, 24, 0.95)"
-
-# st.sidebar.markdown(
-#     f"""
-#     <div class="sidebar-status">
-#       <div style="display:flex;flex-direction:row;flex-wrap:nowrap;align-items:center;justify-content:space-between;gap:12px;padding:0.65rem 0.75rem;margin:0.35rem 0;border-radius:12px;background:rgba(52, 152, 219, 0.08);border:1px solid rgba(52, 152, 219, 0.18);color:rgba(30,30,30,0.92);">
-#         <span style="font-size:0.95rem;font-weight:600;white-space:nowrap;color:rgba(30,30,30,0.92);">Backend</span>
-#         <span style="display:inline-flex;align-items:center;justify-content:center;padding:0.22rem 0.55rem;border-radius:999px;font-size:0.78rem;font-weight:700;letter-spacing:0.02em;white-space:nowrap;background:{backend_pill_bg};border:1px solid {backend_pill_border};color:{backend_pill_text};">{backend_state}</span>
-#       </div>
-
-#       <div title="{llm_model}" style="display:flex;flex-direction:row;flex-wrap:nowrap;align-items:center;justify-content:space-between;gap:12px;padding:0.65rem 0.75rem;margin:0.35rem 0;border-radius:12px;background:rgba(52, 152, 219, 0.08);border:1px solid rgba(52, 152, 219, 0.18);color:rgba(30,30,30,0.92);">
-#         <span style="font-size:0.95rem;font-weight:600;white-space:nowrap;color:rgba(30,30,30,0.92);">Modelo LLM</span>
-#         <span style="display:inline-flex;align-items:center;justify-content:center;padding:0.22rem 0.55rem;border-radius:999px;font-size:0.78rem;font-weight:700;letter-spacing:0.02em;white-space:nowrap;background:{llm_pill_bg};border:1px solid {llm_pill_border};color:{llm_pill_text};">{llm_state}</span>
-#       </div>
-#     </div>
-#     """,
-#     unsafe_allow_html=True
-# )
\ No newline at end of file
+# Estados servidos desde la caché del backend (sondeo en segundo plano): lectura instantánea.
+backend_status, llm_status = _get_statuses()
+backend_ok = backend_status.get("status") == "connected"
+llm_ok = llm_status.get("status") == "connected"
+llm_model = (
+    llm_status.get("model")
+    or llm_status.get("provider")
+    or llm_status.get("base_url")
+    or "N/A"
+)
+
+backend_state = "ON" if backend_ok else "OFF"
+
+llm_state = "ON" if llm_ok else "OFF"
+
+backend_pill_bg = "rgba(46, 204, 113, 0.18)" if backend_ok else "rgba(231, 76, 60, 0.16)"
+backend_pill_border = "rgba(46, 204, 113, 0.35)" if backend_ok else "rgba(231, 76, 60, 0.32)"
+backend_pill_text = "rgba(22, 110, 62, 0.95)" if backend_ok else "rgba(140, 32, 24, 0.95)"
+
+llm_pill_bg = "rgba(46, 204, 113, 0.18)" if llm_ok else "rgba(231, 76, 60, 0.16)"
+llm_pill_border = "rgba(46, 204, 113, 0.35)" if llm_ok else "rgba(231, 76, 60, 0.32)"
+llm_pill_text = "rgba(22, 110, 62, 0.95)" if llm_ok else "rgba(140, 32, 24, 0.95)"
+
+st.sidebar.markdown(
+    f"""
+    <div class="sidebar-status">
+      <div style="display:flex;flex-direction:row;flex-wrap:nowrap;align-items:center;justify-content:space-between;gap:12px;padding:0.65rem 0.75rem;margin:0.35rem 0;border-radius:12px;background:rgba(52, 152, 219, 0.08);border:1px solid rgba(52, 152, 219, 0.18);color:rgba(30,30,30,0.92);">
+        <span style="font-size:0.95rem;font-weight:600;white-space:nowrap;color:rgba(30,30,30,0.92);">Backend</span>
+        <span style="display:inline-flex;align-items:center;justify-content:center;padding:0.22rem 0.55rem;border-radius:999px;font-size:0.78rem;font-weight:700;letter-spacing:0.02em;white-space:nowrap;background:{backend_pill_bg};border:1px solid {backend_pill_border};color:{backend_pill_text};">{backend_state}</span>
+      </div>
+
+      <div title="{llm_model}" style="display:flex;flex-direction:row;flex-wrap:nowrap;align-items:center;justify-content:space-between;gap:12px;padding:0.65rem 0.75rem;margin:0.35rem 0;border-radius:12px;background:rgba(52, 152, 219, 0.08);border:1px solid rgba(52, 152, 219, 0.18);color:rgba(30,30,30,0.92);">
+        <span style="font-size:0.95rem;font-weight:600;white-space:nowrap;color:rgba(30,30,30,0.92);">Modelo LLM</span>
+        <span style="display:inline-flex;align-items:center;justify-content:center;padding:0.22rem 0.55rem;border-radius:999px;font-size:0.78rem;font-weight:700;letter-spacing:0.02em;white-space:nowrap;background:{llm_pill_bg};border:1px solid {llm_pill_border};color:{llm_pill_text};">{llm_state}</span>
+      </div>
+    </div>
+    """,
+    unsafe_allow_html=True
+)
+
+# Progreso en vivo del job: eventos por SSE al final del script (la página ya está pintada)
+if still_running and st.session_state.get("investigacion_run_id"):
+    _follow_job_stream(run_slot)
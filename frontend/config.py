@@ -162,23 +162,33 @@ def iniciar_investigacion_stream(system_config: Optional[Dict[str, Any]] = None)
         yield {"event": "error", "message": f"Error al iniciar investigación (stream): {e}"}
 
 
-def iniciar_investigacion_job(system_config: Optional[Dict[str, Any]] = None) -> Optional[str]:
+def iniciar_investigacion_job(system_config: Optional[Dict[str, Any]] = None,
+                              client_id: Optional[str] = None) -> Dict[str, Any]:
     """
-    Inicia una investigación como job cancelable. Devuelve run_id.
+    Inicia una investigación como job cancelable.
+    Devuelve {"run_id", "queue_position"} o {"error": "..."} (p.ej. cola llena: HTTP 429).
+    `client_id` identifica la sesión para el reparto justo de la cola del backend.
     """
     try:
         payload: Dict[str, Any] = {}
         if system_config:
             payload["system_config"] = system_config
-        resp = requests.post(API_ENDPOINTS["job_start"], json=payload, timeout=20)
+        headers = {"X-Client-Id": client_id} if client_id else None
+        resp = requests.post(API_ENDPOINTS["job_start"], json=payload, headers=headers, timeout=20)
+        if resp.status_code == 429:
+            try:
+                detail = resp.json().get("detail")
+            except Exception:
+                detail = None
+            return {"error": detail or f"Backend ocupado. Reintenta en {resp.headers.get('Retry-After', '?')} s."}
         resp.raise_for_status()
         data = resp.json()
         if isinstance(data, dict) and data.get("status") == "success":
-            return str(data.get("run_id") or "")
-        return None
+            return {"run_id": str(data.get("run_id") or ""), "queue_position": data.get("queue_position") or 0}
+        return {"error": "Respuesta inesperada del backend."}
     except Exception as e:
         print(f"Error al iniciar investigación (job): {e}")
-        return None
+        return {"error": str(e)}
 
 
 def obtener_job_events(run_id: str, cursor: int = 0) -> Optional[Dict[str, Any]]:
@@ -198,6 +208,63 @@ def obtener_job_events(run_id: str, cursor: int = 0) -> Optional[Dict[str, Any]]
         return {"status": "error", "message": f"Error al obtener eventos: {e}"}
 
 
+def obtener_job_result(run_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Recupera el resultado de un job terminado (el evento "done" sólo trae `result_url`).
+    """
+    try:
+        url = f"{API_ENDPOINTS['job_events']}/{run_id}/result"
+        resp = requests.get(url, timeout=60)
+        if resp.status_code >= 400:
+            return None
+        result = resp.json().get("result")
+        return result if isinstance(result, dict) else None
+    except Exception as e:
+        print(f"Error al obtener el resultado del job: {e}")
+        return None
+
+
+def seguir_job_events(run_id: str, cursor: int = 0, heartbeat_s: float = 1.0):
+    """
+    Sigue los eventos del job por SSE (`/job/{run_id}/stream`) desde un cursor.
+
+    Yields tuplas (tipo, seq, datos):
+      - ("event", número de evento, {"event": "...", ...})
+      - ("keepalive", None, None) cada `heartbeat_s` sin eventos
+      - al final: ("end", None, {"job_status": "...", "cursor": N})
+    Si el stream se corta o no está disponible, el generador termina sin "end".
+    """
+    try:
+        url = f"{API_ENDPOINTS['job_events']}/{run_id}/stream"
+        params = {"cursor": int(cursor or 0), "heartbeat": heartbeat_s}
+        with requests.get(url, params=params, stream=True, timeout=(5, max(30.0, heartbeat_s * 10))) as response:
+            if response.status_code >= 400:
+                print(f"Stream de eventos no disponible (HTTP {response.status_code})")
+                return
+            seq, name, data = None, None, []
+            # chunk_size=None: cada evento se entrega en cuanto llega
+            for raw in response.iter_lines(chunk_size=None, decode_unicode=True):
+                line = raw or ""
+                if line.startswith(":"):
+                    yield ("keepalive", None, None)
+                elif line.startswith("id:"):
+                    seq = int(line[3:].strip())
+                elif line.startswith("event:"):
+                    name = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif not line and data:
+                    obj = json.loads("\n".join(data))
+                    if name == "end":
+                        yield ("end", None, obj if isinstance(obj, dict) else {})
+                        return
+                    if isinstance(obj, dict):
+                        yield ("event", seq, obj)
+                    seq, name, data = None, None, []
+    except Exception as e:
+        print(f"Stream de eventos interrumpido: {e}")
+
+
 def cancelar_investigacion_job(run_id: str) -> bool:
     try:
         url = f"{API_ENDPOINTS['job_events']}/{run_id}/cancel"
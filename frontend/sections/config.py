@@ -230,10 +230,7 @@ Sé específico y realista. No inventes datos que contradigan las dimensiones pr
     
     # Prompt para cuestionarios
     st.markdown("#### Prompt: Respuesta a Cuestionarios")
-    prompt_cuestionario_default = """Eres {nombre_usuario}, con el siguiente perfil:
-{perfil_usuario}
-
-CONTEXTO DEL PRODUCTO:
+    prompt_cuestionario_default = """CONTEXTO DEL PRODUCTO:
 {descripcion_producto}
 
 SITUACIÓN DE LA INVESTIGACIÓN:
@@ -256,7 +253,11 @@ A2: [tu respuesta directa y específica]
 A3: [tu respuesta directa y específica]
 ...
 
-Recuerda: estás ESCRIBIENDO respuestas, no hablando. Sé preciso y directo."""
+Recuerda: estás ESCRIBIENDO respuestas, no hablando. Sé preciso y directo.
+
+TU PERFIL:
+Eres {nombre_usuario}, con el siguiente perfil:
+{perfil_usuario}"""
     
     prompt_cuestionario = st.text_area(
         "Prompt para responder cuestionarios estructurados",
@@ -268,10 +269,7 @@ Recuerda: estás ESCRIBIENDO respuestas, no hablando. Sé preciso y directo."""
 
     # Prompt para entrevistas
     st.markdown("#### Prompt: Simulación de Entrevistas")
-    prompt_entrevista_default = """Eres {nombre_usuario}, con el siguiente perfil:
-{perfil_usuario}
-
-CONTEXTO DEL PRODUCTO:
+    prompt_entrevista_default = """CONTEXTO DEL PRODUCTO:
 {descripcion_producto}
 
 SITUACIÓN DE LA INVESTIGACIÓN:
@@ -299,9 +297,13 @@ R2: [tu respuesta conversacional como este usuario]
 
 ...
 
-Seed para variabilidad: {seed}
+Recuerda: estás HABLANDO en una entrevista, no escribiendo. Sé natural y conversacional.
+
+TU PERFIL:
+Eres {nombre_usuario}, con el siguiente perfil:
+{perfil_usuario}
 
-Recuerda: estás HABLANDO en una entrevista, no escribiendo. Sé natural y conversacional."""
+Seed para variabilidad: {seed}"""
     
     prompt_entrevista = st.text_area(
         "Prompt para simular entrevistas conversacionales",
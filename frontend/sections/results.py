@@ -270,6 +270,13 @@ def render_resultados():
             """
             st.info(info_box)
 
+            failed = resultados.get("failed_respondents") or []
+            if failed:
+                st.warning(
+                    f"{len(failed)} respondiente(s) fallaron y no se incluyeron en la síntesis: "
+                    + ", ".join(f"#{f.get('i')} ({f.get('unit')})" for f in failed if isinstance(f, dict))
+                )
+
             # Si viene un usuario single, mostramos dimensiones en un expander
             if usuario.get("mode") != "population":
                 with st.expander("Ver detalles del usuario (Comportamiento / Necesidades / Barreras)", expanded=False):